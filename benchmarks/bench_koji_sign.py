@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Benchmarks of KojiSignRPMs phases against a fake koji hub and a synthetic RPM corpus.
+
+Each run generates a corpus (see tests/rpm_corpus.py) for every number of RPMs,
+serves it from a FakeKojiHub (see tests/fake_koji_hub.py) and times the phases of signing:
+
+* get_latest_tagged_rpms - listing the tag
+* get_rpm_sig_dict - reading cached signatures
+* find_cached
+* find_signed_rpms - looking for signed copies
+* find_signed_rpms_in_main_copies - reading headers of main copies
+* split_rpm_info_list_by_size_and_files
+* import_signed_rpms - importing signatures of RPMs signed in temp
+* sign - the whole workflow, about half of RPMs are signed already
+
+The corpus has signed copies and cached signatures of about half of RPMs
+(a fifth of them without the signed copy) and a tenth of main copies signed with another key.
+Read-only phases are repeated and the fastest run is taken.
+
+koji must be installed; only its profile is replaced to point to the fake hub.
+
+Results are written as JSON and compared to a baseline recorded on the same machine::
+
+    $ python benchmarks/bench_koji_sign.py --rpms 1000 10000 --output benchmarks/baseline.json
+    $ python benchmarks/bench_koji_sign.py --rpms 1000 10000 --baseline benchmarks/baseline.json
+
+The comparison fails (exit code 1) when a phase takes more than --threshold longer than in the baseline.
+"""
+
+
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+
+import koji  # noqa: E402
+
+from releng_sop.common import get_logger  # noqa: E402
+from releng_sop.koji_sign import KojiSignRPMs  # noqa: E402
+from tests.fake_koji_hub import FakeKojiHub, FakeRPMSign  # noqa: E402
+from tests.rpm_corpus import RPMCorpus, SIZE_DISTRIBUTIONS  # noqa: E402
+
+
+PHASES = [
+    "get_latest_tagged_rpms",
+    "get_rpm_sig_dict",
+    "find_cached",
+    "find_signed_rpms",
+    "find_signed_rpms_in_main_copies",
+    "split_rpm_info_list_by_size_and_files",
+    "import_signed_rpms",
+    "sign",
+]
+
+TAG = "bench"
+# cached signatures and signed copies
+SIGKEY = "deadbeef"
+# signed main copies
+MAIN_SIGKEY = "cafebabe"
+# signatures imported by import_signed_rpms
+IMPORT_SIGKEY = "0badc0de"
+
+
+class _KojiProfile(object):
+    """
+    Koji profile module pointing to a fake hub.
+    """
+
+    def __init__(self, hub):  # noqa: D102
+        self.config = argparse.Namespace(server=hub.url, authtype=None)
+        self.pathinfo = hub.pathinfo
+
+
+class SignBenchmark(object):
+    """
+    Time phases of signing for a synthetic tag.
+
+    :param workdir: Directory for the koji volume and temp files, removed afterwards
+    :type  workdir: str
+    :param rpms: Number of RPMs in the tag
+    :type  rpms: int
+    :param sizes: Payload size distribution, see tests.rpm_corpus.get_size_distribution()
+    :type  sizes: str="lognormal"
+    :param size: Median payload size in bytes
+    :type  size: int=4096
+    :param sparse: Create sparse RPMs
+    :type  sparse: bool=False
+    :param latency: Delay of each hub call in seconds
+    :type  latency: float=0
+    :param repeat: Number of runs of read-only phases
+    :type  repeat: int=3
+    :param seed: Seed of the corpus
+    :type  seed: int=0
+    :param logger: Custom logger
+    :type  logger: logging.Logger
+    """
+
+    def __init__(self, workdir, rpms, sizes="lognormal", size=4096, sparse=False, latency=0, repeat=3, seed=0,  # noqa: D102
+                 logger=None):
+        self.workdir = workdir
+        self.rpms = rpms
+        self.sizes = sizes
+        self.size = size
+        self.sparse = sparse
+        self.latency = latency
+        self.repeat = repeat
+        self.seed = seed
+        self.logger = logger or get_logger(self, logging.INFO)
+        self.hub = None
+        self.stages = None
+
+    def _setup(self):
+        topdir = os.path.join(self.workdir, "koji")
+        self.hub = FakeKojiHub(topdir, latency=self.latency, seed=self.seed)
+        corpus = RPMCorpus(topdir, hub=self.hub, seed=self.seed, sparse=self.sparse)
+        start = time.time()
+        rpm_info_list = corpus.generate(self.rpms, tag=TAG, sizes=self.sizes, size=self.size,
+                                        main_sigkeys={MAIN_SIGKEY: 0.1}, signed_copies={SIGKEY: 0.5})
+        # signatures cached in koji without signed copies
+        for num, rpm_info in enumerate([i for i in rpm_info_list if i["id"] in self.hub.sigs]):
+            if num % 5 == 0:
+                os.remove(self.hub.get_rpm_path(rpm_info, SIGKEY))
+        self.logger.info("Generated %s RPMs (%.1f MiB) in %.1f s"
+                         % (len(rpm_info_list), sum([i["size"] for i in rpm_info_list]) / 1024.0 ** 2, time.time() - start))
+        self.hub.start()
+
+    def _get_koji_sign(self):
+        get_profile_module = koji.get_profile_module
+        koji.get_profile_module = lambda name: _KojiProfile(self.hub)
+        try:
+            # signing logs every chunk, keep only warnings
+            return KojiSignRPMs("bench", FakeRPMSign, log_level=logging.WARNING)
+        finally:
+            koji.get_profile_module = get_profile_module
+
+    def _time(self, func, repeat=1):
+        """
+        Return (the shortest duration, result of the last run) of a function.
+        """
+        durations = []
+        for i in range(repeat):
+            start = time.time()
+            result = func()
+            durations.append(time.time() - start)
+        return min(durations), result
+
+    def _prepare_import(self, sign, rpm_info_list):
+        """
+        Sign copies of RPMs in temp for import_signed_rpms.
+        """
+        temp_dir = tempfile.mkdtemp(prefix="import_", dir=self.workdir)
+        paths = []
+        for rpm_info in rpm_info_list:
+            path = os.path.join(temp_dir, os.path.basename(sign._get_rpm_path(rpm_info, None)))
+            shutil.copyfile(sign._get_rpm_path(rpm_info, None), path)
+            paths.append(path)
+        FakeRPMSign().sign(IMPORT_SIGKEY, paths)
+        return paths
+
+    def run(self, phases=None):
+        """
+        Generate the corpus, start the hub and time phases.
+
+        :param phases: Phases to run, see PHASES; all by default
+        :type  phases: list=None
+        :return: {phase: seconds}
+        :rtype:  OrderedDict
+        """
+        phases = phases or PHASES
+        result = OrderedDict()
+        try:
+            self._setup()
+            sign = self._get_koji_sign()
+            rpm_info_list = sign.get_latest_tagged_rpms(TAG)
+            rpm_sig_dict = sign.get_rpm_sig_dict(rpm_info_list)
+            cached = sign.find_cached(rpm_info_list, rpm_sig_dict, [SIGKEY])[0]
+
+            funcs = OrderedDict([
+                ("get_latest_tagged_rpms", lambda: sign.get_latest_tagged_rpms(TAG)),
+                ("get_rpm_sig_dict", lambda: sign.get_rpm_sig_dict(rpm_info_list)),
+                ("find_cached", lambda: sign.find_cached(rpm_info_list, rpm_sig_dict, [SIGKEY])),
+                ("find_signed_rpms", lambda: sign.find_signed_rpms(cached, [SIGKEY])),
+                ("find_signed_rpms_in_main_copies", lambda: sign.find_signed_rpms_in_main_copies(rpm_info_list, [MAIN_SIGKEY])),
+                ("split_rpm_info_list_by_size_and_files", lambda: list(sign.split_rpm_info_list_by_size_and_files(rpm_info_list))),
+            ])
+            for phase in phases:
+                if phase == "find_signed_rpms_in_main_copies":
+                    # don't measure the header cache
+                    sign._get_rpm_sighdr_sigkey_cache.clear()
+                if phase in funcs:
+                    result[phase] = self._time(funcs[phase], self.repeat)[0]
+                elif phase == "import_signed_rpms":
+                    paths = self._prepare_import(sign, rpm_info_list)
+                    result[phase] = self._time(lambda: sign.import_signed_rpms(rpm_info_list, paths, IMPORT_SIGKEY,
+                                                                               rpm_sig_dict=dict(rpm_sig_dict), commit=True))[0]
+                elif phase == "sign":
+                    sign = self._get_koji_sign()
+                    result[phase] = self._time(lambda: sign.sign(rpm_info_list, [SIGKEY], commit=True))[0]
+                    self.stages = sign.metrics.to_dict()["stages"]
+                else:
+                    raise ValueError("Unknown phase: %s" % phase)
+                self.logger.info("%-40s %10.3f s" % (phase, result[phase]))
+        finally:
+            if self.hub and self.hub._server:
+                self.hub.stop()
+        return result
+
+
+def compare_results(results, baseline, threshold=0.2, min_time=0.05):
+    """
+    Find phases that got slower than in the baseline.
+
+    Phases faster than min_time in both runs are ignored, they are too noisy.
+
+    :param results: Results of run_benchmarks()
+    :type  results: dict
+    :param baseline: Results of an earlier run
+    :type  baseline: dict
+    :param threshold: Allowed slowdown, 0.2 is 20 %
+    :type  threshold: float=0.2
+    :param min_time: Shortest duration in seconds considered
+    :type  min_time: float=0.05
+    :return: [(rpms, phase, baseline seconds, seconds)]
+    :rtype:  list
+    """
+    regressions = []
+    for rpms, phases in sorted(results["results"].items(), key=lambda i: int(i[0])):
+        baseline_phases = baseline["results"].get(rpms, {})
+        for phase, duration in phases.items():
+            if phase not in baseline_phases:
+                continue
+            baseline_duration = baseline_phases[phase]
+            if max(duration, baseline_duration) < min_time:
+                continue
+            if duration > baseline_duration * (1 + threshold):
+                regressions.append((int(rpms), phase, baseline_duration, duration))
+    return regressions
+
+
+def run_benchmarks(rpms_list, phases=None, workdir=None, **kwargs):
+    """
+    Run benchmarks for several numbers of RPMs.
+
+    :param rpms_list: Numbers of RPMs
+    :type  rpms_list: list
+    :param phases: Phases to run, see PHASES; all by default
+    :type  phases: list=None
+    :param workdir: Directory for temp files, default temp directory if not set
+    :type  workdir: str=None
+    :param kwargs: Other SignBenchmark arguments
+    :return: {"created", "host", "python", "options", "results": {rpms: {phase: seconds}}, "stages": {rpms: {stage: metrics}}}
+    :rtype:  dict
+    """
+    result = OrderedDict([
+        ("created", time.time()),
+        ("host", platform.node()),
+        ("python", platform.python_version()),
+        ("options", dict(kwargs)),
+        ("results", OrderedDict()),
+        ("stages", OrderedDict()),
+    ])
+    for rpms in rpms_list:
+        temp_dir = tempfile.mkdtemp(prefix="bench_koji_sign_", dir=workdir)
+        try:
+            bench = SignBenchmark(temp_dir, rpms, **kwargs)
+            bench.logger.info("Running benchmarks with %s RPMs" % rpms)
+            # JSON keys are strings
+            result["results"][str(rpms)] = bench.run(phases)
+            result["stages"][str(rpms)] = bench.stages
+        finally:
+            shutil.rmtree(temp_dir)
+    return result
+
+
+def get_parser():
+    """
+    Construct argument parser.
+
+    :returns: ArgumentParser object with arguments set up.
+    :rtype:   argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description="Benchmark signing phases against a fake koji hub and compare them to a baseline.")
+    parser.add_argument(
+        "--rpms",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="Numbers of RPMs to run benchmarks with.",
+    )
+    parser.add_argument(
+        "--phases",
+        nargs="+",
+        choices=PHASES,
+        help="Phases to run, all by default.",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="PATH",
+        help="Write results to a JSON file, e.g. to record a baseline.",
+    )
+    parser.add_argument(
+        "--baseline",
+        metavar="PATH",
+        help="Compare results to a baseline JSON file, fail on regressions.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown against the baseline, 0.2 is 20 %%.",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.05,
+        help="Ignore phases shorter than given number of seconds.",
+    )
+    parser.add_argument(
+        "--sizes",
+        choices=SIZE_DISTRIBUTIONS,
+        default="lognormal",
+        help="Payload size distribution.",
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=4096,
+        help="Median payload size in bytes.",
+    )
+    parser.add_argument(
+        "--sparse",
+        action="store_true",
+        help="Create sparse RPMs.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0,
+        help="Delay of each hub call in seconds.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of runs of read-only phases, the fastest one is taken.",
+    )
+    parser.add_argument(
+        "--workdir",
+        help="Directory for the koji volume and temp files, default temp directory if not set.",
+    )
+    return parser
+
+
+def main():
+    """
+    Main function.
+
+    :returns: Exit code, 1 on regressions
+    :rtype:   int
+    """
+    parser = get_parser()
+    args = parser.parse_args()
+    results = run_benchmarks(args.rpms, phases=args.phases, workdir=args.workdir, sizes=args.sizes, size=args.size,
+                             sparse=args.sparse, latency=args.latency, repeat=args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+            f.write("\n")
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    regressions = compare_results(results, baseline, threshold=args.threshold, min_time=args.min_time)
+    for rpms, phase, baseline_duration, duration in regressions:
+        print("REGRESSION %8s RPMs %-40s %10.3f s -> %10.3f s" % (rpms, phase, baseline_duration, duration))
+    if regressions:
+        return 1
+    print("No regressions against %s" % args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Record traffic of SOP commands to a cassette and replay it without the services.
+
+Recorded traffic:
+
+* koji XML-RPC calls of KojiSignRPMs (a multicall is one interaction)
+* PDC REST calls of pulp commands
+* pulp-admin commands run by pulp commands
+
+A cassette is a gzip compressed file with a header and one JSON interaction per line::
+
+    {"cassette": 1, "created": 1476864000.0}
+    {"kind": "koji", "name": "listTaggedRPMS", "args": ["f24"], "kwargs": {"latest": true}, "duration": 2.1, "result": [...]}
+    {"kind": "pdc", "name": "content-delivery-repos/_", "args": [], "kwargs": {...}, "duration": 0.3, "result": [...]}
+    {"kind": "command", "name": "pulp-admin", "args": [...], "kwargs": {}, "duration": 4.2, "result": 0}
+
+On replay, a call gets the next recorded interaction of the same kind, name and arguments;
+if there's none (e.g. a signature header made again has a new timestamp),
+the next interaction of the same kind and name is used.
+Recorded durations are slept through, multiplied by ``latency``:
+1 reproduces the original latencies, 0 replays at full speed.
+
+Only the network traffic is recorded, replayed commands still read and write local files.
+Logins are neither recorded nor replayed.
+Commands are recorded in their printable form, passwords don't get into cassettes.
+"""
+
+
+from __future__ import print_function
+
+import base64
+import gzip
+import importlib
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+
+from six.moves import xmlrpc_client
+
+from .common import Error, span
+
+
+__all__ = (
+    "Cassette",
+    "CassetteError",
+    "CassetteKojiSession",
+    "CassettePDCClient",
+    "CASSETTE_MODES",
+    "get_client",
+    "check_call",
+    "add_cassette_arguments",
+    "get_cassette",
+)
+
+
+CASSETTE_MODES = ("record", "replay")
+CASSETTE_VERSION = 1
+
+
+class CassetteError(Error):
+    """
+    A call can't be replayed from a cassette.
+    """
+
+    pass
+
+
+def _encode(value):
+    """
+    Convert XML-RPC and JSON values to JSON serializable values.
+    """
+    if isinstance(value, dict):
+        return dict([(str(i), _encode(j)) for i, j in value.items()])
+    if isinstance(value, (list, tuple)):
+        return [_encode(i) for i in value]
+    if isinstance(value, xmlrpc_client.Binary):
+        return {"__binary__": base64.b64encode(value.data).decode("ascii")}
+    if isinstance(value, xmlrpc_client.DateTime):
+        return {"__datetime__": value.value}
+    if isinstance(value, bytes) and not isinstance(value, str):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    return value
+
+
+def _decode(value):
+    """
+    Convert values made by _encode() back.
+    """
+    if isinstance(value, dict):
+        if "__binary__" in value:
+            return xmlrpc_client.Binary(base64.b64decode(value["__binary__"]))
+        if "__datetime__" in value:
+            return xmlrpc_client.DateTime(value["__datetime__"])
+        if "__bytes__" in value:
+            return base64.b64decode(value["__bytes__"])
+        return dict([(i, _decode(j)) for i, j in value.items()])
+    if isinstance(value, list):
+        return [_decode(i) for i in value]
+    return value
+
+
+def _dump_error(ex):
+    """
+    Return an exception as a JSON serializable dict.
+    """
+    if isinstance(ex, xmlrpc_client.Fault):
+        # Fault doesn't keep its arguments in args
+        args = [ex.faultCode, ex.faultString]
+    else:
+        args = _encode(list(ex.args))
+    try:
+        json.dumps(args)
+    except (TypeError, ValueError):
+        args = [str(ex)]
+    return {"type": "%s.%s" % (type(ex).__module__, type(ex).__name__), "args": args, "message": str(ex)}
+
+
+def _load_error(error):
+    """
+    Return an exception recorded by _dump_error().
+    """
+    module_name, class_name = error["type"].rsplit(".", 1)
+    try:
+        cls = getattr(importlib.import_module(module_name), class_name)
+        return cls(*_decode(error["args"]))
+    except Exception:
+        return CassetteError("Recorded %s: %s" % (error["type"], error["message"]))
+
+
+class Cassette(object):
+    """
+    Record interactions to a cassette or replay them.
+
+    :param path: Path to the cassette
+    :type  path: str
+    :param mode: 'record' or 'replay', see CASSETTE_MODES
+    :type  mode: str="replay"
+    :param latency: Multiplier of recorded durations on replay, 0 replays at full speed
+    :type  latency: float=1.0
+    """
+
+    def __init__(self, path, mode="replay", latency=1.0):  # noqa: D102
+        if mode not in CASSETTE_MODES:
+            raise ValueError("Unknown cassette mode: %s" % mode)
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._file = None
+        # {(kind, name, key): deque of interactions}, {(kind, name): deque of interactions}
+        self._by_key = {}
+        self._by_name = {}
+
+        if self.recording:
+            self._file = gzip.open(self.path, "wb")
+            self._write({"cassette": CASSETTE_VERSION, "created": time.time()})
+        else:
+            self._read()
+
+    @property
+    def recording(self):
+        """
+        True when recording, False when replaying.
+        """
+        return self.mode == "record"
+
+    def _write(self, data):
+        line = json.dumps(data, sort_keys=True) + "\n"
+        with self._lock:
+            self._file.write(line.encode("utf-8"))
+
+    def _read(self):
+        with gzip.open(self.path, "rb") as f:
+            lines = f.read().decode("utf-8").splitlines()
+        if not lines or json.loads(lines[0]).get("cassette") != CASSETTE_VERSION:
+            raise CassetteError("Not a cassette: %s" % self.path)
+        for line in lines[1:]:
+            interaction = json.loads(line)
+            interaction["used"] = False
+            key = self._get_key(interaction["kind"], interaction["name"], interaction["args"], interaction["kwargs"])
+            self._by_key.setdefault(key, deque()).append(interaction)
+            self._by_name.setdefault(key[:2], deque()).append(interaction)
+
+    def _get_key(self, kind, name, args, kwargs):
+        return kind, name, json.dumps([args, kwargs], sort_keys=True)
+
+    def _pop(self, queue):
+        while queue:
+            interaction = queue.popleft()
+            if not interaction["used"]:
+                interaction["used"] = True
+                return interaction
+        return None
+
+    def call(self, kind, name, func, args=(), kwargs=None):
+        """
+        Call func and record the interaction, or replay it.
+
+        :param kind: 'koji', 'pdc' or 'command'
+        :type  kind: str
+        :param name: Method name
+        :type  name: str
+        :param func: Function making the call, not called on replay
+        :type  func: function
+        :param args: Call arguments identifying the interaction
+        :type  args: list
+        :param kwargs: Call keyword arguments identifying the interaction
+        :type  kwargs: dict=None
+        :return: Result of func
+        """
+        args = _encode(list(args))
+        kwargs = _encode(kwargs or {})
+        if self.recording:
+            interaction = {"kind": kind, "name": name, "args": args, "kwargs": kwargs}
+            start = time.time()
+            try:
+                result = func()
+            except Exception as ex:
+                interaction["duration"] = time.time() - start
+                interaction["error"] = _dump_error(ex)
+                self._write(interaction)
+                raise
+            interaction["duration"] = time.time() - start
+            interaction["result"] = _encode(result)
+            self._write(interaction)
+            return result
+
+        key = self._get_key(kind, name, args, kwargs)
+        with self._lock:
+            interaction = self._pop(self._by_key.get(key, deque())) or self._pop(self._by_name.get(key[:2], deque()))
+        if interaction is None:
+            raise CassetteError("No recorded interaction for %s call %s in %s" % (kind, name, self.path))
+        if self.latency:
+            time.sleep(interaction["duration"] * self.latency)
+        if "error" in interaction:
+            raise _load_error(interaction["error"])
+        return _decode(interaction["result"])
+
+    def close(self):
+        """
+        Finish recording.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CassetteKojiSession(object):
+    """
+    Koji session recording calls to a cassette or replaying them.
+
+    :param session: Koji session, None on replay
+    :type  session: koji.ClientSession
+    :param cassette: Cassette
+    :type  cassette: Cassette
+    """
+
+    def __init__(self, session, cassette):  # noqa: D102
+        self._session = session
+        self._cassette = cassette
+        self._calls = []
+        self.multicall = False
+
+    def krb_login(self, *args, **kwargs):  # noqa: D102
+        if self._session is None:
+            return True
+        return self._session.krb_login(*args, **kwargs)
+
+    def multiCall(self, strict=False):  # noqa: D102
+        self.multicall = False
+        calls, self._calls = self._calls, []
+
+        def _call():
+            self._session.multicall = True
+            for name, args, kwargs in calls:
+                getattr(self._session, name)(*args, **kwargs)
+            return self._session.multiCall(strict=strict)
+
+        return self._cassette.call("koji", "multiCall", _call, [[list(i) for i in calls]], {"strict": strict})
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def _method(*args, **kwargs):
+            if self.multicall:
+                self._calls.append((name, args, kwargs))
+                return None
+            return self._cassette.call("koji", name, lambda: getattr(self._session, name)(*args, **kwargs), args, kwargs)
+        return _method
+
+
+class CassettePDCClient(object):
+    """
+    PDC client recording calls to a cassette or replaying them.
+
+    Resources are accessed the same way as with pdc_client.PDCClient,
+    e.g. ``client["content-delivery-repos"]._(page_size=0)``.
+
+    :param client: PDC client, None on replay
+    :type  client: pdc_client.PDCClient
+    :param cassette: Cassette
+    :type  cassette: Cassette
+    """
+
+    def __init__(self, client, cassette, path=()):  # noqa: D102
+        self._client = client
+        self._cassette = cassette
+        self._path = path
+
+    def __getitem__(self, name):
+        client = self._client[name] if self._client is not None else None
+        return CassettePDCClient(client, self._cassette, self._path + (str(name), ))
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        client = getattr(self._client, name) if self._client is not None else None
+        return CassettePDCClient(client, self._cassette, self._path + (name, ))
+
+    def __call__(self, *args, **kwargs):
+        """
+        Call the resource, the call is recorded or replayed under its path, e.g. 'content-delivery-repos/_'.
+        """
+        return self._cassette.call("pdc", "/".join(self._path), lambda: self._client(*args, **kwargs), args, kwargs)
+
+
+def get_client(cassette, kind, factory):
+    """
+    Return a client recording to a cassette or replaying it.
+
+    :param cassette: Cassette, factory() is returned if not set
+    :type  cassette: Cassette
+    :param kind: 'koji' or 'pdc'
+    :type  kind: str
+    :param factory: Function returning a new client, not called on replay
+    :type  factory: function
+    :return: Client
+    """
+    if cassette is None:
+        return factory()
+    client = factory() if cassette.recording else None
+    if kind == "koji":
+        return CassetteKojiSession(client, cassette)
+    if kind == "pdc":
+        return CassettePDCClient(client, cassette)
+    raise ValueError("Unknown client kind: %s" % kind)
+
+
+def check_call(cassette, cmd, printable_cmd=None):
+    """
+    Run a command and raise CalledProcessError if it fails, record it to a cassette or replay it.
+
+    :param cassette: Cassette, the command is just run if not set
+    :type  cassette: Cassette
+    :param cmd: Command to run
+    :type  cmd: list
+    :param printable_cmd: Command recorded instead of cmd, without passwords
+    :type  printable_cmd: list=None
+    :return: Exit code
+    :rtype:  int
+    """
+    printable_cmd = printable_cmd or cmd
+    with span(os.path.basename(printable_cmd[0]), "subprocess", cmd=printable_cmd):
+        if cassette is None:
+            return _check_call(cmd, printable_cmd)
+        return cassette.call("command", printable_cmd[0], lambda: _check_call(cmd, printable_cmd), printable_cmd)
+
+
+def _check_call(cmd, printable_cmd):
+    """
+    Run a command, the CalledProcessError raised on failure holds printable_cmd instead of cmd.
+
+    The error is recorded to cassettes and traces, it must not contain passwords.
+    """
+    try:
+        return subprocess.check_call(cmd)
+    except subprocess.CalledProcessError as ex:
+        returncode = ex.returncode
+    # raised outside of the except block, so the original error isn't chained to it
+    raise subprocess.CalledProcessError(returncode, printable_cmd)
+
+
+def add_cassette_arguments(parser):
+    """
+    Add --record, --replay and --replay-latency arguments to a parser.
+
+    :param parser: Argument parser
+    :type  parser: argparse.ArgumentParser
+    """
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--record",
+        metavar="CASSETTE",
+        help="Record koji, PDC and pulp-admin traffic to a cassette.",
+    )
+    group.add_argument(
+        "--replay",
+        metavar="CASSETTE",
+        help="Replay koji, PDC and pulp-admin traffic from a cassette instead of calling the services.",
+    )
+    parser.add_argument(
+        "--replay-latency",
+        type=float,
+        default=1.0,
+        help="Multiplier of recorded latencies on replay; 0 replays at full speed.",
+    )
+
+
+def get_cassette(args):
+    """
+    Return Cassette according to arguments added by add_cassette_arguments().
+
+    :param args: Parsed arguments
+    :type  args: argparse.Namespace
+    :return: Cassette or None if neither recording nor replaying
+    :rtype:  Cassette
+    """
+    if args.record:
+        return Cassette(args.record, mode="record")
+    if args.replay:
+        return Cassette(args.replay, mode="replay", latency=args.replay_latency)
+    return None
@@ -6,6 +6,11 @@ import os
 import json
 import logging
 import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 
 import xdg.BaseDirectory
 
@@ -17,6 +22,11 @@ __all__ = (
     "Error",
     "ConfigError",
     "UsageError",
+    "Tracer",
+    "span",
+    "trace",
+    "get_tracer",
+    "add_trace_arguments",
 )
 
 
@@ -47,9 +57,11 @@ class ConfigBase(object):
 
     def __init__(self, name, config_dirs=None):
         self.name = name
-        self._set_config_dirs(config_dirs)
-        self._set_config_path()
-        self._read_config()
+        with span("%s/%s" % (self.config_subdir, name), "config") as span_args:
+            self._set_config_dirs(config_dirs)
+            self._set_config_path()
+            span_args["path"] = self.config_path
+            self._read_config()
 
     def _set_config_dirs(self, config_dirs=None):
         """
@@ -126,11 +138,13 @@ class CommandBase(object):
 
     def run(self, commit=False):
         """Print command details, get command and run it."""
-        details = self.details(commit=commit)
-        print(details)
-        cmd = self.get_cmd(commit=commit)
-        print(cmd)
-        subprocess.check_output(cmd)
+        with span("%s.run" % type(self).__name__, "command", commit=commit):
+            details = self.details(commit=commit)
+            print(details)
+            cmd = self.get_cmd(commit=commit)
+            print(cmd)
+            with span(os.path.basename(cmd[0]), "subprocess", cmd=cmd):
+                subprocess.check_output(cmd)
 
 
 def get_logger(obj, log_level):
@@ -143,3 +157,166 @@ def get_logger(obj, log_level):
     handler.setLevel(log_level)
     logger.addHandler(handler)
     return logger
+
+
+class Tracer(object):
+    """
+    Record nested spans of a command and export them as a Chrome trace.
+
+    Spans are complete events (``"ph": "X"``) with timestamps in microseconds since the tracer started;
+    spans of a thread nest by time, so the trace shows one timeline per thread
+    in chrome://tracing or https://ui.perfetto.dev without any collector.
+
+    :param name: Process name shown in the trace
+    :type  name: str=None
+    """
+
+    def __init__(self, name=None):  # noqa: D102
+        self.name = name or os.path.basename(sys.argv[0])
+        self.start_time = time.time()
+        self.events = []
+        self.threads = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, category="releng_sop", **args):
+        """
+        Record a span.
+
+        :param name: Span name
+        :type  name: str
+        :param category: Span category, e.g. config, pdc, koji, subprocess
+        :type  category: str="releng_sop"
+        :param args: Values shown with the span; 'error' is set to the exception type and message if the block raises,
+                     exceptions must not carry passwords (see releng_sop.cassette.check_call)
+        :return: Context manager yielding the args dict, values can be added while the span runs
+        :rtype:  contextmanager
+        """
+        thread = threading.current_thread()
+        start = time.time()
+        try:
+            yield args
+        except Exception as ex:
+            args["error"] = "%s: %s" % (type(ex).__name__, ex)
+            raise
+        finally:
+            end = time.time()
+            event = OrderedDict([
+                ("name", name),
+                ("cat", category),
+                ("ph", "X"),
+                ("ts", round((start - self.start_time) * 1e6, 3)),
+                ("dur", round((end - start) * 1e6, 3)),
+                ("pid", os.getpid()),
+                ("tid", thread.ident),
+                ("args", args),
+            ])
+            with self._lock:
+                self.events.append(event)
+                self.threads.setdefault(thread.ident, thread.name)
+
+    def to_dict(self):
+        """
+        Return the trace in Chrome trace event format.
+
+        :return: {"traceEvents": [...], "displayTimeUnit": "ms", "otherData": {...}}
+        :rtype:  OrderedDict
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = [OrderedDict([("name", "process_name"), ("ph", "M"), ("pid", pid), ("args", {"name": self.name})])]
+            for tid, thread_name in self.threads.items():
+                events.append(OrderedDict([("name", "thread_name"), ("ph", "M"), ("pid", pid), ("tid", tid),
+                                           ("args", {"name": thread_name})]))
+            events += sorted(self.events, key=lambda i: i["ts"])
+        return OrderedDict([
+            ("traceEvents", events),
+            ("displayTimeUnit", "ms"),
+            ("otherData", {"start_time": self.start_time}),
+        ])
+
+    def write(self, path):
+        """
+        Write the trace to a JSON file.
+
+        :param path: Path to the file
+        :type  path: str
+        """
+        with open(path, "w") as f:
+            # values of span args are shown as text if they aren't JSON types
+            json.dump(self.to_dict(), f, default=str)
+            f.write("\n")
+
+
+# tracer of the running command, see trace()
+_tracer = None
+
+
+def get_tracer():
+    """
+    Return the tracer of the running command or None if it isn't traced.
+
+    :rtype: Tracer
+    """
+    return _tracer
+
+
+@contextmanager
+def span(name, category="releng_sop", **args):
+    """
+    Record a span with the tracer of the running command; do nothing if it isn't traced.
+
+    :param name: Span name
+    :type  name: str
+    :param category: Span category
+    :type  category: str="releng_sop"
+    :return: Context manager yielding the args dict, see Tracer.span()
+    :rtype:  contextmanager
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield args
+        return
+    with tracer.span(name, category, **args) as result:
+        yield result
+
+
+@contextmanager
+def trace(path, name=None):
+    """
+    Trace a command in a root span and write the trace at the end, even if the command fails.
+
+    :param path: Path to the Chrome trace JSON file; nothing is traced if not set
+    :type  path: str
+    :param name: Command name, the script name by default
+    :type  name: str=None
+    :return: Context manager yielding the Tracer or None
+    :rtype:  contextmanager
+    """
+    global _tracer
+    if not path:
+        yield None
+        return
+    tracer = Tracer(name)
+    previous, _tracer = _tracer, tracer
+    try:
+        with tracer.span(tracer.name, "command", argv=sys.argv[1:]):
+            yield tracer
+    finally:
+        _tracer = previous
+        tracer.write(path)
+
+
+def add_trace_arguments(parser):
+    """
+    Add --trace argument to a parser.
+
+    :param parser: Argument parser
+    :type  parser: argparse.ArgumentParser
+    """
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Write a timeline of config loading, PDC queries, commands and koji calls to a Chrome trace JSON file "
+             "(open it in chrome://tracing or ui.perfetto.dev).",
+    )
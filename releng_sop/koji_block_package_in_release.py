@@ -26,7 +26,7 @@ import sys
 
 import argparse
 
-from .common import Environment, Release, Error, CommandBase
+from .common import Environment, Release, Error, CommandBase, add_trace_arguments, trace
 
 
 class KojiBlockPackageInRelease(CommandBase):
@@ -123,6 +123,7 @@ def get_parser():
         action="store_true",
         help="Print traceback for exceptions. By default only exception messages are displayed.",
     )
+    add_trace_arguments(parser)
     return parser
 
 
@@ -132,10 +133,11 @@ def main():
         parser = get_parser()
         args = parser.parse_args()
 
-        env = Environment(args.env)
-        release = Release(args.release_id)
-        clone = KojiBlockPackageInRelease(env, release, args.packages)
-        clone.run(commit=args.commit)
+        with trace(args.trace):
+            env = Environment(args.env)
+            release = Release(args.release_id)
+            clone = KojiBlockPackageInRelease(env, release, args.packages)
+            clone.run(commit=args.commit)
 
     except Error:
         if not args.debug:
@@ -28,7 +28,7 @@ import argparse
 
 from productmd.composeinfo import verify_label as verify_milestone
 
-from .common import Environment, Release, Error, CommandBase
+from .common import Environment, Release, Error, CommandBase, add_trace_arguments, trace
 
 
 class KojiCloneTagForReleaseMilestone(CommandBase):
@@ -142,6 +142,7 @@ def get_parser():
         action="store_true",
         help="Print traceback for exceptions. By default only exception messages are displayed.",
     )
+    add_trace_arguments(parser)
     return parser
 
 
@@ -151,10 +152,11 @@ def main():
         parser = get_parser()
         args = parser.parse_args()
 
-        env = Environment(args.env)
-        release = Release(args.release_id)
-        clone = KojiCloneTagForReleaseMilestone(env, release, args.milestone)
-        clone.run(commit=args.commit)
+        with trace(args.trace):
+            env = Environment(args.env)
+            release = Release(args.release_id)
+            clone = KojiCloneTagForReleaseMilestone(env, release, args.milestone)
+            clone.run(commit=args.commit)
 
     except Error:
         if not args.debug:
@@ -27,7 +27,7 @@ import sys
 
 import argparse
 
-from .common import Environment, Release, UsageError, Error, CommandBase
+from .common import Environment, Release, UsageError, Error, CommandBase, add_trace_arguments, trace
 
 
 class KojiCreatePackageInRelease(CommandBase):
@@ -184,6 +184,7 @@ def get_parser():
         action="store_true",
         help="Print traceback for exceptions. By default only exception messages are displayed.",
     )
+    add_trace_arguments(parser)
     return parser
 
 
@@ -198,11 +199,12 @@ def main():
         if not hasattr(args, 'scl'):
             args.scl = None
 
-        env = Environment(args.env)
-        release = Release(args.release_id)
-        clone = KojiCreatePackageInRelease(
-            env, release, args.packages, args.owner, args.scl)
-        clone.run(commit=args.commit)
+        with trace(args.trace):
+            env = Environment(args.env)
+            release = Release(args.release_id)
+            clone = KojiCreatePackageInRelease(
+                env, release, args.packages, args.owner, args.scl)
+            clone.run(commit=args.commit)
 
     except Error:
         if not args.debug:
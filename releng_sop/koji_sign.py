@@ -15,30 +15,89 @@ The overall workflow is:
     * RPM has signed header in sigcache -> (1) WRITE FROM SIGCACHE
     * RPM has signed main copy that matches sigkeys -> (2) IMPORT FROM MAIN COPY
     * RPM has unsigned main copy -> (3) SIGN TO TEMP, IMPORT TO SIGCACHE, WRITE FROM SIGCACHE
+
+* RPMs leased by another signing job are skipped in (3) and waited on (see releng_sop.koji_sign_lease)
+* (3) can be distributed to koji-sign-worker processes (see releng_sop.koji_sign_queue)
+* duration of each stage is recorded in KojiSignRPMs.metrics (see releng_sop.koji_sign_metrics)
+* progress of stages with throughput and ETA is reported by KojiSignRPMs.progress (see releng_sop.koji_sign_progress)
+* koji RPCs can be timed and slow ones traced (see releng_sop.koji_sign_rpc_trace)
+* sign(), its stages and koji RPCs are recorded as spans of the command trace (see releng_sop.common.trace)
+
+Tag listings are parsed as they are received and only RPM_INFO_KEYS and BUILD_INFO_KEYS are kept,
+signatures can be queried while the listing is still being read.
 """
 
 
 from __future__ import print_function
 
 import base64
+import errno
+import hashlib
 import logging
 import multiprocessing.dummy
+import math
 import os
+import random
 import shutil
 import subprocess
 import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from xml.etree import ElementTree
 
 import koji
+from six.moves import queue, xmlrpc_client
 
-from .common import get_logger
+from .cassette import get_client
+from .common import get_logger, get_tracer, span, Error
+from .koji_sign_lease import LeaseLostError, SignLeases
+from .koji_sign_metrics import SignMetrics
+from .koji_sign_progress import SignProgress
+from .koji_sign_queue import SignQueue
+from .koji_sign_scratch import ScratchDirs
 
 
 __all__ = (
     "KojiSignRPMs",
+    "AdaptiveChunker",
+    "RPMPrefetcher",
+    "RPMSigPrefetcher",
+    "PRIORITIES",
+    "RPM_INFO_KEYS",
+    "BUILD_INFO_KEYS",
+    "SCAN_BACKENDS",
+    "LocalRPMSign",
+    "LibRPMSign",
     "get_rpmsign_class",
 )
 
 
+# fields kept in rpm_info and build_info dicts read by KojiSignRPMs.get_latest_tagged_rpms()
+RPM_INFO_KEYS = ("id", "name", "version", "release", "epoch", "arch", "size", "payloadhash", "build_id", "external_repo_id")
+BUILD_INFO_KEYS = ("id", "package_name", "version", "release", "epoch", "nvr", "volume_id", "volume_name")
+
+# string fields shared by many RPMs, equal values are stored once
+_SHARED_RPM_INFO_KEYS = ("version", "release", "epoch", "arch")
+
+# backends of find_signed_rpms_in_main_copies()
+SCAN_BACKENDS = ("threads", "processes")
+# storage with lower latency of reading a header (seconds) makes the scan CPU-bound
+SCAN_LATENCY_THRESHOLD = 0.001
+# number of headers read to measure the latency
+SCAN_LATENCY_SAMPLES = 5
+# smaller scans aren't worth starting processes
+SCAN_PROCESSES_MIN_RPMS = 200
+
+# assumed throughput (MiB/s) of writing signed copies and of signing for KojiSignRPMs.estimate()
+ESTIMATE_THROUGHPUT = {
+    "write": 100,
+    "sign": 20,
+}
+# assumed duration (seconds) of importing a signature from a main copy
+ESTIMATE_IMPORT_TIME = 0.5
+
+
 class KojiSignRPMs(object):
     """
     Sign RPMs and import them to a koji instance.
@@ -51,18 +110,82 @@ class KojiSignRPMs(object):
     :type  logger: logging.Logger
     :param log_level: Log level for default logger (when logger is not set)
     :type  log_level: int
+    :param local_write: Write signed copies directly to koji volume (mounted read-write) instead of the hub
+    :type  local_write: bool=False
+    :param threads: Number of threads for file system lookups and local writes
+    :type  threads: int=10
+    :param lease_dir: Directory with leases shared by signing jobs, see releng_sop.koji_sign_lease (optional)
+    :type  lease_dir: str=None
+    :param queue_dir: Spool directory of koji-sign-worker processes, see releng_sop.koji_sign_queue (optional)
+    :type  queue_dir: str=None
+    :param chunk_time: Target duration of signing a chunk in seconds, chunk sizes are adapted to reach it
+    :type  chunk_time: int=60
+    :param prefetch: Read ahead main copies of RPMs to be signed, up to given MiB; 0 disables it
+    :type  prefetch: int=512
+    :param scratch_dirs: Scratch directories for copies of RPMs, see releng_sop.koji_sign_scratch;
+                         default temp directory is used if not set
+    :type  scratch_dirs: list=None
+    :param scan_backend: Backend for reading headers of main copies, see SCAN_BACKENDS;
+                         selected by measured storage latency if not set
+    :type  scan_backend: str=None
+    :param scan_latency: Storage latency in seconds below which headers are read in processes
+    :type  scan_latency: float=0.001
+    :param scan_samples: Number of headers read to measure storage latency
+    :type  scan_samples: int=5
+    :param cassette: Record koji calls to a cassette or replay them, see releng_sop.cassette
+    :type  cassette: releng_sop.cassette.Cassette=None
+    :param memprofiler: Measure memory of signing stages, see releng_sop.memprofile
+    :type  memprofiler: releng_sop.memprofile.MemoryProfiler=None
+    :param progress: Live progress mode, see releng_sop.koji_sign_progress.PROGRESS_MODES
+    :type  progress: str="none"
+    :param rpc_tracer: Time RPCs of koji sessions and trace slow ones, see releng_sop.koji_sign_rpc_trace
+    :type  rpc_tracer: releng_sop.koji_sign_rpc_trace.RPCTracer=None
     """
 
-    def __init__(self, koji_profile, rpmsign_class, logger=None, log_level=logging.INFO):  # noqa: D102
+    def __init__(self, koji_profile, rpmsign_class, logger=None, log_level=logging.INFO, local_write=False, threads=10,  # noqa: D102
+                 lease_dir=None, queue_dir=None, chunk_time=60, prefetch=512, scratch_dirs=None, scan_backend=None,
+                 scan_latency=SCAN_LATENCY_THRESHOLD, scan_samples=SCAN_LATENCY_SAMPLES,
+                 cassette=None, memprofiler=None, progress="none", rpc_tracer=None):
+        if scan_backend is not None and scan_backend not in SCAN_BACKENDS:
+            raise ValueError("Unknown scan backend: %s" % scan_backend)
         self.koji_profile = koji_profile
+        self.local_write = local_write
+        self.threads = threads
+        self.scan_backend = scan_backend
+        self.scan_latency = scan_latency
+        self.scan_samples = scan_samples
+        self.cassette = cassette
+        self.rpc_tracer = rpc_tracer
         self.koji_module = koji.get_profile_module(self.koji_profile)
-        self.koji_session = koji.ClientSession(self.koji_module.config.server)
+        self.koji_session = self._get_koji_session()
         self.rpmsign_class = rpmsign_class
         self._get_rpm_sighdr_sigkey_cache = {}
         self.logger = logger or get_logger(self, log_level)
-
-        if self.koji_module.config.authtype == "kerberos":
-            self.koji_session.krb_login()
+        self.leases = SignLeases(lease_dir, logger=self.logger) if lease_dir else None
+        self.queue = SignQueue(queue_dir, logger=self.logger) if queue_dir else None
+        self.scratch = ScratchDirs(scratch_dirs, logger=self.logger) if scratch_dirs else None
+        self.chunker = AdaptiveChunker(target_time=chunk_time, scratch=self.scratch, logger=self.logger)
+        self.prefetch = prefetch
+        self.prefetcher = None
+        self.sig_prefetcher = None
+        self.progress = SignProgress(progress, logger=self.logger)
+        self.metrics = SignMetrics(memprofiler=memprofiler, progress=self.progress)
+
+    def _get_koji_session(self):
+        """
+        Return a new logged in koji session.
+        """
+        def _create_session():
+            koji_session = koji.ClientSession(self.koji_module.config.server)
+            if self.rpc_tracer is not None:
+                self.rpc_tracer.instrument(koji_session)
+            if get_tracer() is not None:
+                _trace_koji_session(koji_session)
+            if self.koji_module.config.authtype == "kerberos":
+                koji_session.krb_login()
+            return koji_session
+
+        return get_client(self.cassette, "koji", _create_session)
 
     def log(self, level, msg, commit=False):
         """
@@ -80,26 +203,105 @@ class KojiSignRPMs(object):
             msg = "[TEST] %s" % msg
         func(msg)
 
-    def get_latest_tagged_rpms(self, tag_name, inherit=False):
+    def get_latest_tagged_rpms(self, tag_name, inherit=False, prefetch_sigs=False, batch_size=1000):
         """
         Return rpm_info list for latest tagged builds in a tag.
 
+        The response is parsed as it is received and only RPM_INFO_KEYS and BUILD_INFO_KEYS are kept,
+        so memory doesn't grow with all fields of all RPMs in huge tags.
+
         :param tag_name: A koji tag name
         :type  tag_name: str
         :param inherit: Follow tag inheritance
         :type  inherit: bool=False
+        :param prefetch_sigs: Query signatures in batches while the listing is being read,
+                              get_rpm_sig_dict() then uses them, see RPMSigPrefetcher
+        :type  prefetch_sigs: bool=False
+        :param batch_size: Number of RPMs in a batch for prefetching signatures
+        :type  batch_size: int=1000
         :return: List of koji rpm_info dictionaries
         :rtype:  list
         """
-        rpm_info_list, build_info_list = self.koji_session.listTaggedRPMS(tag_name, latest=True, inherit=inherit, rpmsigs=False)
+        if prefetch_sigs and self.sig_prefetcher is None:
+            # the main session is busy reading the listing
+            self.sig_prefetcher = RPMSigPrefetcher(self._get_koji_session(), logger=self.logger, metrics=self.metrics)
+
+        rpm_info_list = []
         builds_by_id = {}
-        for build_info in build_info_list:
-            build_info["name"] = build_info["package_name"]
-            builds_by_id[build_info["id"]] = build_info
-        for rpm_info in rpm_info_list:
-            rpm_info["build"] = builds_by_id[rpm_info["build_id"]]
+        rpm_ids = set()
+        shared = {}
+        batch = []
+
+        def _add(num, data):
+            if num == 0:
+                # a retried call can be received again
+                if data["id"] in rpm_ids:
+                    return
+                rpm_ids.add(data["id"])
+                for key in _SHARED_RPM_INFO_KEYS:
+                    if key in data:
+                        data[key] = shared.setdefault(data[key], data[key])
+                rpm_info_list.append(data)
+                if prefetch_sigs:
+                    batch.append(data)
+                    if len(batch) >= batch_size:
+                        self.sig_prefetcher.add(batch[:])
+                        del batch[:]
+            elif num == 1:
+                data["name"] = data["package_name"]
+                builds_by_id[data["id"]] = data
+
+        with self.metrics.stage("listing"):
+            try:
+                self._call_streamed(_add, (RPM_INFO_KEYS, BUILD_INFO_KEYS), "listTaggedRPMS",
+                                    tag_name, latest=True, inherit=inherit, rpmsigs=False)
+            except BaseException:
+                # nobody is going to collect prefetched signatures, don't leave the thread running
+                if self.sig_prefetcher is not None:
+                    prefetcher, self.sig_prefetcher = self.sig_prefetcher, None
+                    prefetcher.close()
+                raise
+            self.metrics.rpc()
+            if batch:
+                self.sig_prefetcher.add(batch)
+
+            for rpm_info in rpm_info_list:
+                rpm_info["build"] = builds_by_id[rpm_info["build_id"]]
+        self.metrics.add("listing", items=len(rpm_info_list), size=sum([i["size"] for i in rpm_info_list]), calls=0)
         return rpm_info_list
 
+    def _call_streamed(self, callback, keys, method, *args, **kwargs):
+        """
+        Call a koji method returning a list of lists of structs and parse the response as it is received.
+
+        :param callback: Called with (index of the list, struct dict) for each struct
+        :type  callback: callable
+        :param keys: Tuple of struct keys to keep for each list
+        :type  keys: tuple
+        :param method: Koji method name
+        :type  method: str
+        """
+        if not hasattr(type(self.koji_session), "_read_xmlrpc_response"):
+            # old koji without requests based transport, read whole response
+            result = getattr(self.koji_session, method)(*args, **kwargs)
+            for num, data_list in enumerate(result):
+                for data in data_list:
+                    callback(num, dict([(i, data[i]) for i in keys[num] if i in data]))
+            return
+
+        def _read_xmlrpc_response(response):
+            for num, data in _iter_xmlrpc_response_structs(_ResponseReader(response), keys):
+                callback(num, data)
+            return None
+
+        # koji reads responses of all calls with this method, use the streamed reader for this call in this thread
+        readers = _stream_koji_session(self.koji_session)
+        readers.reader = _read_xmlrpc_response
+        try:
+            getattr(self.koji_session, method)(*args, **kwargs)
+        finally:
+            readers.reader = None
+
     def get_build_rpms(self, build_list):
         """
         Return rpm_info list for specified builds.
@@ -139,29 +341,69 @@ class KojiSignRPMs(object):
             result.append(rpm_info)
         return result
 
-    def get_rpm_sig_dict(self, rpm_info_list):
+    def sort_rpm_info_list_by_priority(self, rpm_info_list, priorities=None, packages=None):
+        """
+        Return rpm_info list ordered by signing priority.
+
+        RPMs of specified packages (e.g. critical path) go first,
+        then RPMs are ordered by priorities in given order:
+
+        * noarch - noarch RPMs first
+        * smallest - smallest RPMs first
+        * srpm-first - SRPMs first, debuginfo and debugsource RPMs last
+
+        The sort is stable, RPMs with the same priority keep their order.
+
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :param priorities: List of priorities, see PRIORITIES
+        :type  priorities: list=None
+        :param packages: List of koji packages (SRPM names) to go first
+        :type  packages: list=None
+        :return: List of koji rpm_info dictionaries
+        :rtype:  list
+        """
+        priorities = priorities or []
+        for priority in priorities:
+            if priority not in PRIORITIES:
+                raise ValueError("Unknown priority: %s" % priority)
+
+        # convert to set, list lookups are slow
+        packages = set(packages or [])
+
+        def _key(rpm_info):
+            result = [rpm_info["build"]["name"] not in packages]
+            for priority in priorities:
+                result.append(PRIORITIES[priority](rpm_info))
+            return result
+
+        return sorted(rpm_info_list, key=_key)
+
+    def get_rpm_sig_dict(self, rpm_info_list, stage="sig_query"):
         """
         Read information about cached signatures from koji.
 
+        Signatures prefetched by get_latest_tagged_rpms() are used,
+        only RPMs that weren't prefetched are queried.
+
         :param rpm_info_list: List of koji rpm_info dictionaries
         :type  rpm_info_list: list
+        :param stage: Name of the stage in metrics
+        :type  stage: str="sig_query"
         :return: {rpm_id: {sigkey: sighash}}
         :rtype:  dict
         """
-        result = {}
-
-        self.koji_session.multicall = True
-        for rpm_info in rpm_info_list:
-            self.koji_session.queryRPMSigs(rpm_info["id"])
-        data = self.koji_session.multiCall(strict=True)
-
-        for [sig_list] in data:
-            for sig in sig_list:
-                rpm_id = sig["rpm_id"]
-                sigkey = sig["sigkey"].lower()
-                sighash = sig["sighash"]
-                result.setdefault(rpm_id, {})[sigkey] = sighash
-        return result
+        with self.metrics.stage(stage, rpm_info_list):
+            if self.sig_prefetcher is None:
+                self.metrics.rpc()
+                return _query_rpm_sig_dict(self.koji_session, rpm_info_list)
+
+            prefetcher, self.sig_prefetcher = self.sig_prefetcher, None
+            result, missing = prefetcher.get(rpm_info_list)
+            if missing:
+                self.metrics.rpc()
+                result.update(_query_rpm_sig_dict(self.koji_session, missing))
+            return result
 
     def find_cached(self, rpm_info_list, rpm_sig_dict, sigkeys):
         """
@@ -221,19 +463,25 @@ class KojiSignRPMs(object):
         :return: (matched, unmatched) koji rpm_info dictionaries
         :rtype:  tuple
         """
-        matched = []
-        unmatched = []
         matches_by_rpm_id = {}
 
         def _wrapped_func(rpm_info):
             return func(rpm_info, matches_by_rpm_id)
 
         # this creates a *threading* pool
-        pool = multiprocessing.dummy.Pool(10)
+        pool = multiprocessing.dummy.Pool(self.threads)
         pool.map(_wrapped_func, rpm_info_list)
         pool.close()
         # pool.join()  # doesn't work on py2.7
 
+        return self._split_matched(rpm_info_list, matches_by_rpm_id)
+
+    def _split_matched(self, rpm_info_list, matches_by_rpm_id):
+        """
+        Split rpm_info_list into (matched, unmatched) according to {rpm_id: bool}.
+        """
+        matched = []
+        unmatched = []
         for rpm_info in rpm_info_list:
             if matches_by_rpm_id[rpm_info["id"]]:
                 matched.append(rpm_info)
@@ -255,16 +503,20 @@ class KojiSignRPMs(object):
         :rtype:  tuple
         """
         sigkeys = [i.lower() for i in sigkeys]
+        update_progress = self._get_progress_update()
 
         def _find_signed_rpm(rpm_info, matches_by_rpm_id):
+            matches_by_rpm_id[rpm_info["id"]] = False
             for sigkey in sigkeys:
                 path = self._get_rpm_path(rpm_info, sigkey)
                 if os.path.isfile(path):
                     matches_by_rpm_id[rpm_info["id"]] = True
-                    return
-            matches_by_rpm_id[rpm_info["id"]] = False
+                    break
+            if update_progress is not None:
+                update_progress("signed_check", 1, rpm_info.get("size", 0))
 
-        signed, unsigned = self._find_rpms(rpm_info_list, _find_signed_rpm)
+        with self.metrics.stage("signed_check", rpm_info_list, progress=update_progress is None):
+            signed, unsigned = self._find_rpms(rpm_info_list, _find_signed_rpm)
         assert len(rpm_info_list) == len(signed) + len(unsigned)
         return signed, unsigned
 
@@ -276,6 +528,9 @@ class KojiSignRPMs(object):
         They can be signed in rare situations such as imported signed 3rd party packages.
         In such case re-use existing signature rather than sign the RPMs again.
 
+        Headers are read in threads on slow (network) storage
+        and in processes on fast storage, where parsing them is the bottleneck.
+
         :param rpm_info_list: List of koji rpm_info dictionaries
         :type  rpm_info_list: list
         :param sigkeys: List of sigkeys
@@ -284,8 +539,24 @@ class KojiSignRPMs(object):
         :rtype:  tuple
         """
         sigkeys = [i.lower() for i in sigkeys]
-        signed = []
-        unsigned = []
+        with self.metrics.stage("main_scan", rpm_info_list, progress=not self.progress.enabled):
+            if self._get_scan_backend(rpm_info_list) == "processes":
+                return self._find_signed_rpms_in_main_copies_in_processes(rpm_info_list, sigkeys)
+            return self._find_signed_rpms_in_main_copies_in_threads(rpm_info_list, sigkeys)
+
+    def _get_progress_update(self):
+        """
+        Return progress.update() for reporting each RPM done in a long stage, or None if progress is disabled.
+        """
+        if not self.progress.enabled:
+            return None
+        return self.progress.update
+
+    def _find_signed_rpms_in_main_copies_in_threads(self, rpm_info_list, sigkeys):
+        """
+        Find signed RPMs in main copies, read headers in threads.
+        """
+        update_progress = self._get_progress_update()
 
         def _find_signed_rpm_in_main_copies(rpm_info, matches_by_rpm_id):
             path = self._get_rpm_path(rpm_info, None)
@@ -299,21 +570,105 @@ class KojiSignRPMs(object):
             else:
                 self.logger.debug("Unsigned main copy: %s" % path)
                 matches_by_rpm_id[rpm_info["id"]] = False
+            if update_progress is not None:
+                update_progress("main_scan", 1, rpm_info.get("size", 0))
 
         signed, unsigned = self._find_rpms(rpm_info_list, _find_signed_rpm_in_main_copies)
         return signed, unsigned
 
-    def write_signed_rpms_from_sigcache(self, rpm_info_list, sigkey, commit=False):
+    def _find_signed_rpms_in_main_copies_in_processes(self, rpm_info_list, sigkeys):
+        """
+        Find signed RPMs in main copies, read headers in a process pool.
+
+        Workers return only sigkeys and headers of matching RPMs,
+        headers are cached for importing them.
+        """
+        update_progress = self._get_progress_update()
+        matches_by_rpm_id = {}
+        paths = {}
+        sizes = {}
+        tasks = []
+        for rpm_info in rpm_info_list:
+            path = self._get_rpm_path(rpm_info, None)
+            paths[rpm_info["id"]] = path
+            sizes[rpm_info["id"]] = rpm_info.get("size", 0)
+            tasks.append((rpm_info["id"], path, sigkeys))
+
+        processes = multiprocessing.cpu_count()
+        chunksize = max(1, min(64, len(tasks) // (processes * 4)))
+        # fork, workers need the koji module and configuration of the parent
+        context = multiprocessing.get_context("fork") if hasattr(multiprocessing, "get_context") else multiprocessing
+        pool = context.Pool(processes)
+        try:
+            for rpm_id, sigkey, sighdr in pool.imap_unordered(_read_main_copy_sigkey, tasks, chunksize):
+                path = paths[rpm_id]
+                if sighdr is not None:
+                    self.logger.debug("Found a main copy signed with '%s': %s" % (sigkey, path))
+                    self._get_rpm_sighdr_sigkey_cache[path] = (sighdr, sigkey)
+                    matches_by_rpm_id[rpm_id] = True
+                else:
+                    self.logger.debug("Unsigned main copy: %s" % path)
+                    matches_by_rpm_id[rpm_id] = False
+                if update_progress is not None:
+                    update_progress("main_scan", 1, sizes[rpm_id])
+        except BaseException:
+            # don't wait for workers reading the rest of the headers
+            pool.terminate()
+            raise
+        pool.close()
+        # pool.join()  # doesn't work on py2.7
+
+        return self._split_matched(rpm_info_list, matches_by_rpm_id)
+
+    def _get_scan_backend(self, rpm_info_list):
+        """
+        Return the backend set in constructor or select it by latency of reading first headers.
+        """
+        if self.scan_backend:
+            return self.scan_backend
+        if len(rpm_info_list) < SCAN_PROCESSES_MIN_RPMS or multiprocessing.cpu_count() < 2:
+            return "threads"
+
+        latencies = []
+        for rpm_info in rpm_info_list[:self.scan_samples]:
+            path = self._get_rpm_path(rpm_info, None)
+            start = time.time()
+            try:
+                with open(path, "rb") as f:
+                    f.read(4096)
+            except (IOError, OSError):
+                continue
+            latencies.append(time.time() - start)
+        if not latencies:
+            self.logger.info("Reading headers of main copies in threads, no main copy could be read to measure storage latency")
+            return "threads"
+
+        latency = sorted(latencies)[len(latencies) // 2]
+        result = "processes" if latency < self.scan_latency else "threads"
+        self.logger.info("Reading headers of main copies in %s, storage latency: %.3f ms (median of %s reads), threshold: %.3f ms"
+                         % (result, latency * 1000, len(latencies), self.scan_latency * 1000))
+        return result
+
+    def write_signed_rpms_from_sigcache(self, rpm_info_list, sigkey, rpm_sig_dict=None, commit=False):
         """
         Reconstruct RPMs in koji from existing signed headers in sigcache.
 
+        If local_write is enabled, signed copies are written directly
+        to the koji volume instead of calling writeSignedRPM on the hub.
+
         :param rpm_info_list: List of koji rpm_info dictionaries
         :type  rpm_info_list: list
         :param sigkey: Sigkey
         :type  sigkey: str
+        :param rpm_sig_dict: A dictionary obtained from get_rpm_sig_dict() method, used to verify local writes
+        :type  rpm_sig_dict: dict
         :param commit: Disable dry-run, apply changes for real.
         :type  commit: bool=False
         """
+        if self.local_write:
+            self.write_signed_rpms_locally(rpm_info_list, sigkey, rpm_sig_dict=rpm_sig_dict, commit=commit)
+            return
+
         if commit:
             self.koji_session.multicall = True
 
@@ -328,6 +683,119 @@ class KojiSignRPMs(object):
 
         if commit:
             self.koji_session.multiCall(strict=True)
+            self.metrics.rpc()
+
+    def _get_sighdr_path(self, rpm_info, sigkey):
+        """
+        Return path to a signature header cached in koji.
+
+        :param rpm_info: Koji rpm_info dictionary
+        :type  rpm_info: dict
+        :param sigkey: Sigkey
+        :type  sigkey: str
+        :return: Path to a sighdr
+        :rtype:  str
+        """
+        return os.path.join(self.koji_module.pathinfo.build(rpm_info["build"]), self.koji_module.pathinfo.sighdr(rpm_info, sigkey))
+
+    def write_signed_rpms_locally(self, rpm_info_list, sigkey, rpm_sig_dict=None, commit=False):
+        """
+        Write signed RPMs from sigcache directly to the koji volume.
+
+        This is a local equivalent of hub's writeSignedRPM.
+        It requires the koji volume to be mounted read-write.
+        The RPMs are written in threads using multiprocessing.dummy.Pool.
+
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :param sigkey: Sigkey
+        :type  sigkey: str
+        :param rpm_sig_dict: A dictionary obtained from get_rpm_sig_dict() method, used to verify sighdrs
+        :type  rpm_sig_dict: dict
+        :param commit: Disable dry-run, apply changes for real.
+        :type  commit: bool=False
+        """
+        sigkey = sigkey.lower()
+        rpm_sig_dict = rpm_sig_dict or {}
+
+        def _write_signed_rpm(rpm_info):
+            path = self._get_rpm_path(rpm_info, sigkey)
+
+            msg = "Writing RPM from '%s' sigcache (local): %s" % (sigkey, path)
+            self.log("info", msg, commit=commit)
+
+            if commit:
+                sighash = rpm_sig_dict.get(rpm_info["id"], {}).get(sigkey)
+                self._write_signed_rpm_locally(rpm_info, sigkey, sighash=sighash)
+
+        # this creates a *threading* pool
+        pool = multiprocessing.dummy.Pool(self.threads)
+        pool.map(_write_signed_rpm, rpm_info_list)
+        pool.close()
+
+    def _write_signed_rpm_locally(self, rpm_info, sigkey, sighash=None):
+        """
+        Splice a sighdr from sigcache onto an unsigned RPM and write the result atomically.
+
+        :param rpm_info: Koji rpm_info dictionary
+        :type  rpm_info: dict
+        :param sigkey: Sigkey
+        :type  sigkey: str
+        :param sighash: Expected md5 of the sighdr (optional)
+        :type  sighash: str
+        :return: Path to the signed RPM
+        :rtype:  str
+        """
+        src_path = self._get_rpm_path(rpm_info, None)
+        dst_path = self._get_rpm_path(rpm_info, sigkey)
+
+        if os.path.isfile(dst_path):
+            # the same as writeSignedRPM without force
+            return dst_path
+
+        with open(self._get_sighdr_path(rpm_info, sigkey), "rb") as f:
+            sighdr = f.read()
+        if sighash and hashlib.md5(sighdr).hexdigest() != sighash:
+            raise ValueError("Sighdr in sigcache doesn't match sighash '%s': %s" % (sighash, dst_path))
+
+        sig_start, sig_size = koji.find_rpm_sighdr(src_path)
+        src_stat = os.stat(src_path)
+        payload_size = src_stat.st_size - sig_start - sig_size
+
+        dst_dir = os.path.dirname(dst_path)
+        if not os.path.isdir(dst_dir):
+            try:
+                os.makedirs(dst_dir)
+            except OSError:
+                # created by another thread in the meantime
+                if not os.path.isdir(dst_dir):
+                    raise
+
+        fd, temp_path = tempfile.mkstemp(prefix=".%s." % os.path.basename(dst_path), dir=dst_dir)
+        try:
+            with open(src_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+                # lead
+                dst.write(src.read(sig_start))
+                dst.write(sighdr)
+                dst.flush()
+                # header and payload
+                _copy_file_range(src, dst, sig_start + sig_size, payload_size)
+                os.fsync(dst.fileno())
+
+            # verify the result before making it visible
+            expected_size = sig_start + len(sighdr) + payload_size
+            if os.path.getsize(temp_path) != expected_size:
+                raise ValueError("Size of written RPM doesn't match, expected %s bytes: %s" % (expected_size, dst_path))
+            if koji.rip_rpm_sighdr(temp_path) != sighdr:
+                raise ValueError("Sighdr of written RPM doesn't match sigcache: %s" % dst_path)
+
+            os.chmod(temp_path, src_stat.st_mode & 0o7777)
+            os.rename(temp_path, dst_path)
+        except BaseException:
+            # interrupted writes must not leave temp files on the volume either
+            os.remove(temp_path)
+            raise
+        return dst_path
 
     def _get_rpm_sighdr_sigkey(self, path):
         """
@@ -344,22 +812,63 @@ class KojiSignRPMs(object):
             return result
 
         sighdr = koji.rip_rpm_sighdr(path)
-        rawhdr = koji.RawHeader(sighdr)
-
-        sigpkt = rawhdr.get(koji.RPM_SIGTAG_GPG)
-        if not sigpkt:
-            sigpkt = rawhdr.get(koji.RPM_SIGTAG_PGP)
-
-        sigkey = ""
-        if sigpkt:
-            sigkey = koji.get_sigpacket_key_id(sigpkt)
-        sigkey = sigkey.lower()
+        sigkey = _get_sighdr_sigkey(sighdr)
 
         result = (sighdr, sigkey)
         self._get_rpm_sighdr_sigkey_cache[path] = result
         return result
 
-    def split_rpm_info_list_by_size_and_files(self, rpm_info_list, max_size=500, max_files=20):
+    def verify_signed_rpms(self, rpm_info_list, sigkeys):
+        """
+        Verify that signed copies exist and are signed with expected sigkeys.
+
+        For each RPM, the first existing signed copy (in sigkeys order) is checked.
+        Only signature headers are read. The checks are done in threads
+        using multiprocessing.dummy.Pool.
+
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :param sigkeys: List of sigkeys
+        :type  sigkeys: list
+        :return: (verified, failures); verified is a rpm_info list, failures is a list of (rpm_info, path, reason)
+        :rtype:  tuple
+        """
+        sigkeys = [i.lower() for i in sigkeys]
+
+        def _verify_signed_rpm(rpm_info):
+            for sigkey in sigkeys:
+                path = self._get_rpm_path(rpm_info, sigkey)
+                if not os.path.isfile(path):
+                    continue
+                try:
+                    # don't use _get_rpm_sighdr_sigkey(), caching sighdrs of all RPMs is wasteful
+                    rpm_sigkey = _get_sighdr_sigkey(koji.rip_rpm_sighdr(path))
+                except Exception as ex:
+                    return (path, "Can't read signature: %s" % ex)
+                if rpm_sigkey != sigkey:
+                    return (path, "Signed with '%s' instead of '%s'" % (rpm_sigkey, sigkey))
+                return (path, None)
+            return (self._get_rpm_path(rpm_info, sigkeys[0]), "Signed copy not found")
+
+        # this creates a *threading* pool
+        pool = multiprocessing.dummy.Pool(self.threads)
+        results = pool.map(_verify_signed_rpm, rpm_info_list)
+        pool.close()
+
+        verified = []
+        failures = []
+        for rpm_info, (path, reason) in zip(rpm_info_list, results):
+            if reason:
+                failures.append((rpm_info, path, reason))
+            else:
+                verified.append(rpm_info)
+
+        self.logger.info("Signed RPMs verified: %s/%s" % (len(verified), len(rpm_info_list)))
+        for rpm_info, path, reason in failures:
+            self.logger.error("%s: %s" % (reason, path))
+        return verified, failures
+
+    def split_rpm_info_list_by_size_and_files(self, rpm_info_list, max_size=500, max_files=20, chunker=None):
         """
         Split rpm_info_list into chunks by max file size or file count.
 
@@ -371,6 +880,9 @@ class KojiSignRPMs(object):
         :type  max_size: int=500
         :param max_files: Maximal count of files to be signed at once
         :type  max_files: int=20
+        :param chunker: Read limits from the chunker before each chunk, max_size and max_files are ignored;
+                        chunks stay within the size limit unless a single RPM exceeds it
+        :type  chunker: AdaptiveChunker=None
         :return: [[rpm_info, ...], ...]
         :rtype:  list
         """
@@ -378,11 +890,16 @@ class KojiSignRPMs(object):
         rpm_info_list = rpm_info_list[:]
 
         while rpm_info_list:
+            if chunker:
+                max_size, max_files = chunker.get_limits()
             size = 0
             files = 0
             result = []
 
             while rpm_info_list:
+                if chunker and result and max_size and size + rpm_info_list[0]["size"] > max_size * 1024 ** 2:
+                    # the limit follows free space, a chunk over it may not fit anywhere
+                    break
                 rpm_info = rpm_info_list.pop(0)
                 result.append(rpm_info)
                 size += rpm_info["size"]
@@ -412,15 +929,23 @@ class KojiSignRPMs(object):
         if not commit:
             return temp_dir, paths
 
-        temp_dir = tempfile.mkdtemp(prefix="sign_rpms_")
+        if self.scratch:
+            temp_dir = self.scratch.mkdtemp(sum([i["size"] for i in rpm_info_list]), prefix="sign_rpms_")
+        else:
+            temp_dir = tempfile.mkdtemp(prefix="sign_rpms_")
         self.logger.info("Workdir: %s" % temp_dir)
 
+        start = time.time()
         for rpm_info in rpm_info_list:
             src_path = self._get_rpm_path(rpm_info, None)
             dst_path = os.path.join(temp_dir, os.path.basename(src_path))
             shutil.copyfile(src_path, dst_path)
             paths.append(dst_path)
+            if self.prefetcher:
+                self.prefetcher.consumed(src_path)
 
+        if self.scratch:
+            self.scratch.record(temp_dir, time.time() - start)
         return temp_dir, paths
 
     def sign_rpms_in_temp(self, sigkey, paths, commit=False):
@@ -460,6 +985,9 @@ class KojiSignRPMs(object):
             os.remove(path)
         os.rmdir(temp_dir)
 
+        if self.scratch:
+            self.scratch.release(temp_dir)
+
     def import_signed_rpms(self, rpm_info_list, paths, sigkey, rpm_sig_dict=None, commit=False):
         """
         Import signed RPMs from temp to koji.
@@ -470,7 +998,7 @@ class KojiSignRPMs(object):
         :type  paths: list
         :param sigkey: Sigkey
         :type  sigkey: str
-        :param rpm_sig_dict: A dictionary obtained from get_rpm_sig_dict() method
+        :param rpm_sig_dict: A dictionary obtained from get_rpm_sig_dict() method, updated with imported sigs
         :type  rpm_sig_dict: dict
         :param commit: Disable dry-run, apply changes for real.
         :type  commit: bool=False
@@ -489,17 +1017,291 @@ class KojiSignRPMs(object):
             if rpm_info_fn != path_fn:
                 raise ValueError("File names in 'rpm_info' and 'path' do not match: %s vs %s" % (rpm_info_fn, path_fn))
 
-        if not rpm_sig_dict:
+        if rpm_sig_dict is None:
             rpm_sig_dict = self.get_rpm_sig_dict(rpm_info_list)
 
         for (rpm_info, path) in zip(rpm_info_list, paths):
             rpm_sighdr, rpm_sigkey = self._get_rpm_sighdr_sigkey(path)
             if rpm_sigkey != sigkey:
                 raise ValueError("Expected sigkey: %s; RPM is signed with '%s': %s" % (sigkey, rpm_sigkey, path))
-            rpm_sighdr_base64 = base64.encodestring(rpm_sighdr)
+            rpm_sighdr_base64 = base64.b64encode(rpm_sighdr).decode("ascii")
             self.koji_session.addRPMSig(rpm_info["id"], rpm_sighdr_base64)
+            self.metrics.rpc()
+            # keep the dict up to date, it may be shared by several sign() calls
+            rpm_sig_dict.setdefault(rpm_info["id"], {})[rpm_sigkey] = hashlib.md5(rpm_sighdr).hexdigest()
+
+    def _get_lease_key(self, rpm_info, sigkey):
+        return "%s.%s" % (rpm_info["id"], sigkey.lower())
+
+    def lease_rpms(self, rpm_info_list, sigkey, rpm_sig_dict, commit=False):
+        """
+        Lease RPMs to this job so other jobs don't sign them at the same time.
+
+        Signatures of leased RPMs are read again,
+        because another job could have imported them right before the RPMs were leased.
+        Such RPMs are returned as done and their leases are released immediately.
+
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :param sigkey: Sigkey
+        :type  sigkey: str
+        :param rpm_sig_dict: A dictionary obtained from get_rpm_sig_dict() method, updated with fresh sigs
+        :type  rpm_sig_dict: dict
+        :param commit: Disable dry-run, apply changes for real.
+        :type  commit: bool=False
+        :return: (leased, busy, done) koji rpm_info dictionaries
+        :rtype:  tuple
+        """
+        if not commit or not self.leases:
+            return rpm_info_list, [], []
+
+        leased = []
+        busy = []
+        for rpm_info in rpm_info_list:
+            if self.leases.acquire(self._get_lease_key(rpm_info, sigkey)):
+                leased.append(rpm_info)
+            else:
+                busy.append(rpm_info)
+
+        done = []
+        if leased:
+            rpm_sig_dict.update(self.get_rpm_sig_dict(leased))
+            done, leased = self.find_cached(leased, rpm_sig_dict, [sigkey])
+            self.release_rpms(done, sigkey, commit=commit)
+
+        if busy:
+            self.logger.info("Skipping %s RPMs leased by other jobs" % len(busy))
+        return leased, busy, done
+
+    def release_rpms(self, rpm_info_list, sigkey, commit=False):
+        """
+        Release leases of RPMs obtained by lease_rpms().
+
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :param sigkey: Sigkey
+        :type  sigkey: str
+        :param commit: Disable dry-run, apply changes for real.
+        :type  commit: bool=False
+        """
+        if not commit or not self.leases:
+            return
+        self.leases.release_many([self._get_lease_key(i, sigkey) for i in rpm_info_list])
+
+    @contextmanager
+    def renewing_rpms(self, rpm_info_list, sigkey, commit=False):
+        """
+        Renew leases of RPMs obtained by lease_rpms() while they're being signed.
+
+        The context yields a function that raises LeaseLostError
+        if any of the leases was acquired by another job (see SignLeases.renewing()).
+
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :param sigkey: Sigkey
+        :type  sigkey: str
+        :param commit: Disable dry-run, apply changes for real.
+        :type  commit: bool=False
+        :rtype:  contextmanager
+        """
+        if not commit or not self.leases:
+            yield lambda: None
+            return
+        with self.leases.renewing([self._get_lease_key(i, sigkey) for i in rpm_info_list]) as check_leases:
+            yield check_leases
+
+    def wait_for_leased_rpms(self, rpm_info_list, sigkey, rpm_sig_dict, commit=False):
+        """
+        Wait until other jobs release RPMs and return those that remained unsigned.
+
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :param sigkey: Sigkey
+        :type  sigkey: str
+        :param rpm_sig_dict: A dictionary obtained from get_rpm_sig_dict() method, updated with fresh sigs
+        :type  rpm_sig_dict: dict
+        :param commit: Disable dry-run, apply changes for real.
+        :type  commit: bool=False
+        :return: (done, pending) koji rpm_info dictionaries; pending RPMs need to be signed
+        :rtype:  tuple
+        """
+        if not rpm_info_list:
+            return [], []
+
+        self.logger.info("Waiting for %s RPMs leased by other jobs" % len(rpm_info_list))
+        self.leases.wait([self._get_lease_key(i, sigkey) for i in rpm_info_list])
+        rpm_sig_dict.update(self.get_rpm_sig_dict(rpm_info_list))
+        done, pending = self.find_cached(rpm_info_list, rpm_sig_dict, [sigkey])
+        if pending:
+            self.logger.info("RPMs left unsigned by other jobs: %s" % len(pending))
+        return done, pending
+
+    def sign_chunk(self, rpm_info_chunk, sigkey, rpm_sig_dict, just_sign=False, check_leases=None, commit=False):
+        """
+        Sign a chunk of RPMs: copy them to temp, sign, import sigs to koji and write signed copies.
+
+        :param rpm_info_chunk: List of koji rpm_info dictionaries
+        :type  rpm_info_chunk: list
+        :param sigkey: Sigkey
+        :type  sigkey: str
+        :param rpm_sig_dict: A dictionary obtained from get_rpm_sig_dict() method
+        :type  rpm_sig_dict: dict
+        :param just_sign: Just sign RPMs, don't write RPMs from sigcache.
+        :type  just_sign: bool=False
+        :param check_leases: Function called before signing and importing, raises if leases of the RPMs were lost
+        :type  check_leases: callable=None
+        :param commit: Disable dry-run, apply changes for real.
+        :type  commit: bool=False
+        :return: Duration of stages in seconds: {"copy": float, "sign": float, "import": float, "write": float}
+        :rtype:  dict
+        """
+        timings = {}
+        check_leases = check_leases or (lambda: None)
+
+        # copy RPMs to temp
+        with self.metrics.stage("copy", rpm_info_chunk) as timer:
+            temp_dir, paths = self.copy_rpms_to_temp(rpm_info_chunk, commit=commit)
+        timings["copy"] = timer.duration
+
+        # sign RPMs in temp
+        try:
+            check_leases()
+            with self.metrics.stage("sign", rpm_info_chunk) as timer:
+                self.sign_rpms_in_temp(sigkey, paths, commit=commit)
+            timings["sign"] = timer.duration
+            check_leases()
+        except LeaseLostError:
+            self.clean_temp(temp_dir, paths, commit=commit)
+            raise
+
+        # import sigs to koji
+        with self.metrics.stage("import", rpm_info_chunk) as timer:
+            self.import_signed_rpms(rpm_info_chunk, paths, sigkey, rpm_sig_dict, commit=commit)
+        timings["import"] = timer.duration
+
+        # clean temp
+        self.clean_temp(temp_dir, paths, commit=commit)
+
+        # write signed RPMs
+        with self.metrics.stage("write", rpm_info_chunk if not just_sign else None) as timer:
+            if not just_sign:
+                self.write_signed_rpms_from_sigcache(rpm_info_chunk, sigkey, rpm_sig_dict=rpm_sig_dict, commit=commit)
+        timings["write"] = timer.duration
+
+        return timings
+
+    def _remove_progress_total(self, rpm_info_list, just_sign=False):
+        """
+        Remove RPMs signed by other jobs from progress totals of chunk stages.
+        """
+        for stage in ["copy", "sign", "import"] + ([] if just_sign else ["write"]):
+            self.progress.remove_total(stage, rpm_info_list)
+
+    def sign_rpms(self, rpm_info_list, sigkey, rpm_sig_dict, just_sign=False, commit=False):
+        """
+        Sign RPMs in chunks, skip and wait for RPMs leased by other jobs.
+
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :param sigkey: Sigkey
+        :type  sigkey: str
+        :param rpm_sig_dict: A dictionary obtained from get_rpm_sig_dict() method
+        :type  rpm_sig_dict: dict
+        :param just_sign: Just sign RPMs, don't write RPMs from sigcache.
+        :type  just_sign: bool=False
+        :param commit: Disable dry-run, apply changes for real.
+        :type  commit: bool=False
+        """
+        signed_count = 0
+        pending = rpm_info_list
+        while pending:
+            # RPMs leased by other jobs are skipped and waited on after processing the rest
+            busy = []
+            if commit and self.prefetch:
+                self.prefetcher = RPMPrefetcher([(self._get_rpm_path(i, None), i["size"]) for i in pending],
+                                                budget=self.prefetch, logger=self.logger)
+            try:
+                for rpm_info_chunk in self.split_rpm_info_list_by_size_and_files(pending, chunker=self.chunker):
+                    leased, busy_chunk, done = self.lease_rpms(rpm_info_chunk, sigkey, rpm_sig_dict, commit=commit)
+                    busy += busy_chunk
+                    lost = []
+                    self._remove_progress_total(done, just_sign=just_sign)
+                    try:
+                        if done and not just_sign:
+                            self.write_signed_rpms_from_sigcache(done, sigkey, rpm_sig_dict=rpm_sig_dict, commit=commit)
+                        if leased:
+                            with self.renewing_rpms(leased, sigkey, commit=commit) as check_leases:
+                                timings = self.sign_chunk(leased, sigkey, rpm_sig_dict, just_sign=just_sign,
+                                                          check_leases=check_leases, commit=commit)
+                            if commit:
+                                self.chunker.record(leased, timings)
+                    except LeaseLostError as ex:
+                        # another job signs the chunk now, wait for it like for RPMs leased by other jobs
+                        self.logger.warning("Stopped signing a chunk of %s RPMs: %s" % (len(leased), ex))
+                        lost = leased
+                    finally:
+                        # leases lost to other jobs are skipped with a warning
+                        self.release_rpms(leased, sigkey, commit=commit)
+
+                    busy += lost
+                    signed_count += len(leased) - len(lost) + len(done)
+                    msg = "Signed %s/%s RPMs" % (signed_count, len(rpm_info_list))
+                    self.log("info", msg, commit=commit)
+            finally:
+                if self.prefetcher:
+                    self.prefetcher.close()
+                    self.prefetcher = None
+
+            done, pending = self.wait_for_leased_rpms(busy, sigkey, rpm_sig_dict, commit=commit)
+            self._remove_progress_total(done, just_sign=just_sign)
+            if done and not just_sign:
+                self.write_signed_rpms_from_sigcache(done, sigkey, rpm_sig_dict=rpm_sig_dict, commit=commit)
+            signed_count += len(done)
+
+    def sign_in_queue(self, rpm_info_list, sigkey, rpm_sig_dict, just_sign=False, commit=False):
+        """
+        Publish chunks of RPMs to the queue and wait until koji-sign-worker processes sign them.
 
-    def sign(self, rpm_info_list, sigkeys, just_sign=False, just_write=False, commit=False):
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :param sigkey: Sigkey
+        :type  sigkey: str
+        :param rpm_sig_dict: A dictionary obtained from get_rpm_sig_dict() method, updated with sigs imported by workers
+        :type  rpm_sig_dict: dict
+        :param just_sign: Just sign RPMs, don't write RPMs from sigcache.
+        :type  just_sign: bool=False
+        :param commit: Disable dry-run, apply changes for real.
+        :type  commit: bool=False
+        """
+        # chunks are published at once, workers can't report back their speed
+        chunks = []
+        for rpm_info_chunk in self.split_rpm_info_list_by_size_and_files(rpm_info_list, chunker=self.chunker):
+            chunks.append({
+                "koji_profile": self.koji_profile,
+                "local_write": self.local_write,
+                "sigkey": sigkey,
+                "just_sign": just_sign,
+                "rpm_info_list": rpm_info_chunk,
+            })
+
+        self.log("info", "Publishing %s chunks to %s" % (len(chunks), self.queue.path), commit=commit)
+        if not commit:
+            return
+
+        chunk_ids = self.queue.publish(chunks)
+        done, failed = self.queue.wait(chunk_ids)
+
+        for chunk in done:
+            # JSON turns int keys into strings
+            for rpm_id, sigs in chunk.get("sigs", {}).items():
+                rpm_sig_dict.setdefault(int(rpm_id), {}).update(sigs)
+
+        if failed:
+            for chunk in failed:
+                self.logger.error("Chunk %s failed on %s: %s" % (chunk["id"], chunk["worker"], chunk["error"]))
+            raise Error("Signing of %s chunks failed" % len(failed))
+
+    def sign(self, rpm_info_list, sigkeys, just_sign=False, just_write=False, verify=False, rpm_sig_dict=None, commit=False):
         """
         This method implements the signing workflow.
 
@@ -518,11 +1320,26 @@ class KojiSignRPMs(object):
         :type  just_sign: bool=False
         :param just_write: Just write RPMs from sigcache, don't sign anything.
         :type  just_write: bool=False
+        :param verify: Verify signed copies after writing them.
+        :type  verify: bool=False
+        :param rpm_sig_dict: A dictionary obtained from get_rpm_sig_dict() method,
+                             queried once for all RPMs when signing for several releases
+        :type  rpm_sig_dict: dict=None
         :param commit: Disable dry-run, apply changes for real.
         :type  commit: bool=False
+        :return: Verification failures, see verify_signed_rpms()
+        :rtype:  list
+        """
+        with span("KojiSignRPMs.sign", "koji_sign", rpms=len(rpm_info_list), sigkeys=sigkeys, commit=commit):
+            return self._sign(rpm_info_list, sigkeys, just_sign=just_sign, just_write=just_write, verify=verify,
+                              rpm_sig_dict=rpm_sig_dict, commit=commit)
+
+    def _sign(self, rpm_info_list, sigkeys, just_sign=False, just_write=False, verify=False, rpm_sig_dict=None, commit=False):
+        """
+        Run the signing workflow, see sign().
         """
         # pick the first sigkey for signing
-        sigkey = sigkeys[0]
+        sigkey = sigkeys[0].lower()
 
         num_builds = len(set([i["build"]["id"] for i in rpm_info_list]))
         self.logger.info("Builds found: %s" % num_builds)
@@ -530,8 +1347,10 @@ class KojiSignRPMs(object):
 
         # read known package signatures from koji and rearrange them into:
         # {rpm_id: {sigkey: sighash}}
-        self.logger.info("Reading known package signatures from koji")
-        rpm_sig_dict = self.get_rpm_sig_dict(rpm_info_list)
+        shared_rpm_sig_dict = rpm_sig_dict is not None
+        if not shared_rpm_sig_dict:
+            self.logger.info("Reading known package signatures from koji")
+            rpm_sig_dict = self.get_rpm_sig_dict(rpm_info_list)
 
         # find RPMs with cached/uncached signatures
         cached, uncached = self.find_cached(rpm_info_list, rpm_sig_dict, sigkeys)
@@ -539,12 +1358,14 @@ class KojiSignRPMs(object):
         self.logger.info("RPMs without cached signature: %s" % len(uncached))
 
         # determine if cached RPMs have signed/unsigned copies
+        self.progress.add_total("signed_check", cached)
         signed, unsigned = self.find_signed_rpms(cached, sigkeys)
         self.logger.info("RPMs with cached signature and signed RPM:   %s" % len(signed))
         self.logger.info("RPMs with cached signature and unsigned RPM: %s" % len(unsigned))
 
         self.logger.info("Looking for signed main copies")
         if unsigned:
+            self.progress.add_total("main_scan", unsigned)
             signed_main, unsigned_main = self.find_signed_rpms_in_main_copies(unsigned, sigkeys)
             # signed_main, unsigned_main = self.find_signed_rpms_in_main_copies(unsigned, sigkeys)
             self.logger.info("RPMs with signed main copies:    %s" % len(signed_main))
@@ -560,18 +1381,27 @@ class KojiSignRPMs(object):
         # RPM has signed main copy that matches sigkeys -> (2) IMPORT FROM MAIN COPY
         # RPM has unsigned main copy -> (3) SIGN TO TEMP, IMPORT TO SIGCACHE, WRITE FROM SIGCACHE
 
+        if not just_sign:
+            self.progress.add_total("sigcache_write", unsigned + signed_main)
+        self.progress.add_total("import", signed_main)
+        if not just_write and not self.queue:
+            for stage in ["copy", "sign", "import"] + ([] if just_sign else ["write"]):
+                self.progress.add_total(stage, uncached)
+
         # (1) write from sigcache
         if not just_sign:
             self.log("info", "Writing RPMs from sigcache", commit=commit)
             if unsigned:
-                self.write_signed_rpms_from_sigcache(unsigned, sigkey, commit=commit)
+                with self.metrics.stage("sigcache_write", unsigned):
+                    self.write_signed_rpms_from_sigcache(unsigned, sigkey, rpm_sig_dict=rpm_sig_dict, commit=commit)
             else:
                 self.logger.info("- Nothing to do")
 
-        # refresh signatures
-        msg = "Reading known package signatures from koji (refresh)"
-        self.logger.info(msg)
-        rpm_sig_dict = self.get_rpm_sig_dict(rpm_info_list)
+        # refresh signatures; a shared dict is owned by the caller
+        if not shared_rpm_sig_dict:
+            msg = "Reading known package signatures from koji (refresh)"
+            self.logger.info(msg)
+            rpm_sig_dict = self.get_rpm_sig_dict(rpm_info_list, stage="refresh")
 
         # (2) import from main copy
         if signed_main:
@@ -581,45 +1411,739 @@ class KojiSignRPMs(object):
                 # shouldn't have performance impact since this use case is quite rare
 
                 # import sigs to koji
-                paths = [self._get_rpm_path(i, None) for i in signed_main]
-                path = self._get_rpm_path(i, None)
+                path = self._get_rpm_path(rpm_info, None)
                 rpm_sigkey = self._get_rpm_sighdr_sigkey(path)[1]
-                self.import_signed_rpms([rpm_info], [path], rpm_sigkey, rpm_sig_dict, commit=commit)
+                with self.metrics.stage("import", [rpm_info]):
+                    self.import_signed_rpms([rpm_info], [path], rpm_sigkey, rpm_sig_dict, commit=commit)
 
                 # write signed RPM
                 if not just_sign:
-                    self.write_signed_rpms_from_sigcache([rpm_info], sigkey, commit=commit)
+                    with self.metrics.stage("sigcache_write", [rpm_info]):
+                        self.write_signed_rpms_from_sigcache([rpm_info], sigkey, rpm_sig_dict=rpm_sig_dict, commit=commit)
 
         if not just_write:
             # (3) sign to temp, import to sigcache, write from sigcache
             self.log("info", "Signing and importing RPMs", commit=commit)
-            if uncached:
-                signed_count = 0
-                for rpm_info_chunk in self.split_rpm_info_list_by_size_and_files(uncached, max_size=2):
-                    # copy RPMs to temp
-                    temp_dir, paths = self.copy_rpms_to_temp(rpm_info_chunk, commit=commit)
+            if uncached and self.queue:
+                self.sign_in_queue(uncached, sigkey, rpm_sig_dict, just_sign=just_sign, commit=commit)
+            elif uncached:
+                self.sign_rpms(uncached, sigkey, rpm_sig_dict, just_sign=just_sign, commit=commit)
+            else:
+                self.logger.info("- Nothing to do")
 
-                    # sign RPMs in temp
-                    self.sign_rpms_in_temp(sigkey, paths, commit=commit)
+        msg = "All RPMs signed."
+        self.log("info", msg, commit=commit)
 
-                    # import sigs to koji
-                    self.import_signed_rpms(rpm_info_chunk, paths, sigkey, rpm_sig_dict, commit=commit)
+        failures = []
+        if verify and not just_sign:
+            self.log("info", "Verifying signed RPMs", commit=commit)
+            if commit:
+                _, failures = self.verify_signed_rpms(rpm_info_list, sigkeys)
+        return failures
 
-                    # clean temp
-                    self.clean_temp(temp_dir, paths, commit=commit)
+    def estimate(self, rpm_info_list, sigkeys, rpm_sig_dict=None, sample_size=200, confidence=0.95):
+        """
+        Estimate work of sign() without checking all files.
 
-                    # write signed RPMs
-                    if not just_sign:
-                        self.write_signed_rpms_from_sigcache(rpm_info_chunk, sigkey, commit=commit)
+        Signatures are queried from koji for all RPMs,
+        signed copies and main copies are checked only for a random sample of cached RPMs.
+        Counts and bytes of RPMs in each category of the signing workflow are extrapolated
+        with Wilson score intervals, time is projected from the measured file checks
+        and ESTIMATE_THROUGHPUT.
 
-                    signed_count += len(rpm_info_chunk)
-                    msg = "Signed %s/%s RPMs" % (signed_count, len(uncached))
-                    self.log("info", msg, commit=commit)
-            else:
-                self.logger.info("- Nothing to do")
+        Categories:
 
-        msg = "All RPMs signed."
-        self.log("info", msg, commit=commit)
+        * cached - RPMs with cached signature (exact)
+        * uncached - RPMs to be signed, (3) in sign() (exact)
+        * signed - cached RPMs with a signed copy, skipped
+        * write - cached RPMs without a signed copy, (1) in sign()
+        * signed_main - RPMs to be written that have a signed main copy, (2) in sign()
+
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :param sigkeys: List of sigkeys
+        :type  sigkeys: list
+        :param rpm_sig_dict: A dictionary obtained from get_rpm_sig_dict() method
+        :type  rpm_sig_dict: dict=None
+        :param sample_size: Number of cached RPMs checked on the file system
+        :type  sample_size: int=200
+        :param confidence: Confidence level of the intervals
+        :type  confidence: float=0.95
+        :return: {"categories": {category: {"count": (estimate, low, high), "bytes": (estimate, low, high)}},
+                 "time": (estimate, low, high), "sample_size": int}
+        :rtype:  dict
+        """
+        sigkeys = [i.lower() for i in sigkeys]
+        if rpm_sig_dict is None:
+            self.logger.info("Reading known package signatures from koji")
+            rpm_sig_dict = self.get_rpm_sig_dict(rpm_info_list)
+        cached, uncached = self.find_cached(rpm_info_list, rpm_sig_dict, sigkeys)
+
+        sample = random.sample(cached, min(sample_size, len(cached)))
+        self.logger.info("Checking a sample of cached RPMs: %s/%s" % (len(sample), len(cached)))
+        start = time.time()
+        sample_signed, sample_unsigned = self.find_signed_rpms(sample, sigkeys)
+        stat_time = time.time() - start
+        start = time.time()
+        sample_signed_main = []
+        if sample_unsigned:
+            sample_signed_main = self.find_signed_rpms_in_main_copies(sample_unsigned, sigkeys)[0]
+        scan_time = time.time() - start
+
+        z = _get_z_score(confidence)
+        complete = len(sample) == len(cached)
+        categories = {
+            "cached": _get_exact_estimate(cached),
+            "uncached": _get_exact_estimate(uncached),
+            "signed": _get_sample_estimate(sample_signed, sample, len(cached), z, complete),
+            "write": _get_sample_estimate(sample_unsigned, sample, len(cached), z, complete),
+        }
+        signed_main = _get_sample_estimate(sample_signed_main, sample_unsigned, 1, z, complete)
+        # proportion of RPMs to be written, bounds of both estimates are combined
+        categories["signed_main"] = dict([
+            (key, tuple([i * j for i, j in zip(categories["write"]["count"], signed_main[key])]))
+            for key in ("count", "bytes")
+        ])
+
+        times = []
+        for num in range(3):
+            duration = 0
+            if sample:
+                duration += stat_time * len(cached) / len(sample)
+            if sample_unsigned:
+                duration += scan_time * categories["write"]["count"][num] / len(sample_unsigned)
+            duration += float(categories["write"]["bytes"][num]) / (ESTIMATE_THROUGHPUT["write"] * 1024 ** 2)
+            duration += float(categories["uncached"]["bytes"][num]) / (ESTIMATE_THROUGHPUT["sign"] * 1024 ** 2)
+            duration += categories["signed_main"]["count"][num] * ESTIMATE_IMPORT_TIME
+            times.append(duration)
+
+        self.logger.info("Estimate (%d%% confidence):" % (confidence * 100))
+        for category in ("cached", "uncached", "signed", "write", "signed_main"):
+            count = categories[category]["count"]
+            size = [float(i) / 1024 ** 2 for i in categories[category]["bytes"]]
+            self.logger.info("- %-12s %8.0f RPMs [%.0f - %.0f], %10.1f MiB [%.1f - %.1f]"
+                             % (category + ":", count[0], count[1], count[2], size[0], size[1], size[2]))
+        self.logger.info("- %-12s %8.0f s    [%.0f - %.0f]" % ("time:", times[0], times[1], times[2]))
+
+        return {
+            "categories": categories,
+            "time": tuple(times),
+            "sample_size": len(sample),
+        }
+
+
+def _get_z_score(confidence):
+    """
+    Return z score of a two-sided confidence level using bisection of erf().
+    """
+    low, high = 0.0, 10.0
+    for i in range(60):
+        mid = (low + high) / 2
+        if math.erf(mid / math.sqrt(2)) < confidence:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+
+def _wilson_interval(successes, trials, z=1.96):
+    """
+    Return Wilson score interval of a proportion.
+
+    :param successes: Number of successes in the sample
+    :type  successes: int
+    :param trials: Sample size
+    :type  trials: int
+    :param z: Z score of the confidence level
+    :type  z: float=1.96
+    :return: (low, high)
+    :rtype:  tuple
+    """
+    if not trials:
+        return 0.0, 1.0
+    p = float(successes) / trials
+    denominator = 1 + z ** 2 / trials
+    center = (p + z ** 2 / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z ** 2 / (4 * trials ** 2)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def _get_exact_estimate(rpm_info_list):
+    count = len(rpm_info_list)
+    size = sum([i["size"] for i in rpm_info_list])
+    return {"count": (count, count, count), "bytes": (size, size, size)}
+
+
+def _get_sample_estimate(matched, sample, population, z, complete=False):
+    """
+    Extrapolate count and bytes of RPMs matched in a sample to the population.
+
+    The sample is the whole population if complete is set, the result is exact then.
+    """
+    if not sample:
+        return {"count": (0, 0, 0), "bytes": (0, 0, 0)}
+    if complete:
+        low = high = float(len(matched)) / len(sample)
+    else:
+        low, high = _wilson_interval(len(matched), len(sample), z)
+    proportion = float(len(matched)) / len(sample)
+    # bytes are the count times mean size of matched RPMs (of all sampled RPMs if none matched)
+    items = matched or sample
+    mean_size = float(sum([i["size"] for i in items])) / len(items)
+    count = tuple([i * population for i in (proportion, low, high)])
+    return {"count": count, "bytes": tuple([i * mean_size for i in count])}
+
+
+def _get_srpm_first_priority(rpm_info):
+    """
+    Return 0 for SRPMs, 2 for debuginfo and debugsource RPMs, 1 otherwise.
+    """
+    if rpm_info["arch"] == "src":
+        return 0
+    if rpm_info["name"].endswith("-debuginfo") or rpm_info["name"].endswith("-debugsource") or "-debuginfo-" in rpm_info["name"]:
+        return 2
+    return 1
+
+
+# sort keys for KojiSignRPMs.sort_rpm_info_list_by_priority(); lower values go first
+PRIORITIES = {
+    "noarch": lambda rpm_info: rpm_info["arch"] != "noarch",
+    "smallest": lambda rpm_info: rpm_info["size"],
+    "srpm-first": _get_srpm_first_priority,
+}
+
+
+class AdaptiveChunker(object):
+    """
+    Chunk size limits adapted to measured duration of signing chunks.
+
+    Chunks grow when they're processed faster than target_time
+    and shrink when they take longer; at most twice or half at a time.
+    Size is also limited by free space in the temp directory or scratch directories.
+
+    :param target_time: Target duration of processing a chunk in seconds
+    :type  target_time: int=60
+    :param size: Initial size limit in MiB
+    :type  size: float=2
+    :param files: Initial file count limit
+    :type  files: int=20
+    :param min_size: Minimal size limit in MiB
+    :type  min_size: float=1
+    :param max_size: Maximal size limit in MiB
+    :type  max_size: float=2048
+    :param max_files: Maximal file count limit; keeps hub multicalls reasonably small
+    :type  max_files: int=200
+    :param temp_dir: Directory where chunks are copied to
+    :type  temp_dir: str=None
+    :param scratch: Scratch directories where chunks are copied to, overrides temp_dir
+    :type  scratch: releng_sop.koji_sign_scratch.ScratchDirs=None
+    :param logger: Custom logger
+    :type  logger: logging.Logger
+    """
+
+    def __init__(self, target_time=60, size=2, files=20, min_size=1, max_size=2048, max_files=200, temp_dir=None,  # noqa: D102
+                 scratch=None, logger=None):
+        self.target_time = target_time
+        self.size = size
+        self.files = files
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_files = max_files
+        self.temp_dir = temp_dir or tempfile.gettempdir()
+        self.scratch = scratch
+        self.logger = logger or get_logger(self, logging.INFO)
+
+    def _get_free_space(self):
+        """
+        Return free space in the temp directory in MiB.
+        """
+        if self.scratch:
+            return self.scratch.get_free_space()
+        stat = os.statvfs(self.temp_dir)
+        return float(stat.f_bavail * stat.f_frsize) / 1024 ** 2
+
+    def get_limits(self):
+        """
+        Return limits for the next chunk.
+
+        :return: (max_size, max_files), size in MiB
+        :rtype:  tuple
+        """
+        # leave a half of free space for other jobs
+        max_size = min(self.size, max(self._get_free_space() / 2, self.min_size))
+        return max_size, self.files
+
+    def record(self, rpm_info_chunk, timings):
+        """
+        Adapt limits to the duration of signing a chunk.
+
+        :param rpm_info_chunk: List of koji rpm_info dictionaries
+        :type  rpm_info_chunk: list
+        :param timings: Duration of stages in seconds, as returned by KojiSignRPMs.sign_chunk()
+        :type  timings: dict
+        """
+        duration = sum(timings.values())
+        if not rpm_info_chunk or duration <= 0:
+            return
+
+        size = float(sum([i["size"] for i in rpm_info_chunk])) / 1024 ** 2
+        factor = min(max(float(self.target_time) / duration, 0.5), 2.0)
+        self.size = min(max(size * factor, self.min_size), self.max_size)
+        self.files = min(max(int(round(len(rpm_info_chunk) * factor)), 1), self.max_files)
+
+        stages = ", ".join(["%s %.1fs" % (i, timings[i]) for i in sorted(timings)])
+        self.logger.info("Chunk of %s RPMs (%.1f MiB) took %.1fs (%s); next chunk limits: %.1f MiB, %s RPMs"
+                         % (len(rpm_info_chunk), size, duration, stages, self.size, self.files))
+
+
+class RPMPrefetcher(object):
+    """
+    Read ahead RPMs in a background thread, so copies to temp don't start cold.
+
+    Files are prefetched in given order with posix_fadvise(WILLNEED),
+    or by reading them if it's not available (python 2).
+    Prefetched files that haven't been consumed yet must fit into the budget;
+    copying a file marks it and all files before it as consumed.
+
+    :param items: List of (path, size) in the order the files are going to be read
+    :type  items: list
+    :param budget: Maximal size of prefetched, not consumed files in MiB
+    :type  budget: int=512
+    :param logger: Custom logger
+    :type  logger: logging.Logger
+    """
+
+    def __init__(self, items, budget=512, logger=None):  # noqa: D102
+        self.items = items
+        self.budget = budget * 1024 ** 2
+        self.logger = logger or get_logger(self, logging.INFO)
+        self.prefetched = 0
+
+        self._index = {}
+        self._offsets = [0]
+        for num, (path, size) in enumerate(self.items):
+            self._index.setdefault(path, num)
+            self._offsets.append(self._offsets[-1] + size)
+        self._read_idx = 0
+        self._consume_idx = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, name="RPMPrefetcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _next(self):
+        """
+        Wait until the next file fits into the budget, return its path or None when finished.
+        """
+        with self._cond:
+            while not self._closed:
+                # skip files that were consumed before we got to them
+                self._read_idx = max(self._read_idx, self._consume_idx)
+                if self._read_idx >= len(self.items):
+                    return None
+                size = self._offsets[self._read_idx + 1] - self._offsets[self._consume_idx]
+                # always allow the next file to be read, even if it doesn't fit into the budget
+                if self._read_idx == self._consume_idx or size <= self.budget:
+                    path = self.items[self._read_idx][0]
+                    self._read_idx += 1
+                    return path
+                self._cond.wait()
+            return None
+
+    def _fetch(self, path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                else:
+                    while os.read(fd, 1024 ** 2):
+                        pass
+            finally:
+                os.close(fd)
+        except OSError as ex:
+            # prefetching is just an optimization, copying the file reports the error
+            self.logger.debug("Couldn't prefetch %s: %s" % (path, ex))
+            return
+        self.prefetched += 1
+
+    def _run(self):
+        while True:
+            path = self._next()
+            if path is None:
+                return
+            self._fetch(path)
+
+    def consumed(self, path):
+        """
+        Mark a file and all files before it as consumed, freeing the budget.
+
+        :param path: Path to a file
+        :type  path: str
+        """
+        num = self._index.get(path)
+        if num is None:
+            return
+        with self._cond:
+            self._consume_idx = max(self._consume_idx, num + 1)
+            self._cond.notify()
+
+    def close(self):
+        """
+        Stop prefetching.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.logger.debug("Prefetched RPMs: %s/%s" % (self.prefetched, len(self.items)))
+
+
+class RPMSigPrefetcher(object):
+    """
+    Query signatures of RPMs in a background thread while the RPMs are still being listed.
+
+    A failed query isn't fatal, RPMs that weren't prefetched are left to the caller.
+
+    :param koji_session: Koji session not used by other threads
+    :type  koji_session: koji.ClientSession
+    :param logger: Custom logger
+    :type  logger: logging.Logger
+    :param metrics: Metrics, queries are recorded in 'sig_query' stage
+    :type  metrics: releng_sop.koji_sign_metrics.SignMetrics
+    """
+
+    def __init__(self, koji_session, logger=None, metrics=None):  # noqa: D102
+        self.koji_session = koji_session
+        self.logger = logger or get_logger(self, logging.INFO)
+        self.metrics = metrics or SignMetrics()
+        self.rpm_sig_dict = {}
+        self.rpm_ids = set()
+        self.error = None
+        self._queue = queue.Queue()
+
+        self._thread = threading.Thread(target=self._run, name="RPMSigPrefetcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add(self, rpm_info_list):
+        """
+        Queue RPMs for querying signatures.
+
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        """
+        self._queue.put(rpm_info_list)
+
+    def _run(self):
+        while True:
+            rpm_info_list = self._queue.get()
+            if rpm_info_list is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                with self.metrics.stage("sig_query", rpm_info_list):
+                    self.metrics.rpc()
+                    self.rpm_sig_dict.update(_query_rpm_sig_dict(self.koji_session, rpm_info_list))
+            except Exception as ex:
+                self.logger.debug("Couldn't prefetch signatures: %s" % ex)
+                self.error = ex
+                continue
+            self.rpm_ids.update([i["id"] for i in rpm_info_list])
+
+    def get(self, rpm_info_list):
+        """
+        Wait for queued queries and return prefetched signatures.
+
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :return: ({rpm_id: {sigkey: sighash}}, rpm_info_list that wasn't prefetched)
+        :rtype:  tuple
+        """
+        self.close()
+
+        result = {}
+        missing = []
+        for rpm_info in rpm_info_list:
+            rpm_id = rpm_info["id"]
+            if rpm_id not in self.rpm_ids:
+                missing.append(rpm_info)
+            elif rpm_id in self.rpm_sig_dict:
+                result[rpm_id] = self.rpm_sig_dict[rpm_id]
+        self.logger.debug("Prefetched signatures of RPMs: %s/%s" % (len(rpm_info_list) - len(missing), len(rpm_info_list)))
+        return result, missing
+
+    def close(self):
+        """
+        Finish queued queries and stop the thread.
+        """
+        if not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join()
+
+
+def _stream_koji_session(koji_session):
+    """
+    Wrap reading XML-RPC responses of a koji session once, so a call can be read by a custom reader.
+
+    Readers are per thread, calls of other threads sharing the session are read by koji as usual.
+
+    :return: Thread local object; set its 'reader' to a callable(response) for one call and reset it to None
+    :rtype:  threading.local
+    """
+    readers = getattr(koji_session, "_streamed_readers", None)
+    if readers is not None:
+        return readers
+
+    read_xmlrpc_response = koji_session._read_xmlrpc_response
+    readers = threading.local()
+
+    def _read_xmlrpc_response(response, *args, **kwargs):
+        reader = getattr(readers, "reader", None)
+        if reader is None:
+            return read_xmlrpc_response(response, *args, **kwargs)
+        return reader(response)
+
+    koji_session._read_xmlrpc_response = _read_xmlrpc_response
+    koji_session._streamed_readers = readers
+    return readers
+
+
+def _trace_koji_session(koji_session):
+    """
+    Record each RPC of a koji session as a span of the command trace; a multicall is one span.
+    """
+    call_method = koji_session._callMethod
+
+    def _callMethod(name, args, *rest, **kwargs):
+        if getattr(koji_session, "multicall", False):
+            # queued for a multicall
+            return call_method(name, args, *rest, **kwargs)
+        span_name = name
+        span_args = {}
+        if name == "multiCall" and args and isinstance(args[0], (list, tuple)):
+            span_name = "multiCall:%s" % "+".join(sorted(set([i.get("methodName", "?") for i in args[0]])))
+            span_args["calls"] = len(args[0])
+        with span(span_name, "koji", **span_args):
+            return call_method(name, args, *rest, **kwargs)
+
+    koji_session._callMethod = _callMethod
+    return koji_session
+
+
+def _query_rpm_sig_dict(koji_session, rpm_info_list):
+    """
+    Query cached signatures of RPMs in one multicall.
+
+    :param koji_session: Koji session
+    :type  koji_session: koji.ClientSession
+    :param rpm_info_list: List of koji rpm_info dictionaries
+    :type  rpm_info_list: list
+    :return: {rpm_id: {sigkey: sighash}}
+    :rtype:  dict
+    """
+    result = {}
+
+    koji_session.multicall = True
+    for rpm_info in rpm_info_list:
+        koji_session.queryRPMSigs(rpm_info["id"])
+    data = koji_session.multiCall(strict=True)
+
+    for [sig_list] in data:
+        for sig in sig_list:
+            rpm_id = sig["rpm_id"]
+            sigkey = sig["sigkey"].lower()
+            sighash = sig["sighash"]
+            result.setdefault(rpm_id, {})[sigkey] = sighash
+    return result
+
+
+class _ResponseReader(object):
+    """
+    File-like object reading content of a requests response as it is received.
+    """
+
+    def __init__(self, response, chunk_size=64 * 1024):  # noqa: D102
+        self._chunks = response.iter_content(chunk_size)
+        self._buffer = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        result, self._buffer = self._buffer[:size], self._buffer[size:]
+        return result
+
+
+def _iter_xmlrpc_response_structs(f, keys):
+    """
+    Parse XML-RPC response with a list of lists of structs as it is read.
+
+    Processed structs are dropped from the parsed tree, so the whole response is never in memory.
+    Only scalar values are decoded, other values (structs, arrays, dates) are None.
+
+    :param f: File-like object with the response
+    :type  f: file
+    :param keys: Tuple of struct keys to keep for each list
+    :type  keys: tuple
+    :return: Iterator of (index of the list, struct dict)
+    :rtype:  iterator
+    :raises xmlrpc_client.Fault: if the response is a fault
+    """
+    array_depth = 0
+    struct_depth = 0
+    num = -1
+    fault = False
+    data_elem = None
+
+    for event, elem in ElementTree.iterparse(f, events=("start", "end")):
+        if event == "start":
+            if elem.tag == "array":
+                array_depth += 1
+                if array_depth == 2:
+                    num += 1
+            elif elem.tag == "struct":
+                struct_depth += 1
+            elif elem.tag == "data" and array_depth == 2 and not struct_depth:
+                data_elem = elem
+            elif elem.tag == "fault":
+                fault = True
+            continue
+
+        if elem.tag == "array":
+            array_depth -= 1
+        elif elem.tag == "struct":
+            struct_depth -= 1
+            if struct_depth:
+                continue
+            if fault:
+                data = _decode_xmlrpc_struct(elem, ("faultCode", "faultString"))
+                raise xmlrpc_client.Fault(data.get("faultCode"), data.get("faultString"))
+            if array_depth == 2 and num < len(keys):
+                yield num, _decode_xmlrpc_struct(elem, keys[num])
+                data_elem.clear()
+
+
+def _decode_xmlrpc_struct(elem, keys):
+    result = {}
+    for member in elem.findall("member"):
+        name = member.findtext("name")
+        if name in keys:
+            result[name] = _decode_xmlrpc_value(member.find("value"))
+    return result
+
+
+def _decode_xmlrpc_value(elem):
+    if not len(elem):
+        # string is the default type
+        return elem.text or ""
+    child = elem[0]
+    # strip namespace of extension types (ex:nil, ex:i8)
+    tag = child.tag.rsplit("}", 1)[-1]
+    text = child.text or ""
+    if tag in ("int", "i4", "i8"):
+        return int(text)
+    if tag == "string":
+        return text
+    if tag == "boolean":
+        return text.strip() == "1"
+    if tag == "double":
+        return float(text)
+    return None
+
+
+def _read_main_copy_sigkey(task):
+    """
+    Read sigkey of a main copy in a worker process.
+
+    :param task: (rpm_id, path, sigkeys)
+    :type  task: tuple
+    :return: (rpm_id, sigkey, sighdr if signed with one of the sigkeys or None)
+    :rtype:  tuple
+    """
+    rpm_id, path, sigkeys = task
+    try:
+        sighdr = koji.rip_rpm_sighdr(path)
+        sigkey = _get_sighdr_sigkey(sighdr)
+    except Exception:
+        return rpm_id, None, None
+    if sigkey not in sigkeys:
+        # don't send headers of unsigned RPMs back, they're not needed
+        return rpm_id, sigkey, None
+    return rpm_id, sigkey, sighdr
+
+
+def _get_sighdr_sigkey(sighdr):
+    """
+    Return sigkey of a signature header.
+
+    :param sighdr: Signature header
+    :type  sighdr: bytes
+    :return: Lowercase sigkey, empty string for unsigned RPMs
+    :rtype:  str
+    """
+    rawhdr = koji.RawHeader(sighdr)
+
+    sigpkt = rawhdr.get(koji.RPM_SIGTAG_GPG)
+    if not sigpkt:
+        sigpkt = rawhdr.get(koji.RPM_SIGTAG_PGP)
+
+    sigkey = ""
+    if sigpkt:
+        sigkey = koji.get_sigpacket_key_id(sigpkt)
+    return sigkey.lower()
+
+
+def _copy_file_range(src, dst, offset, count, bufsize=1024 ** 2):
+    """
+    Copy count bytes from offset in src to the current position in dst.
+
+    Use zero-copy os.copy_file_range() where available,
+    fall back to buffered copy otherwise.
+
+    :param src: Source file object
+    :type  src: file
+    :param dst: Destination file object (flushed)
+    :type  dst: file
+    :param offset: Offset in src
+    :type  offset: int
+    :param count: Number of bytes to copy
+    :type  count: int
+    """
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range:
+        dst_offset = dst.tell()
+        copied = 0
+        while copied < count:
+            try:
+                result = copy_file_range(src.fileno(), dst.fileno(), count - copied, offset + copied, dst_offset + copied)
+            except OSError as ex:
+                # cross-device copy or unsupported file system; nothing written yet
+                if copied == 0 and ex.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                    break
+                raise
+            if not result:
+                raise IOError("Unexpected end of file: %s" % src.name)
+            copied += result
+        if copied:
+            dst.seek(dst_offset + copied)
+            return
+
+    src.seek(offset)
+    while count > 0:
+        buf = src.read(min(bufsize, count))
+        if not buf:
+            raise IOError("Unexpected end of file: %s" % src.name)
+        dst.write(buf)
+        count -= len(buf)
 
 
 def get_gpg_name(sigkey, gnupghome=None):
@@ -639,31 +2163,92 @@ def get_gpg_name(sigkey, gnupghome=None):
     # gpg --gen-key
     # gpg --list-keys
 
+    keyring_mtime = _get_keyring_mtime(gnupghome)
+
+    with _GPG_NAME_CACHE_LOCK:
+        cached_mtime, index = _GPG_NAME_CACHE.get(gnupghome, (None, None))
+        if index is None or cached_mtime != keyring_mtime:
+            # listing keys spawns gpg; do it once per keyring change
+            index = _get_gpg_name_index(gnupghome)
+            _GPG_NAME_CACHE[gnupghome] = (keyring_mtime, index)
+
+    return index.get(sigkey.lower())
+
+
+# {gnupghome: (keyring_mtime, {keyid: uid})}
+_GPG_NAME_CACHE = {}
+_GPG_NAME_CACHE_LOCK = threading.Lock()
+
+# public keyring files of gnupg 1.x, 2.1+ and 2.4+ (keyboxd)
+KEYRING_FILES = ("pubring.gpg", "pubring.kbx", os.path.join("public-keys.d", "pubring.db"))
+
+
+def _get_keyring_mtime(gnupghome=None):
+    """
+    Return modification times of public keyring files in a GNUPG home directory.
+
+    :param gnupghome: Path to GNUPG home directory
+    :type  gnupghome: str=None
+    :return: ((file name, mtime), ...) for existing keyring files
+    :rtype:  tuple
+    """
+    if not gnupghome:
+        gnupghome = os.environ.get("GNUPGHOME") or os.path.expanduser("~/.gnupg")
+
+    result = []
+    for fn in KEYRING_FILES:
+        try:
+            result.append((fn, os.stat(os.path.join(gnupghome, fn)).st_mtime))
+        except OSError:
+            continue
+    return tuple(result)
+
+
+def _get_gpg_name_index(gnupghome=None):
+    """
+    Read public keys and return {keyid: uid} index.
+
+    :param gnupghome: Path to GNUPG home directory
+    :type  gnupghome: str=None
+    :return: {keyid: uid} with short (8 chars) lowercase key IDs
+    :rtype:  dict
+    """
     import gnupg
 
     gpg = gnupg.GPG(gnupghome=gnupghome)
     public_keys = gpg.list_keys()
 
-    sigkey = sigkey.lower()
+    result = {}
     for i in public_keys:
         keyid = i["keyid"][-8:].lower()
-        if keyid == sigkey:
-            return i["uids"][0]
-    return None
+        # keep the first match, the same as a linear lookup would
+        result.setdefault(keyid, i["uids"][0])
+    return result
 
 
 class LocalRPMSign(object):
+    """
+    Sign RPMs with 'rpm --resign' using keys from the local GNUPG keyring.
+
+    One 'rpm' process is spawned for each chunk of RPMs.
+
+    :param gnupghome: Path to GNUPG home directory, the default keyring if not set
+    :type  gnupghome: str=None
+    """
+
+    def __init__(self, gnupghome=None):  # noqa: D102
+        self.gnupghome = gnupghome
+
     def _sigkey_to_gpg_name(self, sigkey):
         """
         Convert sigkey to _gpg_name for RPM signing.
 
-        Override this method if you want to change 'gnupghome'
-        or if maintain the mappings manually
+        Override this method if you want to maintain the mappings manually.
 
         :param sigkey: Sigkey ID (hash)
         :type  sigkey: str
         """
-        return get_gpg_name(sigkey)
+        return get_gpg_name(sigkey, gnupghome=self.gnupghome)
 
     def _get_cmd(self, sigkey, paths):
         """
@@ -677,6 +2262,9 @@ class LocalRPMSign(object):
         gpg_name = self._sigkey_to_gpg_name(sigkey)
         cmd = ["rpm"]
         cmd.extend(["--define", "_gpg_name %s" % gpg_name])
+        if self.gnupghome:
+            # rpm runs gpg with GNUPGHOME set to _gpg_path
+            cmd.extend(["--define", "_gpg_path %s" % self.gnupghome])
         cmd.extend(["--resign"])
         cmd.extend(paths)
         return cmd
@@ -691,7 +2279,49 @@ class LocalRPMSign(object):
         :type  paths: str
         """
         cmd = self._get_cmd(sigkey, paths)
-        return subprocess.check_call(cmd)
+        with span("rpm --resign", "subprocess", sigkey=sigkey, rpms=len(paths)):
+            return subprocess.check_call(cmd)
+
+
+class LibRPMSign(LocalRPMSign):
+    """
+    Sign RPMs in-process with rpm python bindings (librpmsign).
+
+    Unlike LocalRPMSign, no 'rpm' process is spawned per chunk,
+    which saves process startup and RPM database initialization.
+    Select it by setting 'rpmsign_class' to 'releng_sop.koji_sign.LibRPMSign'.
+    """
+
+    def _get_add_sign(self):
+        """
+        Return addSign() function from rpm python bindings, set up to use self.gnupghome.
+        """
+        try:
+            # rpm >= 4.13 exposes librpmsign in a separate module
+            from rpm._rpms import addSign
+        except ImportError:
+            raise Error("librpmsign not available: LibRPMSign requires rpm python bindings >= 4.13 (rpm._rpms)")
+        if self.gnupghome:
+            import rpm
+            rpm.addMacro("_gpg_path", self.gnupghome)
+        return addSign
+
+    def sign(self, sigkey, paths):
+        """
+        Sign RPMs in specified paths with a sigkey.
+
+        :param sigkey: Sigkey ID (hash)
+        :type  sigkey: str
+        :param paths: Paths to RPMs to be signed
+        :type  paths: str
+        """
+        add_sign = self._get_add_sign()
+        gpg_name = self._sigkey_to_gpg_name(sigkey)
+        with span("librpmsign", "rpmsign", sigkey=sigkey, rpms=len(paths)):
+            for path in paths:
+                # addSign() sets _gpg_name macro to keyid, the same as --define in LocalRPMSign
+                if not add_sign(path, gpg_name):
+                    raise Error("Failed to sign RPM with '%s': %s" % (sigkey, path))
 
 
 def get_rpmsign_class(env):
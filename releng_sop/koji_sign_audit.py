@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Report signing status of RPMs in a release tag.
+
+This is a read-only command, nothing is signed or written.
+For each package and arch it counts RPMs in these categories,
+each RPM is counted in exactly one of them, so they add up to the total:
+
+* **signed** - signed copy on disk
+* **cached** - signature cached in koji (sigcache), no signed copy yet; it would be written from sigcache
+* **signed_main** - signature cached in koji, no signed copy, main copy signed with one of the sigkeys;
+  it would be imported from the main copy
+* **unsigned** - no cached signature; it would be signed
+
+Like KojiSignRPMs.sign(), only RPMs with cached signatures are checked for signed copies and main copies:
+koji caches signatures of RPMs imported signed and writes signed copies only from sigcache.
+"""
+
+
+from __future__ import print_function
+from __future__ import unicode_literals
+import sys
+
+import argparse
+import csv
+import json
+import logging
+
+from .common import Environment, Release, Error
+from .koji_sign import KojiSignRPMs
+from .koji_sign_rpms_in_release import KojiSignRPMsInRelease
+
+
+AUDIT_FIELDS = ["package", "arch", "total", "signed", "cached", "signed_main", "unsigned"]
+
+
+class KojiSignAudit(KojiSignRPMsInRelease):
+    """
+    Report signing status of RPMs in a release.
+
+    :param env: Environment object.
+    :type  env: releng_sop.common.Environment
+    :param release: Release object.
+    :type  release: releng_sop.common.Release
+    :param level: Signing level: 'beta' or 'gold'
+    :type  level: str
+    :param packages: List of packages to be audited (optional).
+    :type  packages: list=None
+    :param threads: Number of threads for file system lookups.
+    :type  threads: int=50
+    """
+
+    def __init__(self, env, release, level, packages=None, threads=50):  # noqa: D102
+        super(KojiSignAudit, self).__init__(env, release, level, packages=packages)
+        self.threads = threads
+
+    def details(self, commit=False):
+        """
+        Return details about command execution.
+
+        :returns: List of text lines with command execution details
+        :rtype:   list
+        """
+        result = [
+            "Auditing signed RPMs in a release",
+            " * env name:                %s" % self.env.name,
+            " * env config:              %s" % self.env.config_path,
+            " * release source:          %s" % self.release.config_path,
+            " * koji profile:            %s" % self.env["koji_profile"],
+            " * release_id:              %s" % self.release_id,
+            " * tag:                     %s" % self.koji_tag,
+            " * level:                   %s" % self.level,
+            " * sigkeys:                 %s" % ", ".join(self.sigkeys),
+            " * threads:                 %s" % self.threads,
+        ]
+        if self.packages:
+            result += [" * packages:"]
+            for i in self.packages:
+                result += ["     - %s" % i]
+        return result
+
+    def audit(self, sign, rpm_info_list):
+        """
+        Count RPMs in each signing category per package and arch, each RPM in one category.
+
+        :param sign: KojiSignRPMs object
+        :type  sign: releng_sop.koji_sign.KojiSignRPMs
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :return: List of rows (dicts with AUDIT_FIELDS keys) sorted by package and arch
+        :rtype:  list
+        """
+        sign.logger.info("Reading known package signatures from koji")
+        rpm_sig_dict = sign.get_rpm_sig_dict(rpm_info_list)
+        cached, _ = sign.find_cached(rpm_info_list, rpm_sig_dict, self.sigkeys)
+
+        sign.logger.info("Looking for signed copies")
+        signed, not_signed = sign.find_signed_rpms(cached, self.sigkeys)
+
+        sign.logger.info("Looking for signed main copies")
+        if not_signed:
+            signed_main, cached_only = sign.find_signed_rpms_in_main_copies(not_signed, self.sigkeys)
+        else:
+            signed_main, cached_only = [], []
+
+        # {rpm_id: category}, RPMs without a category are unsigned
+        categories = {}
+        for category, category_rpm_info_list in [("signed", signed), ("cached", cached_only), ("signed_main", signed_main)]:
+            for i in category_rpm_info_list:
+                categories[i["id"]] = category
+
+        rows = {}
+        for rpm_info in rpm_info_list:
+            key = (rpm_info["build"]["name"], rpm_info["arch"])
+            row = rows.get(key)
+            if row is None:
+                row = dict([(i, 0) for i in AUDIT_FIELDS])
+                row["package"], row["arch"] = key
+                rows[key] = row
+
+            row["total"] += 1
+            row[categories.get(rpm_info["id"], "unsigned")] += 1
+
+        return [rows[i] for i in sorted(rows)]
+
+    def run(self, output=None, output_format="json"):
+        """
+        Print command details, run the audit and write the report.
+
+        :param output: File object to write the report to, stdout by default.
+        :type  output: file
+        :param output_format: Report format: 'json' or 'csv'
+        :type  output_format: str
+        :returns: Report rows
+        :rtype:   list
+        """
+        output = output or sys.stdout
+        sign = KojiSignRPMs(self.env["koji_profile"], None, log_level=logging.INFO, threads=self.threads)
+
+        for i in self.details():
+            sign.logger.info(i)
+
+        sign.logger.info("Reading RPM information from koji")
+        rpm_info_list = sign.get_latest_tagged_rpms(self.koji_tag)
+        if self.packages:
+            rpm_info_list = sign.filter_rpm_info_list_by_packages(rpm_info_list, self.packages)
+
+        rows = self.audit(sign, rpm_info_list)
+        write_report(rows, output, output_format)
+        return rows
+
+
+def write_report(rows, output, output_format="json"):
+    """
+    Write audit report in JSON or CSV format.
+
+    A summary row with package and arch set to '*' is appended.
+
+    :param rows: Rows returned by KojiSignAudit.audit()
+    :type  rows: list
+    :param output: File object to write the report to
+    :type  output: file
+    :param output_format: Report format: 'json' or 'csv'
+    :type  output_format: str
+    """
+    total = dict([(i, sum([row[i] for row in rows])) for i in AUDIT_FIELDS[2:]])
+    total["package"] = "*"
+    total["arch"] = "*"
+    rows = rows + [total]
+
+    if output_format == "json":
+        json.dump(rows, output, indent=2, sort_keys=True)
+        output.write("\n")
+    elif output_format == "csv":
+        writer = csv.DictWriter(output, AUDIT_FIELDS, lineterminator="\n")
+        writer.writerow(dict([(i, i) for i in AUDIT_FIELDS]))
+        writer.writerows(rows)
+    else:
+        raise ValueError("Unknown output format: %s" % output_format)
+
+
+def get_parser():
+    """
+    Construct argument parser.
+
+    :returns: ArgumentParser object with arguments set up.
+    :rtype:   argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description="Report signing status of RPMs in a koji tag that maps to given release.")
+    parser.add_argument(
+        "release_id",
+        metavar="RELEASE_ID",
+        help="PDC release ID, for example 'fedora-24', 'fedora-24-updates'.",
+    )
+    parser.add_argument(
+        "level",
+        choices=["beta", "gold"],
+        help="Signature level. Allowed values: beta, gold.",
+    )
+    parser.add_argument(
+        "--package",
+        dest="packages",
+        action="append",
+        help="Specify packages to be audited",
+    )
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        choices=["json", "csv"],
+        default="json",
+        help="Report format. Allowed values: json, csv.",
+    )
+    parser.add_argument(
+        "--output",
+        help="Write the report to a file instead of stdout.",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=50,
+        help="Number of threads for file system lookups.",
+    )
+    parser.add_argument(
+        "--env",
+        default="default",
+        help="Select environment in which the program will run.",
+    )
+    parser.add_argument(
+        "-d", "--debug",
+        action="store_true",
+        help="Print traceback for exceptions. By default only exception messages are displayed.",
+    )
+    return parser
+
+
+def main():
+    """
+    Main function.
+    """
+    try:
+        parser = get_parser()
+        args = parser.parse_args()
+        env = Environment(args.env)
+        release = Release(args.release_id)
+        audit = KojiSignAudit(env, release, args.level, packages=args.packages, threads=args.threads)
+        if args.output:
+            with open(args.output, "w") as f:
+                audit.run(output=f, output_format=args.output_format)
+        else:
+            audit.run(output_format=args.output_format)
+
+    except Error:
+        if not args.debug:
+            sys.tracebacklimit = 0
+        raise
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Leases of RPMs being signed, shared by signing jobs.
+
+A lease is a lock file in a directory shared by all signing jobs
+(it must be shared by all hosts running them, e.g. on NFS).
+The file is created with O_EXCL and holds the holder (host:pid)
+and an expiration time.
+
+A lease held by a crashed job is considered stale and it's broken when:
+
+* it's expired
+* the holder runs on the same host and its process doesn't exist anymore
+
+A job renews its leases while signing (see SignLeases.renewing()),
+so only leases of crashed or stuck jobs expire.
+A stale lease is renamed aside atomically before it's removed,
+so only one job breaks it and a lease renewed meanwhile is put back.
+If another job acquired the lease before it was put back, the lease is lost:
+its holder finds out when renewing it and stops signing the RPMs.
+"""
+
+
+from __future__ import print_function
+
+import errno
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from contextlib import contextmanager
+
+from .common import get_logger, Error
+
+
+__all__ = (
+    "LeaseLostError",
+    "SignLeases",
+)
+
+
+class LeaseLostError(Error):
+    """
+    Leases held by this job were acquired by another job.
+    """
+
+    pass
+
+
+class SignLeases(object):
+    """
+    Directory of lock files leasing RPMs to a signing job.
+
+    :param path: Path to a lease directory shared by signing jobs
+    :type  path: str
+    :param ttl: Lease expiration in seconds; leases are renewed every ttl/3 seconds while signing
+    :type  ttl: int=3600
+    :param logger: Custom logger
+    :type  logger: logging.Logger
+    :param log_level: Log level for default logger (when logger is not set)
+    :type  log_level: int
+    """
+
+    def __init__(self, path, ttl=3600, logger=None, log_level=logging.INFO):  # noqa: D102
+        self.path = path
+        self.ttl = ttl
+        self.hostname = socket.gethostname()
+        self.holder = "%s:%s" % (self.hostname, os.getpid())
+        self.logger = logger or get_logger(self, log_level)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def _get_path(self, key):
+        return os.path.join(self.path, "%s.lease" % key)
+
+    def _read(self, path):
+        """
+        Read lease data, return None if the lease doesn't exist.
+        """
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (IOError, OSError) as ex:
+            if ex.errno == errno.ENOENT:
+                return None
+            raise
+        except ValueError:
+            # the holder hasn't written the data yet or it crashed meanwhile
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError as ex:
+                if ex.errno == errno.ENOENT:
+                    return None
+                raise
+            return {"holder": "unknown:0", "expires": mtime + self.ttl}
+
+    def _is_stale(self, data):
+        """
+        Determine if a lease is expired or held by a dead process on this host.
+        """
+        if data["expires"] < time.time():
+            return True
+        hostname, pid = data["holder"].rsplit(":", 1)
+        if hostname != self.hostname:
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except OSError as ex:
+            return ex.errno == errno.ESRCH
+        return False
+
+    def _break(self, path, data):
+        """
+        Remove a stale lease, unless it was renewed or re-acquired by another job meanwhile.
+
+        The lease is renamed aside first, the rename is atomic, so only one job gets it.
+        The renamed lease is checked again, because it could have changed
+        since it was read; a lease that isn't stale anymore is put back.
+        Another job could have acquired the lease before it was put back,
+        then the renewed lease is lost and its holder stops renewing it (see renewing()).
+        """
+        stale_path = "%s.stale.%s" % (path, self.holder)
+        try:
+            os.rename(path, stale_path)
+        except OSError as ex:
+            if ex.errno == errno.ENOENT:
+                # broken or released by another job meanwhile
+                return
+            raise
+
+        try:
+            current = self._read(stale_path)
+            if current is not None and not self._is_stale(current):
+                self.logger.info("Lease of %s was renewed meanwhile, keeping it: %s" % (current["holder"], path))
+                try:
+                    os.link(stale_path, path)
+                except OSError as ex:
+                    if ex.errno != errno.EEXIST:
+                        raise
+                    self.logger.warning("Lease of %s is lost, it was acquired by another job meanwhile: %s"
+                                        % (current["holder"], path))
+            elif current is not None:
+                self.logger.warning("Breaking stale lease of %s: %s" % (current["holder"], path))
+        finally:
+            os.remove(stale_path)
+
+    def acquire(self, key):
+        """
+        Acquire a lease.
+
+        :param key: Lease key, e.g. '<rpm_id>.<sigkey>'
+        :type  key: str
+        :return: True if the lease was acquired, False if it's held by another job
+        :rtype:  bool
+        """
+        path = self._get_path(key)
+        for _ in range(3):
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except OSError as ex:
+                if ex.errno != errno.EEXIST:
+                    raise
+                data = self._read(path)
+                if data is None:
+                    # released meanwhile
+                    continue
+                if not self._is_stale(data):
+                    return False
+                self._break(path, data)
+                continue
+
+            data = {"holder": self.holder, "expires": time.time() + self.ttl}
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            return True
+        return False
+
+    def release(self, key):
+        """
+        Release a lease held by this job.
+
+        :param key: Lease key
+        :type  key: str
+        """
+        path = self._get_path(key)
+        data = self._read(path)
+        if data is None or data["holder"] != self.holder:
+            self.logger.warning("Lease is not held by this job: %s" % path)
+            return
+        os.remove(path)
+
+    def renew(self, key):
+        """
+        Extend expiration of a lease held by this job.
+
+        The lease is replaced atomically, other jobs never read a partially written lease.
+
+        :param key: Lease key
+        :type  key: str
+        :return: False if the lease isn't held by this job anymore
+        :rtype:  bool
+        """
+        path = self._get_path(key)
+        data = self._read(path)
+        if data is None or data["holder"] != self.holder:
+            self.logger.warning("Lease is not held by this job, can't renew it: %s" % path)
+            return False
+        data["expires"] = time.time() + self.ttl
+        temp_path = "%s.renew.%s" % (path, self.holder)
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.rename(temp_path, path)
+        return True
+
+    def check(self, keys):
+        """
+        Make sure leases are still held by this job.
+
+        :param keys: List of lease keys
+        :type  keys: list
+        :raises LeaseLostError: if any lease is not held by this job anymore
+        """
+        lost = []
+        for key in keys:
+            data = self._read(self._get_path(key))
+            if data is None or data["holder"] != self.holder:
+                lost.append(key)
+        if lost:
+            raise LeaseLostError("Leases were lost to other jobs: %s" % ", ".join(lost))
+
+    @contextmanager
+    def renewing(self, keys, interval=None):
+        """
+        Renew leases in a background thread until the context exits.
+
+        The context yields a function that raises LeaseLostError
+        once any of the leases is lost, the caller should call it
+        before each step that must not be done by two jobs.
+        Leases lost while the context was active raise LeaseLostError on exit.
+
+        :param keys: List of lease keys held by this job
+        :type  keys: list
+        :param interval: Renewal interval in seconds, ttl/3 by default
+        :type  interval: float=None
+        :rtype:  contextmanager
+        """
+        keys = list(keys)
+        if interval is None:
+            interval = self.ttl / 3.0
+        finished = threading.Event()
+        lost = []
+
+        def _renew():
+            while not finished.wait(interval):
+                for key in keys:
+                    if key in lost:
+                        continue
+                    try:
+                        if not self.renew(key):
+                            lost.append(key)
+                    except (IOError, OSError) as ex:
+                        # keep renewing other leases, this one expires eventually
+                        self.logger.warning("Renewing lease %s failed: %s" % (key, ex))
+
+        def _check():
+            if lost:
+                raise LeaseLostError("Leases were lost to other jobs: %s" % ", ".join(lost))
+            self.check(keys)
+
+        thread = threading.Thread(target=_renew, name="SignLeases")
+        thread.daemon = True
+        if keys:
+            thread.start()
+        try:
+            yield _check
+        finally:
+            finished.set()
+            if keys:
+                thread.join()
+        if lost:
+            raise LeaseLostError("Leases were lost to other jobs: %s" % ", ".join(lost))
+
+    def is_held(self, key):
+        """
+        Determine if a lease is held by any job.
+
+        :param key: Lease key
+        :type  key: str
+        :rtype:  bool
+        """
+        data = self._read(self._get_path(key))
+        return data is not None and not self._is_stale(data)
+
+    def acquire_many(self, keys):
+        """
+        Acquire as many leases as possible.
+
+        :param keys: List of lease keys
+        :type  keys: list
+        :return: (acquired, busy) lists of keys
+        :rtype:  tuple
+        """
+        acquired = []
+        busy = []
+        for key in keys:
+            if self.acquire(key):
+                acquired.append(key)
+            else:
+                busy.append(key)
+        return acquired, busy
+
+    def release_many(self, keys):
+        """
+        Release leases held by this job.
+
+        :param keys: List of lease keys
+        :type  keys: list
+        """
+        for key in keys:
+            self.release(key)
+
+    def wait(self, keys, interval=10, timeout=None):
+        """
+        Wait until leases are released by other jobs or become stale.
+
+        :param keys: List of lease keys
+        :type  keys: list
+        :param interval: Polling interval in seconds
+        :type  interval: int=10
+        :param timeout: Give up after timeout seconds, lease ttl by default
+        :type  timeout: int=None
+        :return: Keys of leases that are still held
+        :rtype:  list
+        """
+        if timeout is None:
+            timeout = self.ttl
+        deadline = time.time() + timeout
+        keys = list(keys)
+        while True:
+            keys = [i for i in keys if self.is_held(i)]
+            if not keys or time.time() >= deadline:
+                return keys
+            time.sleep(interval)
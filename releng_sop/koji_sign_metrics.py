@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Timing and throughput metrics of signing stages.
+
+Each stage of KojiSignRPMs records wall time, number of calls, RPMs, bytes and koji RPCs.
+Stages don't nest: a stage started in another stage (in the same thread) is accounted to the outer one.
+Stages running in several threads at once (chunks in a pipeline) add up their time.
+
+Stages of KojiSignRPMs.sign():
+
+* listing - listing RPMs of a tag
+* sig_query - reading cached signatures from koji
+* signed_check - looking for signed copies
+* main_scan - reading headers of main copies
+* sigcache_write - writing signed copies of RPMs with cached signatures
+* copy - copying RPMs to temp
+* sign - signing RPMs in temp
+* import - importing signatures to koji
+* write - writing signed copies of signed chunks
+* refresh - reading cached signatures again before signing
+
+Metrics can be written as JSON and as a file for Prometheus node_exporter textfile collector.
+Memory of stages is measured too if a memory profiler is set, see releng_sop.memprofile.
+Finished stage runs are reported to live progress if set, see releng_sop.koji_sign_progress.
+Stage runs, nested ones included, are spans of the command trace, see releng_sop.common.trace().
+"""
+
+
+from __future__ import print_function
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .common import span
+from .memprofile import phase
+
+
+__all__ = (
+    "SignMetrics",
+    "STAGES",
+)
+
+
+STAGES = ["listing", "sig_query", "signed_check", "main_scan", "sigcache_write", "copy", "sign", "import", "write", "refresh"]
+
+
+class _StageTimer(object):
+    """
+    Duration of a stage, available after the stage finishes.
+    """
+
+    def __init__(self):  # noqa: D102
+        self.duration = 0.0
+
+
+class SignMetrics(object):
+    """
+    Collect metrics of signing stages.
+
+    :param prefix: Prefix of Prometheus metric names
+    :type  prefix: str="releng_sop_sign"
+    :param memprofiler: Measure memory of stages (optional)
+    :type  memprofiler: releng_sop.memprofile.MemoryProfiler=None
+    :param progress: Report finished stage runs to live progress (optional)
+    :type  progress: releng_sop.koji_sign_progress.SignProgress=None
+    """
+
+    def __init__(self, prefix="releng_sop_sign", memprofiler=None, progress=None):  # noqa: D102
+        self.prefix = prefix
+        self.memprofiler = memprofiler
+        self.progress = progress
+        self.start_time = time.time()
+        self.stages = OrderedDict()
+        for name in STAGES:
+            self._get_stage(name)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_stage(self, name):
+        result = self.stages.get(name)
+        if result is None:
+            result = self.stages[name] = OrderedDict([
+                ("time", 0.0),
+                ("calls", 0),
+                ("items", 0),
+                ("bytes", 0),
+                ("rpcs", 0),
+            ])
+        return result
+
+    def add(self, name, duration=0.0, items=0, size=0, rpcs=0, calls=1):
+        """
+        Add measured values to a stage.
+
+        :param name: Stage name
+        :type  name: str
+        :param duration: Wall time in seconds
+        :type  duration: float
+        :param items: Number of processed RPMs
+        :type  items: int
+        :param size: Number of processed bytes
+        :type  size: int
+        :param rpcs: Number of koji RPCs
+        :type  rpcs: int
+        :param calls: Number of stage runs
+        :type  calls: int
+        """
+        with self._lock:
+            stage = self._get_stage(name)
+            stage["time"] += duration
+            stage["calls"] += calls
+            stage["items"] += items
+            stage["bytes"] += size
+            stage["rpcs"] += rpcs
+
+    @contextmanager
+    def stage(self, name, rpm_info_list=None, progress=True):
+        """
+        Measure a stage; RPMs and their sizes are counted from rpm_info_list.
+
+        :param name: Stage name
+        :type  name: str
+        :param rpm_info_list: List of koji rpm_info dictionaries processed in the stage
+        :type  rpm_info_list: list=None
+        :param progress: Report RPMs to progress when the stage finishes;
+                         disable it for long stages reporting each RPM as it's done
+        :type  progress: bool=True
+        :return: Context manager yielding an object with 'duration' set when the stage finishes
+        :rtype:  contextmanager
+        """
+        timer = _StageTimer()
+        rpm_info_list = rpm_info_list or []
+        if getattr(self._local, "stage", None) is not None:
+            # accounted to the outer stage
+            start = time.time()
+            with span(name, "stage", rpms=len(rpm_info_list)):
+                yield timer
+            timer.duration = time.time() - start
+            return
+
+        self._local.stage = name
+        start = time.time()
+        try:
+            with phase(self.memprofiler, name), span(name, "stage", rpms=len(rpm_info_list)):
+                yield timer
+        finally:
+            timer.duration = time.time() - start
+            self._local.stage = None
+            size = sum([i.get("size", 0) for i in rpm_info_list])
+            self.add(name, timer.duration, items=len(rpm_info_list), size=size)
+            if progress and self.progress is not None and rpm_info_list:
+                self.progress.update(name, items=len(rpm_info_list), size=size)
+
+    def rpc(self, count=1, name=None):
+        """
+        Count koji RPCs in the current stage of this thread.
+
+        :param count: Number of RPCs (a multicall is one RPC)
+        :type  count: int=1
+        :param name: Stage name, the current stage by default; RPCs outside stages are counted in 'other'
+        :type  name: str=None
+        """
+        name = name or getattr(self._local, "stage", None) or "other"
+        self.add(name, rpcs=count, calls=0)
+
+    def to_dict(self):
+        """
+        Return metrics as a dict.
+
+        :return: {"start_time": float, "time": float, "stages": {name: {"time", "calls", "items", "bytes", "rpcs", "throughput"}}}
+        :rtype:  dict
+        """
+        stages = OrderedDict()
+        with self._lock:
+            for name, stage in self.stages.items():
+                stage = OrderedDict(stage)
+                # bytes per second
+                stage["throughput"] = stage["bytes"] / stage["time"] if stage["time"] else 0.0
+                stages[name] = stage
+        return OrderedDict([
+            ("start_time", self.start_time),
+            ("time", time.time() - self.start_time),
+            ("stages", stages),
+        ])
+
+    def format(self):
+        """
+        Return a table of stages as text lines.
+
+        :return: List of text lines
+        :rtype:  list
+        """
+        result = ["%-16s %10s %8s %10s %12s %8s" % ("stage", "time [s]", "calls", "RPMs", "MiB", "RPCs")]
+        for name, stage in self.to_dict()["stages"].items():
+            if not stage["calls"] and not stage["rpcs"]:
+                continue
+            size = float(stage["bytes"]) / 1024 ** 2
+            result.append("%-16s %10.1f %8d %10d %12.1f %8d" % (name, stage["time"], stage["calls"], stage["items"], size, stage["rpcs"]))
+        return result
+
+    def _write_atomic(self, path, data):
+        """
+        Write a file atomically, collectors must never read a partial file.
+        """
+        tmp_path = "%s.%s.tmp" % (path, os.getpid())
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+
+    def write_json(self, path):
+        """
+        Write metrics to a JSON file.
+
+        :param path: Path to the file
+        :type  path: str
+        """
+        self._write_atomic(path, json.dumps(self.to_dict(), indent=4) + "\n")
+
+    def write_prometheus(self, path, labels=None):
+        """
+        Write metrics to a file for Prometheus node_exporter textfile collector.
+
+        :param path: Path to the file, should end with .prom
+        :type  path: str
+        :param labels: Labels added to all metrics, e.g. {"release": "fedora-24"}
+        :type  labels: dict=None
+        """
+        data = self.to_dict()
+        labels = labels or {}
+
+        def _labels(**kwargs):
+            items = sorted(labels.items()) + sorted(kwargs.items())
+            if not items:
+                return ""
+            return "{%s}" % ",".join(['%s="%s"' % (i, str(j).replace("\\", "\\\\").replace('"', '\\"')) for i, j in items])
+
+        lines = []
+        # values of one run, replaced by the next run: gauges, so no _total suffix of counters
+        metrics = [
+            ("stage_duration_seconds", "time", "Wall time of a signing stage."),
+            ("stage_calls", "calls", "Number of runs of a signing stage in the last signing run."),
+            ("stage_rpms", "items", "Number of RPMs processed in a signing stage in the last signing run."),
+            ("stage_bytes", "bytes", "Number of bytes processed in a signing stage in the last signing run."),
+            ("stage_rpcs", "rpcs", "Number of koji RPCs made in a signing stage in the last signing run."),
+        ]
+        for metric, key, description in metrics:
+            name = "%s_%s" % (self.prefix, metric)
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s gauge" % name)
+            for stage_name, stage in data["stages"].items():
+                lines.append("%s%s %s" % (name, _labels(stage=stage_name), stage[key]))
+
+        for metric, value, description in [
+            ("duration_seconds", data["time"], "Wall time of the signing run."),
+            ("last_run_timestamp_seconds", data["start_time"], "Start time of the last signing run."),
+        ]:
+            name = "%s_%s" % (self.prefix, metric)
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s gauge" % name)
+            lines.append("%s%s %s" % (name, _labels(), value))
+
+        self._write_atomic(path, "\n".join(lines) + "\n")
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Live progress of signing stages with throughput and ETA.
+
+KojiSignRPMs sets totals of stages when it knows which RPMs go through them
+and SignMetrics reports RPMs and bytes of each finished stage run
+(a chunk in the signing pipeline, a whole list in other stages).
+
+Progress is rendered periodically by a background thread, so a stalled run is visible too:
+
+* tty - a status line on a terminal, redrawn every second
+* log - a log record every minute for each stage that made progress or is stalled, e.g.::
+
+    Progress: stage=sign rpms=1200/5000 mib=3276.8/10240.0 rpms_per_s=12.3 mib_per_s=45.6 eta=0:05:12 idle=2s
+
+  The values are also attached to the record as ``record.progress`` dict for structured log handlers.
+
+Throughput is computed over a rolling window, ETA is based on remaining bytes
+(or RPMs, if the stage doesn't process any bytes).
+update() only adds to counters under a lock, it's cheap enough to be called for every RPM.
+"""
+
+
+from __future__ import print_function
+from __future__ import division
+
+import logging
+import sys
+import threading
+import time
+from collections import deque, OrderedDict
+
+
+__all__ = (
+    "SignProgress",
+    "PROGRESS_MODES",
+)
+
+
+PROGRESS_MODES = ["auto", "tty", "log", "none"]
+
+# seconds between reports
+TTY_INTERVAL = 1
+LOG_INTERVAL = 60
+
+
+def _format_duration(seconds):
+    """
+    Return seconds as H:MM:SS.
+    """
+    seconds = int(seconds)
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class _ClearStatusFilter(logging.Filter):
+    """
+    Clear the status line before a log record is written to the same terminal.
+    """
+
+    def __init__(self, stream):  # noqa: D102
+        logging.Filter.__init__(self)
+        self.stream = stream
+
+    def filter(self, record):  # noqa: D102
+        self.stream.write("\r\x1b[K")
+        return True
+
+
+class SignProgress(object):
+    """
+    Track RPMs and bytes completed by signing stages and report throughput and ETA.
+
+    :param mode: One of PROGRESS_MODES; 'auto' renders to tty if stream is a terminal, logs otherwise
+    :type  mode: str="auto"
+    :param logger: Logger for 'log' mode; its handlers writing to the terminal clear the status line in 'tty' mode
+    :type  logger: logging.Logger=None
+    :param stream: Terminal stream
+    :type  stream: file=sys.stderr
+    :param interval: Seconds between reports, TTY_INTERVAL or LOG_INTERVAL by default
+    :type  interval: float=None
+    :param window: Seconds of the rolling throughput window
+    :type  window: float=300
+    """
+
+    def __init__(self, mode="auto", logger=None, stream=None, interval=None, window=300):  # noqa: D102
+        if mode not in PROGRESS_MODES:
+            raise ValueError("Unknown progress mode: %s" % mode)
+        self.stream = stream or sys.stderr
+        if mode == "auto":
+            mode = "tty" if getattr(self.stream, "isatty", lambda: False)() else "log"
+        self.mode = mode
+        self.logger = logger or logging.getLogger(__name__)
+        self.interval = interval or (TTY_INTERVAL if mode == "tty" else LOG_INTERVAL)
+        self.window = window
+        self.start_time = time.time()
+        self.stages = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_stage = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._filter = None
+        self._status_len = 0
+
+    @property
+    def enabled(self):
+        """
+        False in 'none' mode.
+        """
+        return self.mode != "none"
+
+    def _get_stage(self, name):
+        result = self.stages.get(name)
+        if result is None:
+            result = self.stages[name] = {
+                "total_items": 0,
+                "total_bytes": 0,
+                "items": 0,
+                "bytes": 0,
+                "start_time": None,
+                "update_time": None,
+                "reported_items": 0,
+                # (time, items, bytes) samples taken at reports
+                "samples": deque(),
+            }
+        return result
+
+    def add_total(self, name, rpm_info_list):
+        """
+        Add RPMs to be processed by a stage.
+
+        :param name: Stage name, see releng_sop.koji_sign_metrics.STAGES
+        :type  name: str
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        """
+        if not self.enabled or not rpm_info_list:
+            return
+        size = sum([i.get("size", 0) for i in rpm_info_list])
+        with self._lock:
+            stage = self._get_stage(name)
+            stage["total_items"] += len(rpm_info_list)
+            stage["total_bytes"] += size
+        self._start()
+
+    def remove_total(self, name, rpm_info_list):
+        """
+        Remove RPMs that won't be processed by a stage, e.g. RPMs signed by other jobs.
+
+        :param name: Stage name
+        :type  name: str
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        """
+        if not self.enabled or not rpm_info_list:
+            return
+        size = sum([i.get("size", 0) for i in rpm_info_list])
+        with self._lock:
+            stage = self._get_stage(name)
+            stage["total_items"] -= len(rpm_info_list)
+            stage["total_bytes"] -= size
+
+    def update(self, name, items=1, size=0):
+        """
+        Add completed RPMs and bytes to a stage.
+
+        :param name: Stage name
+        :type  name: str
+        :param items: Number of completed RPMs
+        :type  items: int=1
+        :param size: Number of completed bytes
+        :type  size: int=0
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            stage = self._get_stage(name)
+            if stage["start_time"] is None:
+                stage["start_time"] = now
+            stage["items"] += items
+            stage["bytes"] += size
+            stage["update_time"] = now
+            self._last_stage = name
+        if self._thread is None:
+            self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self.mode == "tty":
+                self._filter = _ClearStatusFilter(self.stream)
+                for handler in self.logger.handlers:
+                    if getattr(handler, "stream", None) is self.stream:
+                        handler.addFilter(self._filter)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="SignProgress")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def get_status(self, name, now=None):
+        """
+        Return progress of a stage.
+
+        :param name: Stage name
+        :type  name: str
+        :param now: Current time
+        :type  now: float=None
+        :return: {"stage", "items", "total_items", "bytes", "total_bytes", "items_per_s", "bytes_per_s", "eta", "idle"};
+                 eta is in seconds or None if unknown, idle is seconds since the last update
+        :rtype:  OrderedDict
+        """
+        now = now or time.time()
+        with self._lock:
+            stage = self._get_stage(name)
+            samples = stage["samples"]
+            while len(samples) > 1 and samples[1][0] <= now - self.window:
+                samples.popleft()
+            if samples:
+                start_time, start_items, start_bytes = samples[0]
+            else:
+                start_time, start_items, start_bytes = stage["start_time"] or now, 0, 0
+            duration = now - start_time
+            items_per_s = (stage["items"] - start_items) / duration if duration > 0 else 0.0
+            bytes_per_s = (stage["bytes"] - start_bytes) / duration if duration > 0 else 0.0
+
+            eta = None
+            if stage["total_bytes"] and bytes_per_s:
+                eta = max(stage["total_bytes"] - stage["bytes"], 0) / bytes_per_s
+            elif stage["total_items"] and items_per_s:
+                eta = max(stage["total_items"] - stage["items"], 0) / items_per_s
+
+            return OrderedDict([
+                ("stage", name),
+                ("items", stage["items"]),
+                ("total_items", stage["total_items"]),
+                ("bytes", stage["bytes"]),
+                ("total_bytes", stage["total_bytes"]),
+                ("items_per_s", items_per_s),
+                ("bytes_per_s", bytes_per_s),
+                ("eta", eta),
+                ("idle", now - (stage["update_time"] or stage["start_time"] or self.start_time)),
+            ])
+
+    def _sample(self, now):
+        with self._lock:
+            for stage in self.stages.values():
+                if stage["start_time"] is not None:
+                    stage["samples"].append((now, stage["items"], stage["bytes"]))
+
+    def format_status(self, status):
+        """
+        Return a status line of a stage.
+
+        :param status: Stage progress, see get_status()
+        :type  status: dict
+        :rtype: str
+        """
+        result = "%s: %s" % (status["stage"], status["items"])
+        if status["total_items"]:
+            result += "/%s" % status["total_items"]
+        result += " RPMs, %.1f" % (status["bytes"] / 1024 ** 2)
+        if status["total_bytes"]:
+            result += "/%.1f" % (status["total_bytes"] / 1024 ** 2)
+        result += " MiB, %.1f RPMs/s, %.1f MiB/s" % (status["items_per_s"], status["bytes_per_s"] / 1024 ** 2)
+        if status["eta"] is not None:
+            result += ", ETA %s" % _format_duration(status["eta"])
+        return result
+
+    def report(self):
+        """
+        Render progress now, the background thread calls it every interval.
+        """
+        now = time.time()
+        if self.mode == "tty":
+            if self._last_stage is None:
+                return
+            line = "[%s] %s" % (_format_duration(now - self.start_time), self.format_status(self.get_status(self._last_stage, now)))
+            self.stream.write("\r\x1b[K" + line)
+            self.stream.flush()
+            self._status_len = len(line)
+        elif self.mode == "log":
+            for name, stage in list(self.stages.items()):
+                if stage["start_time"] is None:
+                    continue
+                # stalled stages are reported until they are complete
+                complete = not stage["total_items"] or stage["items"] >= stage["total_items"]
+                if complete and stage["reported_items"] == stage["items"]:
+                    continue
+                stage["reported_items"] = stage["items"]
+                status = self.get_status(name, now)
+                fields = [
+                    ("stage", name),
+                    ("rpms", "%s/%s" % (status["items"], status["total_items"] or "?")),
+                    ("mib", "%.1f/%s" % (status["bytes"] / 1024 ** 2,
+                                         "%.1f" % (status["total_bytes"] / 1024 ** 2) if status["total_bytes"] else "?")),
+                    ("rpms_per_s", "%.1f" % status["items_per_s"]),
+                    ("mib_per_s", "%.1f" % (status["bytes_per_s"] / 1024 ** 2)),
+                    ("eta", _format_duration(status["eta"]) if status["eta"] is not None else "?"),
+                    ("idle", "%ds" % status["idle"]),
+                ]
+                msg = "Progress: %s" % " ".join(["%s=%s" % i for i in fields])
+                self.logger.info(msg, extra={"progress": status})
+        self._sample(now)
+
+    def close(self):
+        """
+        Stop the background thread and render the final progress.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.report()
+        if self.mode == "tty":
+            if self._status_len:
+                self.stream.write("\n")
+                self.stream.flush()
+            for handler in self.logger.handlers:
+                handler.removeFilter(self._filter)
+            self._filter = None
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Work queue of RPM chunks to be signed by koji-sign-worker processes.
+
+The queue is a spool directory, shared by all hosts running workers (e.g. on NFS).
+Each chunk is a JSON file that moves between state subdirectories by atomic renames::
+
+    pending/ -> claimed/ -> done/
+                         -> failed/
+
+* a coordinator (koji-sign-rpms-in-release --queue-dir) publishes chunks to pending/
+* a worker claims a chunk by renaming it to claimed/; only one worker wins the rename
+* the worker touches the claimed chunk while working on it
+* finished chunks are written to done/ or failed/ with a result
+* chunks claimed by crashed workers (not touched for ttl seconds) are moved back to pending/
+* the coordinator gives up when no chunk is claimed, touched or finished for a timeout,
+  e.g. when no workers are running; its pending chunks are withdrawn
+"""
+
+
+from __future__ import print_function
+
+import errno
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+import uuid
+
+from .common import get_logger, Error
+
+
+__all__ = (
+    "SignQueue",
+)
+
+
+class SignQueue(object):
+    """
+    Spool directory with chunks of RPMs to be signed.
+
+    :param path: Path to a spool directory shared by the coordinator and workers
+    :type  path: str
+    :param ttl: Claimed chunks not touched for ttl seconds are returned to the queue
+    :type  ttl: int=600
+    :param logger: Custom logger
+    :type  logger: logging.Logger
+    :param log_level: Log level for default logger (when logger is not set)
+    :type  log_level: int
+    """
+
+    STATES = ("pending", "claimed", "done", "failed")
+
+    def __init__(self, path, ttl=600, logger=None, log_level=logging.INFO):  # noqa: D102
+        self.path = path
+        self.ttl = ttl
+        self.holder = "%s:%s" % (socket.gethostname(), os.getpid())
+        self.logger = logger or get_logger(self, log_level)
+        for i in ("tmp", ) + self.STATES:
+            path = os.path.join(self.path, i)
+            if not os.path.isdir(path):
+                try:
+                    os.makedirs(path)
+                except OSError as ex:
+                    # created by another process meanwhile
+                    if ex.errno != errno.EEXIST:
+                        raise
+
+    def _get_path(self, state, chunk_id):
+        return os.path.join(self.path, state, "%s.json" % chunk_id)
+
+    def _read(self, path):
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _write(self, path, data):
+        """
+        Write data atomically: to a temp file first, then rename it to path.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.path, "tmp"))
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def _list(self, state):
+        result = []
+        for fn in sorted(os.listdir(os.path.join(self.path, state))):
+            if fn.endswith(".json"):
+                result.append(fn[:-5])
+        return result
+
+    def publish(self, chunks):
+        """
+        Publish chunks to the queue.
+
+        Chunk IDs are sortable, chunks are claimed in the order they were published.
+
+        :param chunks: List of JSON serializable dicts
+        :type  chunks: list
+        :return: Chunk IDs
+        :rtype:  list
+        """
+        batch_id = "%d-%s" % (time.time(), uuid.uuid4().hex[:8])
+        result = []
+        for num, chunk in enumerate(chunks):
+            chunk_id = "%s-%06d" % (batch_id, num)
+            chunk = dict(chunk, id=chunk_id)
+            self._write(self._get_path("pending", chunk_id), chunk)
+            result.append(chunk_id)
+        return result
+
+    def claim(self):
+        """
+        Claim the first pending chunk.
+
+        :return: Chunk dict or None if the queue is empty
+        :rtype:  dict
+        """
+        for chunk_id in self._list("pending"):
+            path = self._get_path("claimed", chunk_id)
+            try:
+                os.rename(self._get_path("pending", chunk_id), path)
+            except OSError as ex:
+                if ex.errno == errno.ENOENT:
+                    # claimed by another worker
+                    continue
+                raise
+            self.touch(chunk_id)
+            return self._read(path)
+        return None
+
+    def touch(self, chunk_id):
+        """
+        Mark a claimed chunk as being worked on.
+
+        :param chunk_id: Chunk ID
+        :type  chunk_id: str
+        """
+        try:
+            os.utime(self._get_path("claimed", chunk_id), None)
+        except OSError as ex:
+            # returned to the queue or finished meanwhile
+            if ex.errno != errno.ENOENT:
+                raise
+
+    def _finish(self, state, chunk, result):
+        data = dict(chunk, worker=self.holder, **result)
+        self._write(self._get_path(state, chunk["id"]), data)
+        try:
+            os.remove(self._get_path("claimed", chunk["id"]))
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+
+    def complete(self, chunk, result=None):
+        """
+        Move a claimed chunk to done.
+
+        :param chunk: Chunk dict returned by claim()
+        :type  chunk: dict
+        :param result: Additional JSON serializable data for the coordinator
+        :type  result: dict=None
+        """
+        self._finish("done", chunk, result or {})
+
+    def fail(self, chunk, error):
+        """
+        Move a claimed chunk to failed.
+
+        :param chunk: Chunk dict returned by claim()
+        :type  chunk: dict
+        :param error: Error message
+        :type  error: str
+        """
+        self._finish("failed", chunk, {"error": error})
+
+    def requeue_stale(self):
+        """
+        Return chunks claimed by crashed workers to the queue.
+
+        :return: Chunk IDs returned to the queue
+        :rtype:  list
+        """
+        result = []
+        for chunk_id in self._list("claimed"):
+            path = self._get_path("claimed", chunk_id)
+            try:
+                if os.path.getmtime(path) + self.ttl >= time.time():
+                    continue
+                os.rename(path, self._get_path("pending", chunk_id))
+            except OSError as ex:
+                if ex.errno == errno.ENOENT:
+                    continue
+                raise
+            self.logger.warning("Returning stale chunk to the queue: %s" % chunk_id)
+            result.append(chunk_id)
+        return result
+
+    def _get_last_activity(self, chunk_ids):
+        """
+        Return the latest time a worker touched any of claimed chunks, or None.
+        """
+        result = None
+        for chunk_id in chunk_ids:
+            try:
+                mtime = os.path.getmtime(self._get_path("claimed", chunk_id))
+            except OSError as ex:
+                if ex.errno == errno.ENOENT:
+                    continue
+                raise
+            result = max(result or mtime, mtime)
+        return result
+
+    def withdraw(self, chunk_ids):
+        """
+        Remove chunks that haven't been claimed yet from the queue.
+
+        :param chunk_ids: Chunk IDs returned by publish()
+        :type  chunk_ids: list
+        :return: Chunk IDs removed from the queue
+        :rtype:  list
+        """
+        result = []
+        for chunk_id in chunk_ids:
+            try:
+                os.remove(self._get_path("pending", chunk_id))
+            except OSError as ex:
+                if ex.errno == errno.ENOENT:
+                    # claimed meanwhile
+                    continue
+                raise
+            result.append(chunk_id)
+        return result
+
+    def wait(self, chunk_ids, interval=5, timeout=3600):
+        """
+        Wait until chunks are finished, collect their results and remove them from the queue.
+
+        Failed chunks are kept in failed/ for inspection.
+
+        :param chunk_ids: Chunk IDs returned by publish()
+        :type  chunk_ids: list
+        :param interval: Polling interval in seconds
+        :type  interval: int=5
+        :param timeout: Fail if no chunk is claimed, touched by a worker or finished for timeout seconds
+        :type  timeout: int=3600
+        :return: (done, failed) lists of finished chunk dicts
+        :rtype:  tuple
+        :raises Error: on timeout, pending chunks are withdrawn from the queue
+        """
+        done = []
+        failed = []
+        remaining = list(chunk_ids)
+        finished = 0
+        last_activity = time.time()
+        while True:
+            for chunk_id in list(remaining):
+                path = self._get_path("done", chunk_id)
+                if os.path.exists(path):
+                    done.append(self._read(path))
+                    os.remove(path)
+                    remaining.remove(chunk_id)
+                    continue
+                path = self._get_path("failed", chunk_id)
+                if os.path.exists(path):
+                    failed.append(self._read(path))
+                    remaining.remove(chunk_id)
+
+            if not remaining:
+                return done, failed
+            if len(chunk_ids) - len(remaining) != finished:
+                finished = len(chunk_ids) - len(remaining)
+                last_activity = time.time()
+                self.logger.info("Finished chunks: %s/%s" % (finished, len(chunk_ids)))
+            last_activity = max(last_activity, self._get_last_activity(remaining) or 0)
+            if time.time() - last_activity >= timeout:
+                withdrawn = self.withdraw(remaining)
+                raise Error("No koji-sign-worker processed chunks in %s for %s seconds; "
+                            "finished: %s/%s, withdrawn from the queue: %s"
+                            % (self.path, timeout, finished, len(chunk_ids), len(withdrawn)))
+            self.requeue_stale()
+            time.sleep(interval)
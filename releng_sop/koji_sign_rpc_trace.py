@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Tracing of slow koji hub RPCs made by KojiSignRPMs.
+
+Every call of a koji session goes through ClientSession._callMethod(), including multiCall,
+so the tracer replaces it on the session instance and times each RPC.
+Calls queued for a multicall are not RPCs, the multiCall is timed as one RPC
+named by its methods, e.g. ``multiCall:queryRPMSigs``.
+
+For each RPC the duration and the number of returned items (or queued calls of a multicall) are recorded.
+Calls taking at least the threshold are counted as slow, the size of their XML-RPC request is measured
+by serializing it again (too costly for every call, e.g. multicalls importing signatures)
+and they are written to a trace file as JSON lines with summarized arguments::
+
+    {"time": 1476864000.0, "method": "multiCall:writeSignedRPM", "duration": 12.3, "request_bytes": 52311,
+     "items": 200, "args": "200 calls: writeSignedRPM({'id': 1, ...}, 'deadbeef'), ...", "error": null}
+
+Summary tables of duration percentiles and histograms per method are logged at the end.
+Responses of streamed calls (the tag listing) are not kept, their item count is 0.
+Arguments of login and authentication methods are never written, they hold credentials.
+"""
+
+
+from __future__ import print_function
+from __future__ import division
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from six.moves import xmlrpc_client
+
+
+__all__ = (
+    "RPCTracer",
+    "HISTOGRAM_BUCKETS",
+)
+
+
+# upper bounds of histogram buckets in seconds
+HISTOGRAM_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# methods with credentials in arguments are matched by these lowercase substrings, e.g. login, sslLogin, gssapi_login
+REDACTED_METHODS = ("login", "auth")
+
+
+def _summarize(value, limit=3, length=64):
+    """
+    Return a short repr of a value: long strings are cut, long lists and dicts show only first items.
+    """
+    if isinstance(value, (list, tuple)):
+        items = [_summarize(i, limit, length) for i in value[:limit]]
+        if len(value) > limit:
+            items.append("... %s items" % len(value))
+        return "[%s]" % ", ".join(items)
+    if isinstance(value, dict):
+        items = ["%r: %s" % (i, _summarize(value[i], limit, length)) for i in sorted(value)[:limit]]
+        if len(value) > limit:
+            items.append("...")
+        return "{%s}" % ", ".join(items)
+    result = repr(value)
+    if len(result) > length:
+        result = "%s...(%s chars)" % (result[:length], len(result))
+    return result
+
+
+def _summarize_call(name, args):
+    """
+    Return a short representation of call arguments; arguments of login methods are redacted.
+    """
+    lower_name = (name or "").lower()
+    if [i for i in REDACTED_METHODS if i in lower_name]:
+        return "%s(<redacted>)" % name
+    return "%s(%s)" % (name, ", ".join([_summarize(i) for i in args]))
+
+
+def _percentile(sorted_values, percent):
+    """
+    Return percentile of sorted values (nearest rank).
+    """
+    if not sorted_values:
+        return 0.0
+    index = max(int(round(percent / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class RPCTracer(object):
+    """
+    Time koji RPCs and trace slow ones.
+
+    :param path: Path to the trace file, slow calls are only counted if not set
+    :type  path: str=None
+    :param threshold: Duration in seconds from which calls are traced
+    :type  threshold: float=1.0
+    """
+
+    def __init__(self, path=None, threshold=1.0):  # noqa: D102
+        self.path = path
+        self.threshold = threshold
+        self.methods = OrderedDict()
+        self.slow_calls = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "w") if path else None
+
+    def instrument(self, koji_session):
+        """
+        Time RPCs of a koji session.
+
+        :param koji_session: Koji session
+        :type  koji_session: koji.ClientSession
+        :return: The same session
+        :rtype:  koji.ClientSession
+        """
+        call_method = koji_session._callMethod
+
+        def _callMethod(name, args, *rest, **kwargs):
+            if getattr(koji_session, "multicall", False):
+                # queued for a multicall
+                return call_method(name, args, *rest, **kwargs)
+            start = time.time()
+            try:
+                result = call_method(name, args, *rest, **kwargs)
+            except Exception as ex:
+                self.record(name, args, rest[0] if rest else kwargs.get("kwargs"), start, time.time() - start, error=ex)
+                raise
+            self.record(name, args, rest[0] if rest else kwargs.get("kwargs"), start, time.time() - start, result=result)
+            return result
+
+        koji_session._callMethod = _callMethod
+        return koji_session
+
+    def _get_method(self, name):
+        result = self.methods.get(name)
+        if result is None:
+            result = self.methods[name] = {
+                "durations": [],
+                "request_bytes": 0,
+                "items": 0,
+                "errors": 0,
+            }
+        return result
+
+    def record(self, name, args, kwargs, start, duration, result=None, error=None):
+        """
+        Record an RPC.
+
+        :param name: Koji method name
+        :type  name: str
+        :param args: Call arguments
+        :type  args: tuple
+        :param kwargs: Call keyword arguments
+        :type  kwargs: dict
+        :param start: Start time
+        :type  start: float
+        :param duration: Duration in seconds
+        :type  duration: float
+        :param result: Call result
+        :param error: Raised exception
+        :type  error: Exception=None
+        """
+        args = list(args)
+        if kwargs:
+            args.append(kwargs)
+        method_name = name
+
+        if name == "multiCall" and args and isinstance(args[0], (list, tuple)):
+            calls = args[0]
+            names = sorted(set([i.get("methodName", "?") for i in calls]))
+            name = "multiCall:%s" % "+".join(names)
+            items = len(calls)
+        elif isinstance(result, (list, tuple)) and result and all([isinstance(i, (list, tuple)) for i in result]):
+            # e.g. [rpms, builds] of listTaggedRPMS
+            items = sum([len(i) for i in result])
+        elif isinstance(result, (list, tuple)):
+            items = len(result)
+        else:
+            items = 0
+
+        with self._lock:
+            method = self._get_method(name)
+            method["durations"].append(duration)
+            method["items"] += items
+            if error is not None:
+                method["errors"] += 1
+            if duration < self.threshold:
+                return
+
+        # serializing the request again costs CPU, measure only slow calls
+        try:
+            request_bytes = len(xmlrpc_client.dumps(tuple(args), method_name, allow_none=True))
+        except (TypeError, OverflowError):
+            request_bytes = 0
+        with self._lock:
+            method["request_bytes"] += request_bytes
+            self.slow_calls += 1
+            if self._file is None:
+                return
+
+        if name.startswith("multiCall:"):
+            summary = "%s calls: %s" % (items, ", ".join([_summarize_call(i.get("methodName"), i.get("params", []))
+                                                          for i in calls[:3]]))
+            if len(calls) > 3:
+                summary += ", ..."
+        else:
+            summary = _summarize_call(name, args)
+        line = json.dumps(OrderedDict([
+            ("time", start),
+            ("method", name),
+            ("duration", duration),
+            ("request_bytes", request_bytes),
+            ("items", items),
+            ("args", summary),
+            ("error", str(error) if error is not None else None),
+        ]))
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+                self._file.flush()
+
+    def to_dict(self):
+        """
+        Return statistics of RPCs by method.
+
+        :return: {method: {"calls", "errors", "time", "p50", "p90", "p99", "max", "request_bytes", "items", "histogram"}};
+                 request_bytes are of slow calls only,
+                 histogram has a count for each of HISTOGRAM_BUCKETS and one for longer calls
+        :rtype:  OrderedDict
+        """
+        result = OrderedDict()
+        with self._lock:
+            for name, method in self.methods.items():
+                durations = sorted(method["durations"])
+                histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+                bucket = 0
+                for i in durations:
+                    while bucket < len(HISTOGRAM_BUCKETS) and i >= HISTOGRAM_BUCKETS[bucket]:
+                        bucket += 1
+                    histogram[bucket] += 1
+                result[name] = OrderedDict([
+                    ("calls", len(durations)),
+                    ("errors", method["errors"]),
+                    ("time", sum(durations)),
+                    ("p50", _percentile(durations, 50)),
+                    ("p90", _percentile(durations, 90)),
+                    ("p99", _percentile(durations, 99)),
+                    ("max", durations[-1] if durations else 0.0),
+                    ("request_bytes", method["request_bytes"]),
+                    ("items", method["items"]),
+                    ("histogram", histogram),
+                ])
+        return result
+
+    def format(self):
+        """
+        Return tables of RPC duration percentiles and histograms as text lines.
+
+        :return: List of text lines
+        :rtype:  list
+        """
+        data = self.to_dict()
+        width = max([len(i) for i in data] + [6])
+        result = ["%-*s %7s %7s %10s %8s %8s %8s %8s %10s %9s"
+                  % (width, "method", "calls", "errors", "time [s]", "p50", "p90", "p99", "max", "slow MiB", "items")]
+        for name, method in data.items():
+            result.append("%-*s %7d %7d %10.1f %8.3f %8.3f %8.3f %8.3f %10.1f %9d"
+                          % (width, name, method["calls"], method["errors"], method["time"], method["p50"], method["p90"],
+                             method["p99"], method["max"], method["request_bytes"] / 1024 ** 2, method["items"]))
+
+        buckets = ["<%ss" % i for i in HISTOGRAM_BUCKETS] + [">=%ss" % HISTOGRAM_BUCKETS[-1]]
+        result += ["", "%-*s %s" % (width, "method", " ".join(["%7s" % i for i in buckets]))]
+        for name, method in data.items():
+            result.append("%-*s %s" % (width, name, " ".join(["%7d" % i for i in method["histogram"]])))
+        if self.slow_calls:
+            see = " (see %s)" % self.path if self.path else ""
+            result += ["", "Calls slower than %ss: %s%s" % (self.threshold, self.slow_calls, see)]
+        return result
+
+    def close(self):
+        """
+        Close the trace file.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
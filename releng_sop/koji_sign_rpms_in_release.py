@@ -6,6 +6,10 @@ Sign packages in a release tag.
 
 Then import the signed headers to koji
 and write signed copies in koji.
+
+Several releases can be signed at once.
+RPMs shared by the releases are listed and queried only once
+and then signed with sigkeys of each signing level.
 """
 
 
@@ -16,8 +20,15 @@ import sys
 import argparse
 import logging
 
-from .common import Environment, Release, Error, ConfigError
-from .koji_sign import KojiSignRPMs, get_rpmsign_class
+from .cassette import add_cassette_arguments, get_cassette
+from .common import Environment, Release, Error, ConfigError, UsageError, add_trace_arguments, span, trace
+from .koji_sign import KojiSignRPMs, PRIORITIES, get_rpmsign_class
+from .koji_sign_progress import PROGRESS_MODES
+from .koji_sign_rpc_trace import RPCTracer
+from .memprofile import add_memprofile_arguments, profile_memory
+
+
+LEVELS = ["beta", "gold"]
 
 
 class KojiSignRPMsInRelease(object):
@@ -26,9 +37,9 @@ class KojiSignRPMsInRelease(object):
 
     :param env: Environment object.
     :type  env: releng_sop.common.Environment
-    :param release: Release object.
+    :param release: Release object or a list of them.
     :type  release: releng_sop.common.Release
-    :param level: Signing level: 'beta' or 'gold'
+    :param level: Signing level: 'beta' or 'gold'; or a list of levels, one for each release
     :type  level: str
     :param packages: List of packages to be signed (optional).
     :type  packages: list=None
@@ -36,43 +47,125 @@ class KojiSignRPMsInRelease(object):
     :type  just_sign: bool=False
     :param just_write: Just write RPMs from sigcache, don't sign anything.
     :type  just_write: bool=False
+    :param just_verify: Just verify signed RPMs, don't sign or write anything.
+    :type  just_verify: bool=False
+    :param local_write: Write signed RPMs directly to koji volume instead of the hub.
+    :type  local_write: bool=False
+    :param verify: Verify signed RPMs after writing them.
+    :type  verify: bool=False
+    :param priority_packages: List of packages to be signed first, e.g. critical path (optional).
+    :type  priority_packages: list=None
+    :param priorities: Order of signing, see releng_sop.koji_sign.PRIORITIES (optional).
+    :type  priorities: list=None
+    :param pause_after_priority: Stop after priority packages are signed.
+    :type  pause_after_priority: bool=False
+    :param lease_dir: Directory with leases shared by signing jobs (optional).
+    :type  lease_dir: str=None
+    :param queue_dir: Spool directory of koji-sign-worker processes that sign the RPMs (optional).
+    :type  queue_dir: str=None
+    :param chunk_time: Target duration of signing a chunk of RPMs in seconds.
+    :type  chunk_time: int=60
+    :param prefetch: Read ahead RPMs to be signed up to given MiB, 0 disables it.
+    :type  prefetch: int=512
+    :param estimate: Just estimate counts, sizes and duration of signing from a sample of RPMs, don't sign or write anything.
+    :type  estimate: bool=False
+    :param metrics_json: Write metrics of signing stages to a JSON file at the end (optional).
+    :type  metrics_json: str=None
+    :param metrics_prom: Write metrics of signing stages to a Prometheus textfile collector file at the end (optional).
+    :type  metrics_prom: str=None
+    :param cassette: Record koji calls to a cassette or replay them (optional).
+    :type  cassette: releng_sop.cassette.Cassette=None
+    :param memprofile: Write peak memory and top allocation sites of signing stages to a report at the end (optional).
+    :type  memprofile: str=None
+    :param progress: Live progress of signing stages, see releng_sop.koji_sign_progress.PROGRESS_MODES.
+    :type  progress: str="none"
+    :param rpc_trace: Time koji RPCs, write calls slower than rpc_trace_threshold to a trace file
+                      and log histograms of RPC durations at the end (optional).
+    :type  rpc_trace: str=None
+    :param rpc_trace_threshold: Duration of traced koji RPCs in seconds.
+    :type  rpc_trace_threshold: float=1.0
     """
 
-    def __init__(self, env, release, level, packages=None, just_sign=False, just_write=False):  # noqa: D102
+    def __init__(self, env, release, level, packages=None, just_sign=False, just_write=False, just_verify=False,  # noqa: D102
+                 local_write=False, verify=False, priority_packages=None, priorities=None, pause_after_priority=False,
+                 lease_dir=None, queue_dir=None, chunk_time=60, prefetch=512, estimate=False,
+                 metrics_json=None, metrics_prom=None, cassette=None, memprofile=None, progress="none",
+                 rpc_trace=None, rpc_trace_threshold=1.0):
         self.env = env
-        self.release = release
+        releases = release if isinstance(release, (list, tuple)) else [release]
+        levels = level if isinstance(level, (list, tuple)) else [level] * len(releases)
+        if not releases:
+            raise UsageError("At least one release must be specified")
+        if len(levels) != len(releases):
+            raise UsageError("Number of levels doesn't match number of releases")
+
+        # [(release, level, koji_tag, sigkeys)]
+        self.targets = []
+        for i, j in zip(releases, levels):
+            self.targets.append((i, j, self._get_koji_tag(i), self._get_sigkeys(i, j)))
+
+        # the first release; kept for commands working with a single release
+        self.release, self.level, self.koji_tag, self.sigkeys = self.targets[0]
         self.release_id = self.release.name
-        self.koji_tag = self._get_koji_tag()
-        self.level = level
-        self.sigkeys = self._get_sigkeys()
         self.just_sign = just_sign
         self.just_write = just_write
-        self.rpmsign_class = get_rpmsign_class(self.env)
+        self.just_verify = just_verify
+        self.local_write = local_write
+        self.verify = verify
+        self._rpmsign_class = None
         self.packages = sorted(packages or [])
+        self.priority_packages = sorted(priority_packages or [])
+        self.priorities = priorities or []
+        self.pause_after_priority = pause_after_priority
+        self.lease_dir = lease_dir
+        self.queue_dir = queue_dir
+        self.chunk_time = chunk_time
+        self.prefetch = prefetch
+        self.estimate = estimate
+        self.metrics_json = metrics_json
+        self.metrics_prom = metrics_prom
+        self.cassette = cassette
+        self.memprofile = memprofile
+        self.progress = progress
+        self.rpc_trace = rpc_trace
+        self.rpc_trace_threshold = rpc_trace_threshold
+        self.scratch_dirs = self.env["sign_scratch_dirs"] if "sign_scratch_dirs" in self.env else None
+        if self.pause_after_priority and not self.priority_packages:
+            raise UsageError("Priority packages must be specified to pause after them")
+
+    @property
+    def rpmsign_class(self):
+        """
+        Signing class from the environment, resolved when it's needed,
+        so that commands that don't sign (e.g. koji-sign-audit) work without it.
+        """
+        if self._rpmsign_class is None:
+            self._rpmsign_class = get_rpmsign_class(self.env)
+        return self._rpmsign_class
 
-    def _get_koji_tag(self):
+    def _get_koji_tag(self, release):
         """
         Return tag name associated to a release.
 
         Return compose tag if exists.
         Return release tag if compose tag is not available.
         """
-        result = self.release["koji"].get("tag_compose")
+        result = release["koji"].get("tag_compose")
         if not result:
-            result = self.release["koji"].get("tag_release")
+            result = release["koji"].get("tag_release")
         if result:
             return result
-        raise ConfigError("Neither compose or release tag is set for release: %s" % self.release_id)
+        raise ConfigError("Neither compose or release tag is set for release: %s" % release.name)
 
-    def _get_sigkeys(self):
+    def _get_sigkeys(self, release, level):
         """
         Get list of sigkeys according to the signing level.
         """
-        if self.level == "beta":
-            return [self.release["signing"]["sigkey_beta"], self.release["signing"]["sigkey_gold"]]
-        elif self.level == "gold":
-            return [self.release["signing"]["sigkey_gold"]]
-        raise ConfigError("Unknown level: %s" % self.level)
+        if level == "beta":
+            return [release["signing"]["sigkey_beta"], release["signing"]["sigkey_gold"]]
+        elif level == "gold":
+            return [release["signing"]["sigkey_gold"]]
+        raise ConfigError("Unknown level: %s" % level)
 
     def details(self, commit=False):
         """
@@ -87,25 +180,130 @@ class KojiSignRPMsInRelease(object):
             "Signing RPMs in a release",
             " * env name:                %s" % self.env.name,
             " * env config:              %s" % self.env.config_path,
-            " * release source:          %s" % self.release.config_path,
             " * koji profile:            %s" % self.env["koji_profile"],
-            " * release_id:              %s" % self.release_id,
-            " * tag:                     %s" % self.koji_tag,
-            " * level:                   %s" % self.level,
-            " * sigkeys:                 %s" % ", ".join(self.sigkeys),
+        ]
+        for release, level, koji_tag, sigkeys in self.targets:
+            result += [
+                " * release source:          %s" % release.config_path,
+                " * release_id:              %s" % release.name,
+                " * tag:                     %s" % koji_tag,
+                " * level:                   %s" % level,
+                " * sigkeys:                 %s" % ", ".join(sigkeys),
+            ]
+        result += [
             " * just_sign:               %s" % self.just_sign,
             " * just_write:              %s" % self.just_write,
+            " * just_verify:             %s" % self.just_verify,
+            " * local_write:             %s" % self.local_write,
+            " * verify:                  %s" % self.verify,
+            " * chunk time:              %s" % self.chunk_time,
+            " * prefetch:                %s MiB" % self.prefetch,
             " * signing class:           %s.%s" % (self.rpmsign_class.__module__, self.rpmsign_class.__name__),
         ]
         if self.packages:
             result += [" * packages:"]
             for i in self.packages:
                 result += ["     - %s" % i]
+        if self.priorities:
+            result += [" * priorities:              %s" % ", ".join(self.priorities)]
+        if self.priority_packages:
+            result += [" * priority packages:       %s" % len(self.priority_packages)]
+            result += [" * pause after priority:    %s" % self.pause_after_priority]
+        if self.scratch_dirs:
+            result += [" * scratch dirs:"]
+            for i in self.scratch_dirs:
+                result += ["     - %s" % (i["path"] if isinstance(i, dict) else i)]
+        if self.estimate:
+            result += [" * estimate:                %s" % self.estimate]
+        if self.lease_dir:
+            result += [" * lease dir:               %s" % self.lease_dir]
+        if self.queue_dir:
+            result += [" * queue dir:               %s" % self.queue_dir]
+        if self.metrics_json:
+            result += [" * metrics json:            %s" % self.metrics_json]
+        if self.metrics_prom:
+            result += [" * metrics prom:            %s" % self.metrics_prom]
+        if self.cassette:
+            result += [" * cassette:                %s (%s)" % (self.cassette.path, self.cassette.mode)]
+        if self.memprofile:
+            result += [" * memory profile:          %s" % self.memprofile]
+        if self.progress != "none":
+            result += [" * progress:                %s" % self.progress]
+        if self.rpc_trace:
+            result += [" * RPC trace:               %s (calls over %ss)" % (self.rpc_trace, self.rpc_trace_threshold)]
 
         if not commit:
             result += ["*** TEST MODE ***"]
         return result
 
+    def _get_priority_batches(self, sign, rpm_info_list):
+        """
+        Order RPMs by priority and split them to batches that are signed one after another.
+
+        :param sign: KojiSignRPMs object
+        :type  sign: releng_sop.koji_sign.KojiSignRPMs
+        :param rpm_info_list: List of koji rpm_info dictionaries
+        :type  rpm_info_list: list
+        :return: [(title, rpm_info_list), ...]
+        :rtype:  list
+        """
+        rpm_info_list = sign.sort_rpm_info_list_by_priority(rpm_info_list, self.priorities, packages=self.priority_packages)
+        if not self.priority_packages:
+            return [(None, rpm_info_list)]
+
+        # RPMs of priority packages are sorted to the beginning of the list
+        priority = sign.filter_rpm_info_list_by_packages(rpm_info_list, self.priority_packages)
+        remaining = rpm_info_list[len(priority):]
+        if self.pause_after_priority:
+            sign.logger.info("Pausing after priority packages, %s RPMs will remain unsigned" % len(remaining))
+            return [("priority packages", priority)]
+        return [("priority packages", priority), ("remaining packages", remaining)]
+
+    def _get_rpm_info_groups(self, sign, prefetch_sigs=False):
+        """
+        Read RPMs of all releases and group them by sigkeys.
+
+        Each tag is listed only once and each RPM is included only once in a group,
+        even if it is shared by several releases.
+
+        :param sign: KojiSignRPMs object
+        :type  sign: releng_sop.koji_sign.KojiSignRPMs
+        :param prefetch_sigs: Query signatures while tags are being listed
+        :type  prefetch_sigs: bool=False
+        :return: (rpm_info_list, [(sigkeys, rpm_info_list), ...]) - unique RPMs of all releases and RPMs grouped by sigkeys
+        :rtype:  tuple
+        """
+        rpm_info_by_tag = {}
+        rpm_info_list = []
+        rpm_ids = set()
+        groups = []
+        groups_by_sigkeys = {}
+
+        for release, level, koji_tag, sigkeys in self.targets:
+            tag_rpm_info_list = rpm_info_by_tag.get(koji_tag)
+            if tag_rpm_info_list is None:
+                sign.logger.info("Reading RPM information from koji: %s" % koji_tag)
+                tag_rpm_info_list = sign.get_latest_tagged_rpms(koji_tag, prefetch_sigs=prefetch_sigs)
+                if self.packages:
+                    tag_rpm_info_list = sign.filter_rpm_info_list_by_packages(tag_rpm_info_list, self.packages)
+                rpm_info_by_tag[koji_tag] = tag_rpm_info_list
+
+            key = tuple([i.lower() for i in sigkeys])
+            if key not in groups_by_sigkeys:
+                groups_by_sigkeys[key] = (set(), [])
+                groups.append((sigkeys, groups_by_sigkeys[key][1]))
+            group_rpm_ids, group = groups_by_sigkeys[key]
+
+            for rpm_info in tag_rpm_info_list:
+                if rpm_info["id"] not in rpm_ids:
+                    rpm_ids.add(rpm_info["id"])
+                    rpm_info_list.append(rpm_info)
+                if rpm_info["id"] not in group_rpm_ids:
+                    group_rpm_ids.add(rpm_info["id"])
+                    group.append(rpm_info)
+
+        return rpm_info_list, groups
+
     def run(self, commit=False):
         """
         Print command details, get command and run it.
@@ -113,18 +311,89 @@ class KojiSignRPMsInRelease(object):
         :param commit: Disable dry-run, apply changes for real.
         :type  commit: bool=False
         """
-        sign = KojiSignRPMs(self.env["koji_profile"], self.rpmsign_class, log_level=logging.DEBUG)
-
-        for i in self.details(commit=commit):
-            sign.logger.info(i)
-
-        msg = "Reading RPM information from koji"
-        sign.logger.info(msg)
-        rpm_info_list = sign.get_latest_tagged_rpms(self.koji_tag)
-        if self.packages:
-            rpm_info_list = sign.filter_rpm_info_list_by_packages(rpm_info_list, self.packages)
+        rpc_tracer = RPCTracer(self.rpc_trace, threshold=self.rpc_trace_threshold) if self.rpc_trace else None
+        with span("KojiSignRPMsInRelease.run", "command", commit=commit), profile_memory(self.memprofile) as memprofiler:
+            sign = KojiSignRPMs(self.env["koji_profile"], self.rpmsign_class, log_level=logging.DEBUG, local_write=self.local_write,
+                                lease_dir=self.lease_dir, queue_dir=self.queue_dir, chunk_time=self.chunk_time,
+                                prefetch=self.prefetch, scratch_dirs=self.scratch_dirs, cassette=self.cassette,
+                                memprofiler=memprofiler, progress=self.progress, rpc_tracer=rpc_tracer)
+
+            for i in self.details(commit=commit):
+                sign.logger.info(i)
+
+            try:
+                self._run(sign, commit=commit)
+            finally:
+                sign.progress.close()
+                # failed runs are the interesting ones, write metrics anyway
+                self._write_metrics(sign)
+                if rpc_tracer:
+                    self._write_rpc_trace(sign, rpc_tracer)
+
+    def _write_metrics(self, sign):
+        """
+        Log a table of signing stages and write metrics files.
+        """
+        sign.logger.info("Signing stages:")
+        for line in sign.metrics.format():
+            sign.logger.info(line)
+        if self.metrics_json:
+            sign.metrics.write_json(self.metrics_json)
+        if self.metrics_prom:
+            labels = {
+                "release": ",".join([i[0].name for i in self.targets]),
+                "level": ",".join([i[1] for i in self.targets]),
+            }
+            sign.metrics.write_prometheus(self.metrics_prom, labels=labels)
+
+    def _write_rpc_trace(self, sign, rpc_tracer):
+        """
+        Log tables of koji RPC durations and close the trace file.
+        """
+        sign.logger.info("Koji RPCs:")
+        for line in rpc_tracer.format():
+            sign.logger.info(line)
+        rpc_tracer.close()
 
-        sign.sign(rpm_info_list, self.sigkeys, just_sign=self.just_sign, just_write=self.just_write, commit=commit)
+    def _run(self, sign, commit=False):
+        """
+        Sign, estimate or verify RPMs of all releases.
+        """
+        # signatures of all RPMs in tags would be queried when signing only some packages
+        prefetch_sigs = not self.just_verify and not self.packages
+        rpm_info_list, groups = self._get_rpm_info_groups(sign, prefetch_sigs=prefetch_sigs)
+        if len(self.targets) > 1:
+            sign.logger.info("Unique RPMs in all releases: %s" % len(rpm_info_list))
+
+        failures = []
+        if self.just_verify:
+            for sigkeys, rpm_info_group in groups:
+                sign.logger.info("Verifying signed RPMs: %s" % ", ".join(sigkeys))
+                failures += sign.verify_signed_rpms(rpm_info_group, sigkeys)[1]
+        elif self.estimate:
+            sign.logger.info("Reading known package signatures from koji")
+            rpm_sig_dict = sign.get_rpm_sig_dict(rpm_info_list)
+            for sigkeys, rpm_info_group in groups:
+                sign.logger.info("Estimating signing with sigkeys: %s" % ", ".join(sigkeys))
+                sign.estimate(rpm_info_group, sigkeys, rpm_sig_dict=rpm_sig_dict)
+        else:
+            # query signatures once, the dict is shared and updated by all sign() calls
+            sign.logger.info("Reading known package signatures from koji")
+            rpm_sig_dict = sign.get_rpm_sig_dict(rpm_info_list)
+
+            for sigkeys, rpm_info_group in groups:
+                if len(groups) > 1:
+                    sign.logger.info("Signing RPMs with sigkeys: %s" % ", ".join(sigkeys))
+                for title, rpm_info_batch in self._get_priority_batches(sign, rpm_info_group):
+                    if not rpm_info_batch:
+                        continue
+                    if title:
+                        sign.logger.info("Signing %s" % title)
+                    failures += sign.sign(rpm_info_batch, sigkeys, just_sign=self.just_sign, just_write=self.just_write,
+                                          verify=self.verify, rpm_sig_dict=rpm_sig_dict, commit=commit)
+
+        if failures:
+            raise Error("Verification of %s signed RPMs failed" % len(failures))
 
 
 def get_parser():
@@ -134,15 +403,17 @@ def get_parser():
     :returns: ArgumentParser object with arguments set up.
     :rtype:   argparse.ArgumentParser
     """
-    parser = argparse.ArgumentParser(description="Sign RPMs in a koji tag that maps to given release.")
+    parser = argparse.ArgumentParser(description="Sign RPMs in koji tags that map to given releases.")
     parser.add_argument(
-        "release_id",
+        "release_ids",
         metavar="RELEASE_ID",
-        help="PDC release ID, for example 'fedora-24', 'fedora-24-updates'.",
+        nargs="+",
+        help="PDC release ID, for example 'fedora-24', 'fedora-24-updates'. "
+             "Use RELEASE_ID:LEVEL to override signature level of a release.",
     )
     parser.add_argument(
         "level",
-        choices=["beta", "gold"],
+        choices=LEVELS,
         help="Signature level. Allowed values: beta, gold.",
     )
     parser.add_argument(
@@ -163,7 +434,105 @@ def get_parser():
         action="store_true",
         help="Just write RPMs from sigcache, don't sign anything.",
     )
+    group.add_argument(
+        "--just-verify",
+        action="store_true",
+        help="Just verify that signed RPMs exist and are signed with expected sigkeys, don't sign or write anything.",
+    )
+    group.add_argument(
+        "--estimate",
+        action="store_true",
+        help="Just estimate numbers and sizes of RPMs to be signed or written and duration of signing, don't sign or write anything. "
+             "Signatures are read from koji, files are checked only for a random sample of RPMs.",
+    )
 
+    parser.add_argument(
+        "--local-write",
+        action="store_true",
+        help="Write signed RPMs directly to koji volume instead of the hub. The volume must be mounted read-write.",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Verify that signed RPMs exist and are signed with expected sigkeys after writing them.",
+    )
+
+    parser.add_argument(
+        "--priority-packages",
+        metavar="FILE",
+        help="File with a list of packages to be signed first, e.g. critical path. One package per line, '#' starts a comment.",
+    )
+    parser.add_argument(
+        "--priority",
+        dest="priorities",
+        action="append",
+        choices=sorted(PRIORITIES),
+        help="Order of signing, can be specified multiple times: "
+             "noarch (noarch RPMs first), smallest (smallest RPMs first), srpm-first (SRPMs first, debuginfo last).",
+    )
+    parser.add_argument(
+        "--pause-after-priority",
+        action="store_true",
+        help="Stop after priority packages are signed. Run again without this option to sign remaining packages.",
+    )
+    parser.add_argument(
+        "--chunk-time",
+        type=int,
+        default=60,
+        help="Target duration of signing a chunk of RPMs in seconds. "
+             "Chunk sizes are adapted to measured copy, sign and import times.",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=512,
+        metavar="MIB",
+        help="Read ahead RPMs to be signed, so copying them to temp overlaps with signing. "
+             "Limit of prefetched data in MiB, 0 disables it.",
+    )
+    parser.add_argument(
+        "--lease-dir",
+        help="Directory with leases shared by signing jobs running at the same time. "
+             "RPMs being signed by another job are skipped and waited on.",
+    )
+    parser.add_argument(
+        "--queue-dir",
+        help="Publish RPMs to be signed to a work queue in this directory and wait until koji-sign-worker processes sign them.",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        metavar="PATH",
+        help="Write wall time, numbers of RPMs, bytes and koji RPCs of each signing stage to a JSON file at the end.",
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        metavar="PATH",
+        help="Write metrics of signing stages to a file for Prometheus node_exporter textfile collector (*.prom) at the end.",
+    )
+    parser.add_argument(
+        "--progress",
+        default="none",
+        choices=PROGRESS_MODES,
+        help="Report progress of signing stages with throughput and ETA: "
+             "a status line on a terminal (tty), a log record every minute (log), "
+             "tty on a terminal and log otherwise (auto) or nothing (none, default).",
+    )
+    parser.add_argument(
+        "--rpc-trace",
+        metavar="PATH",
+        help="Time koji RPCs, write calls slower than --rpc-trace-threshold to a trace file (JSON lines) "
+             "and log histograms of RPC durations at the end.",
+    )
+    parser.add_argument(
+        "--rpc-trace-threshold",
+        type=float,
+        default=1.0,
+        metavar="SECONDS",
+        help="Duration of koji RPCs written to the trace file.",
+    )
+    add_memprofile_arguments(parser)
+    add_cassette_arguments(parser)
+    add_trace_arguments(parser)
     parser.add_argument(
         "--commit",
         action="store_true",
@@ -174,9 +543,55 @@ def get_parser():
         default="default",
         help="Select environment in which the program will make changes.",
     )
+    parser.add_argument(
+        "-d", "--debug",
+        action="store_true",
+        help="Print traceback for exceptions. By default only exception messages are displayed.",
+    )
     return parser
 
 
+def read_package_list(path):
+    """
+    Read package names from a file.
+
+    :param path: Path to a file with one package per line, '#' starts a comment
+    :type  path: str
+    :returns: List of package names
+    :rtype:   list
+    """
+    result = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                result.append(line)
+    return result
+
+
+def parse_release_ids(release_ids, level):
+    """
+    Split RELEASE_ID[:LEVEL] arguments to release IDs and levels.
+
+    :param release_ids: List of release IDs with optional levels
+    :type  release_ids: list
+    :param level: Default signature level
+    :type  level: str
+    :returns: (release_ids, levels)
+    :rtype:   tuple
+    """
+    result_release_ids = []
+    result_levels = []
+    for i in release_ids:
+        release_id, _, release_level = i.partition(":")
+        release_level = release_level or level
+        if release_level not in LEVELS:
+            raise UsageError("Unknown level '%s' of release: %s" % (release_level, release_id))
+        result_release_ids.append(release_id)
+        result_levels.append(release_level)
+    return result_release_ids, result_levels
+
+
 def main():
     """
     Main function.
@@ -184,10 +599,26 @@ def main():
     try:
         parser = get_parser()
         args = parser.parse_args()
-        env = Environment(args.env)
-        release = Release(args.release_id)
-        sign = KojiSignRPMsInRelease(env, release, args.level, packages=args.packages, just_sign=args.just_sign, just_write=args.just_write)
-        sign.run(commit=args.commit)
+        with trace(args.trace):
+            env = Environment(args.env)
+            release_ids, levels = parse_release_ids(args.release_ids, args.level)
+            releases = [Release(i) for i in release_ids]
+            priority_packages = read_package_list(args.priority_packages) if args.priority_packages else None
+            cassette = get_cassette(args)
+            sign = KojiSignRPMsInRelease(env, releases, levels, packages=args.packages, just_sign=args.just_sign, just_write=args.just_write,
+                                         just_verify=args.just_verify, local_write=args.local_write, verify=args.verify,
+                                         priority_packages=priority_packages, priorities=args.priorities,
+                                         pause_after_priority=args.pause_after_priority, lease_dir=args.lease_dir,
+                                         queue_dir=args.queue_dir, chunk_time=args.chunk_time,
+                                         prefetch=args.prefetch, estimate=args.estimate,
+                                         metrics_json=args.metrics_json, metrics_prom=args.metrics_prom, cassette=cassette,
+                                         memprofile=args.memprofile, progress=args.progress,
+                                         rpc_trace=args.rpc_trace, rpc_trace_threshold=args.rpc_trace_threshold)
+            try:
+                sign.run(commit=args.commit)
+            finally:
+                if cassette:
+                    cassette.close()
 
     except Error:
         if not args.debug:
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Scratch directories for copies of RPMs being signed.
+
+Scratch directories are configured in the environment as ``sign_scratch_dirs``::
+
+    "sign_scratch_dirs": [
+        {"path": "/dev/shm/releng-sop", "max_size": 4096},
+        {"path": "/var/tmp/releng-sop", "max_size": 65536},
+        "/var/tmp"
+    ]
+
+``max_size`` (MiB, optional) limits how much space signing may use in the directory.
+
+Each chunk goes to a directory with enough free space,
+the fastest one according to measured copy throughput
+(directories that haven't been measured yet are tried first)
+and the one with most free space if throughput is equal.
+If no directory has enough space, signing waits until other chunks
+or other processes free enough space and fails if that doesn't happen within a timeout.
+A chunk bigger than any directory (its file system or ``max_size``) fails right away.
+"""
+
+
+from __future__ import print_function
+
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from .common import get_logger, ConfigError, Error
+
+
+__all__ = (
+    "ScratchDirs",
+)
+
+
+class ScratchDirs(object):
+    """
+    Place chunks of RPMs on scratch directories.
+
+    :param dirs: List of paths or dicts with 'path' and optional 'max_size' in MiB
+    :type  dirs: list
+    :param interval: Polling interval in seconds when waiting for free space
+    :type  interval: int=5
+    :param timeout: Give up waiting for free space after timeout seconds
+    :type  timeout: int=3600
+    :param logger: Custom logger
+    :type  logger: logging.Logger
+    """
+
+    def __init__(self, dirs, interval=5, timeout=3600, logger=None):  # noqa: D102
+        self.interval = interval
+        self.timeout = timeout
+        self.logger = logger or get_logger(self, logging.INFO)
+        self.dirs = []
+        for i in dirs:
+            if not isinstance(i, dict):
+                i = {"path": i}
+            if "path" not in i:
+                raise ConfigError("Scratch directory path is not set: %s" % i)
+            self.dirs.append({
+                "path": i["path"],
+                "max_size": i.get("max_size") and i["max_size"] * 1024 ** 2,
+                # bytes reserved by chunks in the directory
+                "used": 0,
+                # measured copy throughput in bytes per second
+                "throughput": None,
+            })
+            if not os.path.isdir(i["path"]):
+                os.makedirs(i["path"])
+        if not self.dirs:
+            raise ConfigError("No scratch directories configured")
+
+        # temp_dir -> (scratch dir, size)
+        self._reserved = {}
+        self._cond = threading.Condition()
+
+    def _get_fs_free(self, path):
+        stat = os.statvfs(path)
+        return stat.f_bavail * stat.f_frsize
+
+    def _get_fs_size(self, path):
+        stat = os.statvfs(path)
+        return stat.f_blocks * stat.f_frsize
+
+    def _get_capacity(self, scratch):
+        """
+        Return the most space a chunk can ever get in a scratch directory in bytes.
+        """
+        capacity = self._get_fs_size(scratch["path"])
+        if scratch["max_size"]:
+            capacity = min(capacity, scratch["max_size"])
+        return capacity
+
+    def _get_free(self, scratch):
+        """
+        Return free space for a new chunk in a scratch directory in bytes.
+        """
+        free = self._get_fs_free(scratch["path"])
+        if scratch["max_size"]:
+            free = min(free, scratch["max_size"] - scratch["used"])
+        return free
+
+    def get_free_space(self):
+        """
+        Return the most free space in any scratch directory in MiB.
+
+        :rtype: float
+        """
+        with self._cond:
+            return float(max([self._get_free(i) for i in self.dirs])) / 1024 ** 2
+
+    def _select(self, size):
+        """
+        Select a scratch directory for a chunk or return None if it doesn't fit anywhere.
+        """
+        candidates = []
+        for scratch in self.dirs:
+            free = self._get_free(scratch)
+            if free >= size:
+                throughput = scratch["throughput"]
+                candidates.append((throughput is not None, -(throughput or 0), -free, scratch))
+        if candidates:
+            return min(candidates, key=lambda i: i[:3])[3]
+        return None
+
+    def mkdtemp(self, size, prefix="sign_rpms_"):
+        """
+        Create a temp directory for a chunk, wait for free space if needed.
+
+        :param size: Size of the chunk in bytes
+        :type  size: int
+        :param prefix: Temp directory prefix
+        :type  prefix: str
+        :return: Path to the temp directory
+        :rtype:  str
+        :raises Error: if the chunk doesn't fit into any directory within timeout or it's bigger than all of them
+        """
+        capacity = max([self._get_capacity(i) for i in self.dirs])
+        if size > capacity:
+            raise Error("Chunk of %.1f MiB is bigger than any scratch directory, the biggest has %.1f MiB"
+                        % (float(size) / 1024 ** 2, float(capacity) / 1024 ** 2))
+
+        deadline = None
+        with self._cond:
+            while True:
+                scratch = self._select(size)
+                if scratch is not None:
+                    break
+                if deadline is None:
+                    self.logger.info("Waiting for %.1f MiB of scratch space" % (float(size) / 1024 ** 2))
+                    deadline = time.time() + self.timeout
+                elif time.time() >= deadline:
+                    raise Error("Not enough scratch space for %.1f MiB after %s seconds, most free: %.1f MiB"
+                                % (float(size) / 1024 ** 2, self.timeout,
+                                   float(max([self._get_free(i) for i in self.dirs])) / 1024 ** 2))
+                # wake up on release() in this process, poll for space freed by other processes
+                self._cond.wait(self.interval)
+
+            temp_dir = tempfile.mkdtemp(prefix=prefix, dir=scratch["path"])
+            scratch["used"] += size
+            self._reserved[temp_dir] = (scratch, size)
+        return temp_dir
+
+    def record(self, temp_dir, duration):
+        """
+        Record how long copying a chunk took.
+
+        :param temp_dir: Temp directory returned by mkdtemp()
+        :type  temp_dir: str
+        :param duration: Duration of copying in seconds
+        :type  duration: float
+        """
+        scratch, size = self._reserved[temp_dir]
+        if duration <= 0 or not size:
+            return
+        throughput = size / duration
+        with self._cond:
+            if scratch["throughput"] is None:
+                scratch["throughput"] = throughput
+            else:
+                # moving average, storage gets busy or idle over time
+                scratch["throughput"] = 0.7 * scratch["throughput"] + 0.3 * throughput
+
+    def release(self, temp_dir):
+        """
+        Release space reserved for a temp directory; call after removing it.
+
+        :param temp_dir: Temp directory returned by mkdtemp()
+        :type  temp_dir: str
+        """
+        with self._cond:
+            scratch, size = self._reserved.pop(temp_dir)
+            scratch["used"] -= size
+            self._cond.notify_all()
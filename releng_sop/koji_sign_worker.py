@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Sign chunks of RPMs published to a work queue by koji-sign-rpms-in-release --queue-dir.
+
+Any number of workers can run on one or more signing hosts sharing the queue directory.
+Each worker claims a chunk, signs it, imports the signatures to koji,
+writes signed copies and reports the result back to the coordinator.
+
+Signatures are read from koji before signing,
+RPMs signed meanwhile (e.g. a chunk returned to the queue after a worker crash) are only written.
+"""
+
+
+from __future__ import print_function
+from __future__ import unicode_literals
+import sys
+
+import argparse
+import logging
+import signal
+import threading
+import time
+
+from .common import Environment, Error, get_logger
+from .koji_sign import KojiSignRPMs, get_rpmsign_class
+from .koji_sign_queue import SignQueue
+
+
+class KojiSignWorker(object):
+    """
+    Claim chunks from a work queue and sign them.
+
+    :param env: Environment object.
+    :type  env: releng_sop.common.Environment
+    :param queue_dir: Spool directory shared with the coordinator.
+    :type  queue_dir: str
+    :param idle_timeout: Exit when the queue is empty for given number of seconds, run forever by default.
+    :type  idle_timeout: int=None
+    :param interval: Polling interval in seconds.
+    :type  interval: int=5
+    """
+
+    def __init__(self, env, queue_dir, idle_timeout=None, interval=5):  # noqa: D102
+        self.env = env
+        self.queue_dir = queue_dir
+        self.idle_timeout = idle_timeout
+        self.interval = interval
+        self.rpmsign_class = get_rpmsign_class(self.env)
+        self.logger = get_logger(self, logging.INFO)
+        self.queue = SignQueue(self.queue_dir, logger=self.logger)
+        self._koji_sign_cache = {}
+
+    def details(self):
+        """
+        Return details about command execution.
+
+        :returns: List of text lines with command execution details
+        :rtype:   list
+        """
+        return [
+            "Signing RPMs from a work queue",
+            " * env name:                %s" % self.env.name,
+            " * env config:              %s" % self.env.config_path,
+            " * queue dir:               %s" % self.queue_dir,
+            " * worker:                  %s" % self.queue.holder,
+            " * idle timeout:            %s" % self.idle_timeout,
+            " * signing class:           %s.%s" % (self.rpmsign_class.__module__, self.rpmsign_class.__name__),
+        ]
+
+    def _get_koji_sign(self, koji_profile, local_write):
+        """
+        Return KojiSignRPMs object, reuse koji sessions for chunks of the same coordinator.
+        """
+        key = (koji_profile, local_write)
+        result = self._koji_sign_cache.get(key)
+        if result is None:
+            scratch_dirs = self.env["sign_scratch_dirs"] if "sign_scratch_dirs" in self.env else None
+            result = KojiSignRPMs(koji_profile, self.rpmsign_class, logger=self.logger, local_write=local_write,
+                                  scratch_dirs=scratch_dirs)
+            self._koji_sign_cache[key] = result
+        return result
+
+    def process(self, chunk):
+        """
+        Sign a chunk of RPMs.
+
+        :param chunk: Chunk dict claimed from the queue
+        :type  chunk: dict
+        :return: Sigs imported or found in koji, {rpm_id: {sigkey: sighash}}
+        :rtype:  dict
+        """
+        sign = self._get_koji_sign(chunk["koji_profile"], chunk["local_write"])
+        sigkey = chunk["sigkey"]
+        rpm_info_list = chunk["rpm_info_list"]
+
+        rpm_sig_dict = sign.get_rpm_sig_dict(rpm_info_list)
+        done, pending = sign.find_cached(rpm_info_list, rpm_sig_dict, [sigkey])
+        if done:
+            self.logger.info("RPMs signed meanwhile: %s" % len(done))
+            if not chunk["just_sign"]:
+                sign.write_signed_rpms_from_sigcache(done, sigkey, rpm_sig_dict=rpm_sig_dict, commit=True)
+        if pending:
+            sign.sign_chunk(pending, sigkey, rpm_sig_dict, just_sign=chunk["just_sign"], commit=True)
+
+        rpm_ids = set([i["id"] for i in rpm_info_list])
+        return dict([(i, j) for i, j in rpm_sig_dict.items() if i in rpm_ids])
+
+    def _process_claimed(self, chunk):
+        """
+        Process a claimed chunk and keep touching it, so it's not returned to the queue.
+        """
+        finished = threading.Event()
+
+        def _heartbeat():
+            while not finished.wait(self.queue.ttl / 3.0):
+                self.queue.touch(chunk["id"])
+
+        thread = threading.Thread(target=_heartbeat)
+        thread.daemon = True
+        thread.start()
+        try:
+            self.logger.info("Signing chunk %s: %s RPMs" % (chunk["id"], len(chunk["rpm_info_list"])))
+            sigs = self.process(chunk)
+        except Exception as ex:
+            self.logger.exception("Signing chunk %s failed" % chunk["id"])
+            self.queue.fail(chunk, str(ex))
+        else:
+            self.queue.complete(chunk, {"sigs": sigs})
+        finally:
+            finished.set()
+            thread.join()
+
+    def run(self):
+        """
+        Print command details, process chunks until idle timeout.
+
+        :returns: Number of processed chunks
+        :rtype:   int
+        """
+        for i in self.details():
+            self.logger.info(i)
+
+        processed = 0
+        idle_since = time.time()
+        while True:
+            chunk = self.queue.claim()
+            if chunk is None:
+                if self.idle_timeout is not None and time.time() - idle_since >= self.idle_timeout:
+                    break
+                time.sleep(self.interval)
+                continue
+
+            self._process_claimed(chunk)
+            processed += 1
+            idle_since = time.time()
+
+        self.logger.info("Processed chunks: %s" % processed)
+        return processed
+
+
+def get_parser():
+    """
+    Construct argument parser.
+
+    :returns: ArgumentParser object with arguments set up.
+    :rtype:   argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description="Sign chunks of RPMs from a work queue shared with koji-sign-rpms-in-release.")
+    parser.add_argument(
+        "queue_dir",
+        metavar="QUEUE_DIR",
+        help="Spool directory shared with koji-sign-rpms-in-release --queue-dir.",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=int,
+        help="Exit when the queue is empty for given number of seconds. Run forever by default.",
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=5,
+        help="Polling interval in seconds.",
+    )
+    parser.add_argument(
+        "--env",
+        default="default",
+        help="Select environment which determines the signing class ('rpmsign_class').",
+    )
+    parser.add_argument(
+        "-d", "--debug",
+        action="store_true",
+        help="Print traceback for exceptions. By default only exception messages are displayed.",
+    )
+    return parser
+
+
+def main():
+    """
+    Main function.
+    """
+    try:
+        parser = get_parser()
+        args = parser.parse_args()
+        env = Environment(args.env)
+        worker = KojiSignWorker(env, args.queue_dir, idle_timeout=args.idle_timeout, interval=args.interval)
+
+        def _terminate(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, _terminate)
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            pass
+
+    except Error:
+        if not args.debug:
+            sys.tracebacklimit = 0
+        raise
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Peak memory and top allocation sites of command phases, measured with tracemalloc.
+
+Phases are:
+
+* stages of KojiSignRPMs, see releng_sop.koji_sign_metrics
+* pdc_query and pulp_admin of pulp commands
+
+For each phase the report shows:
+
+* peak - the highest traced memory while the phase was running
+* growth - the highest traced memory above the memory at the start of a phase run;
+  phases working on chunks of RPMs should keep it bounded by the chunk size, not by the number of RPMs
+* retained - memory left allocated by all runs of the phase
+* top allocation sites at the end of the phase run with the most memory allocated
+
+Only memory allocated by Python is traced, the report also shows the maximal RSS of the process.
+Phases running in several threads at once share the peak, so their peaks are upper bounds.
+Tracing slows Python code down several times; use it to diagnose memory, not in regular runs.
+
+The report is written as JSON if its path ends with .json, as text otherwise.
+"""
+
+
+from __future__ import print_function
+
+import json
+import linecache
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .common import UsageError
+
+
+__all__ = (
+    "MemoryProfiler",
+    "phase",
+    "add_memprofile_arguments",
+    "profile_memory",
+)
+
+
+# take a new snapshot of a phase only when memory grows by this ratio, snapshots are expensive
+SNAPSHOT_GROWTH = 1.1
+
+
+class MemoryProfiler(object):
+    """
+    Measure peak memory and allocation sites of phases.
+
+    :param top: Number of top allocation sites reported for each phase
+    :type  top: int=10
+    """
+
+    def __init__(self, top=10):  # noqa: D102
+        if tracemalloc is None:
+            raise UsageError("Memory profiling requires tracemalloc (python >= 3.4)")
+        self.top = top
+        self.phases = OrderedDict()
+        self._lock = threading.Lock()
+        self._running = 0
+        self._started = False
+        self._peak = 0
+
+    def start(self):
+        """
+        Start tracing memory allocations.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+
+    def stop(self):
+        """
+        Stop tracing memory allocations, if started by this profiler.
+        """
+        if self._started:
+            self._peak = self.get_peak()
+            tracemalloc.stop()
+            self._started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def get_peak(self):
+        """
+        Return the highest traced memory seen so far.
+
+        :rtype: int
+        """
+        if tracemalloc.is_tracing():
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+        return self._peak
+
+    def _get_phase(self, name):
+        result = self.phases.get(name)
+        if result is None:
+            result = self.phases[name] = OrderedDict([
+                ("calls", 0),
+                ("peak", 0),
+                ("growth", 0),
+                ("retained", 0),
+                ("snapshot_size", 0),
+                ("top", []),
+            ])
+        return result
+
+    def _start_phase(self):
+        with self._lock:
+            self._running += 1
+            current, peak = tracemalloc.get_traced_memory()
+            self._peak = max(self._peak, peak)
+            # reset_peak() is available in python >= 3.9; overlapping phases keep the peak
+            if self._running == 1 and hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+        return current
+
+    def _end_phase(self, name, start):
+        with self._lock:
+            self._running -= 1
+            current, peak = tracemalloc.get_traced_memory()
+            self._peak = max(self._peak, peak)
+            data = self._get_phase(name)
+            data["calls"] += 1
+            data["peak"] = max(data["peak"], peak)
+            data["growth"] = max(data["growth"], peak - start)
+            data["retained"] += current - start
+            if current <= data["snapshot_size"] * SNAPSHOT_GROWTH:
+                return
+            data["snapshot_size"] = current
+            data["top"] = self._get_top()
+
+    def _get_top(self):
+        """
+        Return [(site, size, count, source line)] of the biggest allocation sites.
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib.*>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ])
+        result = []
+        for stat in snapshot.statistics("lineno")[:self.top]:
+            frame = stat.traceback[0]
+            line = linecache.getline(frame.filename, frame.lineno).strip()
+            site = "%s:%s" % (_shorten_path(frame.filename), frame.lineno)
+            result.append((site, stat.size, stat.count, line))
+        return result
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measure a phase.
+
+        :param name: Phase name
+        :type  name: str
+        :rtype: contextmanager
+        """
+        if not tracemalloc.is_tracing():
+            yield
+            return
+        start = self._start_phase()
+        try:
+            yield
+        finally:
+            self._end_phase(name, start)
+
+    def to_dict(self):
+        """
+        Return measured values as a dict; sizes are in bytes.
+
+        :return: {"peak": int, "max_rss": int, "phases": {name: {"calls", "peak", "growth", "retained", "top": [...]}}}
+        :rtype:  dict
+        """
+        phases = OrderedDict()
+        with self._lock:
+            for name, data in self.phases.items():
+                data = OrderedDict(data)
+                data.pop("snapshot_size")
+                data["top"] = [OrderedDict([("site", i[0]), ("size", i[1]), ("count", i[2]), ("line", i[3])]) for i in data["top"]]
+                phases[name] = data
+        return OrderedDict([
+            ("peak", self.get_peak()),
+            ("max_rss", get_max_rss()),
+            ("phases", phases),
+        ])
+
+    def format(self):
+        """
+        Return a table of phases and their top allocation sites as text lines.
+
+        :return: List of text lines
+        :rtype:  list
+        """
+        data = self.to_dict()
+        result = [
+            "Traced peak: %.1f MiB" % _mib(data["peak"]),
+            "Max RSS:     %.1f MiB" % _mib(data["max_rss"]),
+            "",
+            "%-16s %8s %12s %12s %14s" % ("phase", "calls", "peak [MiB]", "growth [MiB]", "retained [MiB]"),
+        ]
+        for name, phase_data in data["phases"].items():
+            result.append("%-16s %8d %12.1f %12.1f %14.1f"
+                          % (name, phase_data["calls"], _mib(phase_data["peak"]), _mib(phase_data["growth"]), _mib(phase_data["retained"])))
+        for name, phase_data in data["phases"].items():
+            if not phase_data["top"]:
+                continue
+            result += ["", "Top allocation sites: %s" % name]
+            for i in phase_data["top"]:
+                result.append("%10.1f KiB %8d blocks  %s  %s" % (i["size"] / 1024.0, i["count"], i["site"], i["line"]))
+        return result
+
+    def write_report(self, path):
+        """
+        Write the report to a file, JSON if the path ends with .json, text otherwise.
+
+        :param path: Path to the file
+        :type  path: str
+        """
+        if path.endswith(".json"):
+            data = json.dumps(self.to_dict(), indent=4)
+        else:
+            data = "\n".join(self.format())
+        with open(path, "w") as f:
+            f.write(data + "\n")
+
+
+def _mib(size):
+    return size / 1024.0 ** 2
+
+
+def _shorten_path(path):
+    """
+    Return path relative to the directory above releng_sop if it's there.
+    """
+    topdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if path.startswith(topdir + os.sep):
+        return path[len(topdir) + 1:]
+    return path
+
+
+def get_max_rss():
+    """
+    Return maximal resident set size of the process in bytes, 0 if unknown.
+
+    :rtype: int
+    """
+    if resource is None:
+        return 0
+    # KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextmanager
+def phase(memprofiler, name):
+    """
+    Measure a phase with a profiler, do nothing if the profiler is not set.
+
+    :param memprofiler: Memory profiler
+    :type  memprofiler: MemoryProfiler
+    :param name: Phase name
+    :type  name: str
+    :rtype: contextmanager
+    """
+    if memprofiler is None:
+        yield
+        return
+    with memprofiler.phase(name):
+        yield
+
+
+def add_memprofile_arguments(parser):
+    """
+    Add --memprofile argument to a parser.
+
+    :param parser: Argument parser
+    :type  parser: argparse.ArgumentParser
+    """
+    parser.add_argument(
+        "--memprofile",
+        metavar="PATH",
+        help="Trace memory allocations and write peak memory and top allocation sites of each phase to a report "
+             "(JSON if PATH ends with .json). Slows the command down.",
+    )
+
+
+@contextmanager
+def profile_memory(path):
+    """
+    Trace memory while running a block and write the report at the end, even if the block fails.
+
+    :param path: Path to the report, see MemoryProfiler.write_report(); nothing is traced if not set
+    :type  path: str
+    :return: Context manager yielding started MemoryProfiler or None
+    :rtype:  contextmanager
+    """
+    if not path:
+        yield None
+        return
+    memprofiler = MemoryProfiler()
+    memprofiler.start()
+    try:
+        yield memprofiler
+    finally:
+        # peak must be read before tracing stops
+        memprofiler.get_peak()
+        try:
+            memprofiler.write_report(path)
+        finally:
+            memprofiler.stop()
@@ -23,13 +23,14 @@ Steps:
 from __future__ import print_function, unicode_literals
 import getpass
 import sys
-import subprocess
 
 from pdc_client import PDCClient
 import argparse
 
-from .common import Environment, Release, Error, UsageError, CommandBase
+from .cassette import add_cassette_arguments, get_cassette, get_client, check_call
+from .common import Environment, Release, Error, UsageError, CommandBase, add_trace_arguments, span, trace
 from .common_pulp import PulpAdminConfig
+from .memprofile import add_memprofile_arguments, phase, profile_memory
 
 
 class PulpClearRepos(CommandBase):
@@ -50,13 +51,22 @@ class PulpClearRepos(CommandBase):
 
     :param arch:               Architectures to be filtered for.
     :type arch:                list of strings
+
+    :param cassette:           Record PDC and pulp-admin traffic to a cassette or replay it.
+    :type cassette:            releng_sop.cassette.Cassette
+
+    :param memprofile:         Write peak memory and top allocation sites of PDC queries
+                               and pulp-admin commands to a report at the end.
+    :type memprofile:          string
     """
 
-    def __init__(self, env, release, repo_family, variants, arches):  # noqa: D102
+    def __init__(self, env, release, repo_family, variants, arches, cassette=None, memprofile=None):  # noqa: D102
         super(PulpClearRepos, self).__init__(env, release)
         self.repo_family = repo_family
         self.variants = variants
         self.arches = arches
+        self.cassette = cassette
+        self.memprofile = memprofile
         self.repos = []
         self.pulp_config = PulpAdminConfig(self.env["pulp_server"])
         self.pulp_password = self.pulp_config["client"].get("password")
@@ -91,7 +101,7 @@ class PulpClearRepos(CommandBase):
         if self.repo_family == 'dist':
             raise UsageError('REPO_FAMILY must never be \"dist\"')
 
-        client = PDCClient(self.env["pdc_server"], develop=True)
+        client = get_client(self.cassette, "pdc", lambda: PDCClient(self.env["pdc_server"], develop=True))
 
         data = {
             "release_id": self.release_id,
@@ -102,7 +112,9 @@ class PulpClearRepos(CommandBase):
             "variant_uid": self.variants,
         }
 
-        result = client['content-delivery-repos']._(page_size=0, **data)
+        with span("content-delivery-repos", "pdc", **data) as span_args:
+            result = client['content-delivery-repos']._(page_size=0, **data)
+            span_args["results"] = len(result)
         self.repos = [i['name'] for i in result]
 
     def details(self, commit=False):
@@ -187,13 +199,16 @@ class PulpClearRepos(CommandBase):
 
     def run(self, commit=False):
         """Print command details, get command and run it."""
-        details = self.details(commit=commit)
-        print(details)
-        commands_exec = self.get_cmd(add_password=True, commit=commit)
-        commands_print = self.get_cmd(add_password=False, commit=commit)
-        for cmd_exec, cmd_print in zip(commands_exec, commands_print):
-            print(cmd_print)
-            subprocess.check_call(cmd_exec)
+        with span("PulpClearRepos.run", "command", commit=commit), profile_memory(self.memprofile) as memprofiler:
+            with phase(memprofiler, "pdc_query"), span("pdc_query", "command"):
+                details = self.details(commit=commit)
+            print(details)
+            commands_exec = self.get_cmd(add_password=True, commit=commit)
+            commands_print = self.get_cmd(add_password=False, commit=commit)
+            with phase(memprofiler, "pulp_admin"), span("pulp_admin", "command"):
+                for cmd_exec, cmd_print in zip(commands_exec, commands_print):
+                    print(cmd_print)
+                    check_call(self.cassette, cmd_exec, cmd_print)
 
 
 def get_parser():
@@ -246,6 +261,9 @@ def get_parser():
         action="store_true",
         help="Print traceback for exceptions. By default only exception messages are displayed.",
     )
+    add_cassette_arguments(parser)
+    add_memprofile_arguments(parser)
+    add_trace_arguments(parser)
     return parser
 
 
@@ -254,11 +272,18 @@ def main():
     try:
         parser = get_parser()
         args = parser.parse_args()
-        env = Environment(args.env)
-        release = Release(args.release_id)
-        clear = PulpClearRepos(env, release, args.repo_family, args.variants, args.arches)
-        clear.password_prompt(args.commit)
-        clear.run(commit=args.commit)
+        with trace(args.trace):
+            env = Environment(args.env)
+            release = Release(args.release_id)
+            cassette = get_cassette(args)
+            clear = PulpClearRepos(env, release, args.repo_family, args.variants, args.arches, cassette=cassette,
+                                   memprofile=args.memprofile)
+            clear.password_prompt(args.commit)
+            try:
+                clear.run(commit=args.commit)
+            finally:
+                if cassette:
+                    cassette.close()
 
     except Error:
         if not args.debug:
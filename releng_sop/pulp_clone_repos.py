@@ -25,13 +25,14 @@ from __future__ import print_function
 from __future__ import unicode_literals
 import getpass
 import sys
-import subprocess
 
 from pdc_client import PDCClient
 import argparse
 
-from .common import Environment, Release, Error, UsageError
+from .cassette import add_cassette_arguments, get_cassette, get_client, check_call
+from .common import Environment, Release, Error, UsageError, add_trace_arguments, span, trace
 from .common_pulp import PulpAdminConfig
+from .memprofile import add_memprofile_arguments, phase, profile_memory
 
 
 class PulpCloneRepos(object):
@@ -61,10 +62,17 @@ class PulpCloneRepos(object):
 
     :param skip_repo_check:    Repo_from and repo_to differ, fail instantly unless --skip-repo-check is set.
     :type skip_repo_check:     boolean
+
+    :param cassette:           Record PDC and pulp-admin traffic to a cassette or replay it.
+    :type cassette:            releng_sop.cassette.Cassette
+
+    :param memprofile:         Write peak memory and top allocation sites of PDC queries
+                               and pulp-admin commands to a report at the end.
+    :type memprofile:          string
     """
 
     def __init__(self, env, release_from, release_to, repo_family, variants, arches,  # noqa: D102
-                 content_categories, skip_repo_check):
+                 content_categories, skip_repo_check, cassette=None, memprofile=None):
         self.env = env
         self.release_id_from = release_from.name
         self.release_from = release_from
@@ -76,6 +84,8 @@ class PulpCloneRepos(object):
         self.pulp_config = PulpAdminConfig(self.env["pulp_server"])
         self.skip_repo_check = skip_repo_check
         self.content_categories = content_categories
+        self.cassette = cassette
+        self.memprofile = memprofile
         self.pulp_password = self.pulp_config["client"].get("password")
 
     def rearange(self, result):
@@ -139,10 +149,14 @@ class PulpCloneRepos(object):
 
         if self.release_id_from == self.release_id_to:
             raise UsageError('Release id is same')
-        client = PDCClient(self.env["pdc_server"], develop=True)
+        client = get_client(self.cassette, "pdc", lambda: PDCClient(self.env["pdc_server"], develop=True))
 
-        result_from = client['content-delivery-repos']._(page_size=0, **query_data_from)
-        result_to = client['content-delivery-repos']._(page_size=0, **query_data_to)
+        with span("content-delivery-repos", "pdc", **query_data_from) as span_args:
+            result_from = client['content-delivery-repos']._(page_size=0, **query_data_from)
+            span_args["results"] = len(result_from)
+        with span("content-delivery-repos", "pdc", **query_data_to) as span_args:
+            result_to = client['content-delivery-repos']._(page_size=0, **query_data_to)
+            span_args["results"] = len(result_to)
 
         if (len(result_from) != len(result_to)) and (not self.skip_repo_check):
             raise UsageError('Error')
@@ -262,13 +276,16 @@ class PulpCloneRepos(object):
 
     def run(self, commit=False):
         """Print command details, get command and run it."""
-        details = self.details(commit=commit)
-        print(details)
-        commands_exec = self.get_cmd(add_password=True, commit=commit)
-        commands_print = self.get_cmd(add_password=False, commit=commit)
-        for cmd_exec, cmd_print in zip(commands_exec, commands_print):
-            print(cmd_print)
-            subprocess.check_call(cmd_exec)
+        with span("PulpCloneRepos.run", "command", commit=commit), profile_memory(self.memprofile) as memprofiler:
+            with phase(memprofiler, "pdc_query"), span("pdc_query", "command"):
+                details = self.details(commit=commit)
+            print(details)
+            commands_exec = self.get_cmd(add_password=True, commit=commit)
+            commands_print = self.get_cmd(add_password=False, commit=commit)
+            with phase(memprofiler, "pulp_admin"), span("pulp_admin", "command"):
+                for cmd_exec, cmd_print in zip(commands_exec, commands_print):
+                    print(cmd_print)
+                    check_call(self.cassette, cmd_exec, cmd_print)
         if self.sameName:
             for x in self.sameName:
                 print('Source and destination is the same. Cloning "%s" skipped.' % x['from'])
@@ -345,6 +362,9 @@ def get_parser():
         action="store_true",
         help="Print traceback for exceptions. By default only exception messages are displayed.",
     )
+    add_cassette_arguments(parser)
+    add_memprofile_arguments(parser)
+    add_trace_arguments(parser)
     return parser
 
 
@@ -353,13 +373,20 @@ def main():
     try:
         parser = get_parser()
         args = parser.parse_args()
-        env = Environment(args.env)
-        release_from = Release(args.from_release_id)
-        release_to = Release(args.to_release_id)
-        clone = PulpCloneRepos(env, release_from, release_to, args.repo_family, args.variants,
-                               args.arches, args.content_categories, args.skip_repo_check)
-        clone.password_prompt(args.commit)
-        clone.run(commit=args.commit)
+        with trace(args.trace):
+            env = Environment(args.env)
+            release_from = Release(args.from_release_id)
+            release_to = Release(args.to_release_id)
+            cassette = get_cassette(args)
+            clone = PulpCloneRepos(env, release_from, release_to, args.repo_family, args.variants,
+                                   args.arches, args.content_categories, args.skip_repo_check, cassette=cassette,
+                                   memprofile=args.memprofile)
+            clone.password_prompt(args.commit)
+            try:
+                clone.run(commit=args.commit)
+            finally:
+                if cassette:
+                    cassette.close()
 
     except Error:
         if not args.debug:
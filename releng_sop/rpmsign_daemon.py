@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Long-running RPM signing daemon and its client.
+
+The daemon listens on a Unix socket and keeps signing workers
+(their signing class instances and resolved key names) warm
+between requests, so that signing a chunk doesn't pay key lookup costs.
+The signer is created and the keys are resolved once at startup,
+before the workers are forked, so a misconfiguration fails the daemon right away.
+
+Protocol: newline delimited JSON messages over a Unix stream socket.
+A client streams any number of requests and reads responses
+as they complete, in arbitrary order, matched by 'id'.
+
+Requests of a connection are grouped by sigkey into batches,
+each batch is signed by a worker with one call of the signing class
+(one 'rpm --resign' process with LocalRPMSign).
+A batch is dispatched when it's full or when the client closes its side of the connection;
+the rest of the requests is then split among workers.
+If signing a batch fails, its RPMs are signed one by one to report which of them failed.
+
+Requests:
+
+* ``{"id": 1, "sigkey": "81b46521", "path": "/tmp/foo.rpm"}`` - sign an RPM in-place
+
+Responses:
+
+* ``{"id": 1, "status": "ok"}``
+* ``{"id": 2, "status": "error", "error": "<message>"}``
+
+To use the daemon from KojiSignRPMs, set 'rpmsign_class'
+to 'releng_sop.rpmsign_daemon.DaemonRPMSign'.
+"""
+
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+
+from six.moves import socketserver
+
+from .common import Environment, Error, ConfigError, get_logger
+from .koji_sign import get_gpg_name, get_rpmsign_class
+
+
+__all__ = (
+    "DaemonRPMSign",
+    "RPMSignClient",
+    "RPMSignServer",
+)
+
+
+DEFAULT_SOCKET_PATH = "/run/releng-sop/rpmsign.sock"
+DEFAULT_BATCH_SIZE = 100
+
+
+# per-process state of signing workers
+_WORKER = {}
+
+
+def _init_worker(signer):
+    """
+    Initialize a signing worker process with the signer created by the daemon.
+    """
+    # signals are handled by the parent process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _WORKER["signer"] = signer
+
+
+def _get_error_response(request, ex):
+    return {"id": request.get("id"), "status": "error", "error": "%s: %s" % (ex.__class__.__name__, ex)}
+
+
+def _sign_batch(sigkey, requests):
+    """
+    Sign RPMs of requests with one call of the signer in a signing worker.
+
+    :param sigkey: Sigkey ID (hash), lowercase
+    :type  sigkey: str
+    :param requests: Decoded request messages with 'path'
+    :type  requests: list
+    :return: Response messages
+    :rtype:  list
+    """
+    try:
+        _WORKER["signer"].sign(sigkey, [i["path"] for i in requests])
+    except Exception as ex:
+        if len(requests) == 1:
+            return [_get_error_response(requests[0], ex)]
+        # find the failed RPMs; signing RPMs signed before the failure again is harmless
+        return [_sign_batch(sigkey, [i])[0] for i in requests]
+    return [{"id": i.get("id"), "status": "ok"} for i in requests]
+
+
+def _split(items, parts):
+    """
+    Split a list to at most 'parts' lists of similar size.
+    """
+    size = max(-(-len(items) // parts), 1)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Read requests from a client connection and dispatch them to signing workers.
+    """
+
+    def handle(self):  # noqa: D102
+        write_lock = threading.Lock()
+        pending = []
+        # {sigkey: [request]}
+        batches = {}
+
+        def _respond(responses):
+            data = "".join([json.dumps(i) + "\n" for i in responses]).encode("utf-8")
+            with write_lock:
+                try:
+                    self.wfile.write(data)
+                    self.wfile.flush()
+                except socket.error:
+                    # client went away; nothing to report to
+                    pass
+
+        def _dispatch(sigkey, requests):
+            self.server.logger.debug("Signing %s RPMs with %s" % (len(requests), sigkey))
+            pending.append(self.server.pool.apply_async(_sign_batch, (sigkey, requests), callback=_respond))
+
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line.decode("utf-8"))
+            except ValueError as ex:
+                _respond([{"id": None, "status": "error", "error": "Invalid request: %s" % ex}])
+                continue
+            self.server.logger.debug("Request: %s" % request)
+            if not request.get("sigkey") or not request.get("path"):
+                _respond([{"id": request.get("id"), "status": "error", "error": "Request must contain 'sigkey' and 'path'"}])
+                continue
+            sigkey = request["sigkey"].lower()
+            batch = batches.setdefault(sigkey, [])
+            batch.append(request)
+            if len(batch) >= self.server.batch_size:
+                _dispatch(sigkey, batches.pop(sigkey))
+
+        # client closed its side of the connection, spread the rest over workers
+        for sigkey, requests in sorted(batches.items()):
+            for batch in _split(requests, self.server.workers):
+                _dispatch(sigkey, batch)
+
+        for result in pending:
+            result.wait()
+
+
+class RPMSignServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Signing daemon listening on a Unix socket.
+
+    :param socket_path: Path to the Unix socket
+    :type  socket_path: str
+    :param rpmsign_class: Reference to a class that implements signing
+    :type  rpmsign_class: object
+    :param workers: Number of signing worker processes
+    :type  workers: int
+    :param gnupghome: Path to GNUPG home directory, passed to rpmsign_class
+    :type  gnupghome: str=None
+    :param sigkeys: Sigkeys to resolve at startup
+    :type  sigkeys: list=None
+    :param batch_size: Maximal number of RPMs signed with one call of rpmsign_class
+    :type  batch_size: int=DEFAULT_BATCH_SIZE
+    :param logger: Custom logger
+    :type  logger: logging.Logger
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, rpmsign_class, workers=4, gnupghome=None, sigkeys=None, logger=None,  # noqa: D102
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self.socket_path = socket_path
+        self.workers = workers
+        self.batch_size = batch_size
+        self.logger = logger or get_logger(self, logging.INFO)
+
+        # fail early on a broken signer or unknown keys, before listening;
+        # a worker failing in the pool initializer would be respawned forever
+        signer = rpmsign_class(gnupghome=gnupghome) if gnupghome else rpmsign_class()
+        # get_gpg_name() caches the names, forked workers inherit them
+        sigkeys = [i.lower() for i in sigkeys or []]
+        for sigkey in sigkeys:
+            gpg_name = get_gpg_name(sigkey, gnupghome=gnupghome)
+            if not gpg_name:
+                raise ConfigError("Unknown sigkey: %s" % sigkey)
+            self.logger.info("Key %s: %s" % (sigkey, gpg_name))
+
+        if os.path.exists(socket_path):
+            # stale socket from a previous run
+            os.unlink(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, _RequestHandler)
+        os.chmod(socket_path, 0o660)
+
+        self.pool = multiprocessing.Pool(workers, _init_worker, (signer, ))
+
+    def server_close(self):  # noqa: D102
+        socketserver.UnixStreamServer.server_close(self)
+        self.pool.close()
+        self.pool.join()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class RPMSignClient(object):
+    """
+    Client of the signing daemon.
+
+    :param socket_path: Path to the Unix socket
+    :type  socket_path: str
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH):  # noqa: D102
+        self.socket_path = socket_path
+
+    def call(self, requests):
+        """
+        Send requests to the daemon and return responses.
+
+        Requests are streamed at once, responses are collected
+        in the order the daemon completes them.
+
+        :param requests: List of request dictionaries (without 'id')
+        :type  requests: list
+        :return: List of responses in the order of requests
+        :rtype:  list
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        try:
+            def _send():
+                for num, request in enumerate(requests):
+                    request = dict(request, id=num)
+                    sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+                sock.shutdown(socket.SHUT_WR)
+
+            # send from a separate thread to keep reading responses while sending
+            sender = threading.Thread(target=_send)
+            sender.daemon = True
+            sender.start()
+
+            responses = {}
+            for line in sock.makefile("rb"):
+                response = json.loads(line.decode("utf-8"))
+                responses[response["id"]] = response
+            sender.join()
+        finally:
+            sock.close()
+
+        if len(responses) != len(requests):
+            raise Error("Signing daemon returned %s responses for %s requests" % (len(responses), len(requests)))
+        return [responses[i] for i in range(len(requests))]
+
+    def sign_paths(self, sigkey, paths):
+        """
+        Sign RPMs in-place.
+
+        :param sigkey: Sigkey ID (hash)
+        :type  sigkey: str
+        :param paths: Paths to RPMs to be signed
+        :type  paths: list
+        """
+        responses = self.call([{"sigkey": sigkey, "path": path} for path in paths])
+        errors = ["%s: %s" % (path, response["error"]) for path, response in zip(paths, responses) if response["status"] != "ok"]
+        if errors:
+            raise Error("Failed to sign RPMs with '%s':\n%s" % (sigkey, "\n".join(errors)))
+
+
+class DaemonRPMSign(object):
+    """
+    Sign RPMs by sending them to a signing daemon.
+
+    Override 'socket_path' in a subclass to use a different socket.
+    The RPM paths must be accessible from the daemon.
+    """
+
+    socket_path = DEFAULT_SOCKET_PATH
+
+    def sign(self, sigkey, paths):
+        """
+        Sign RPMs in specified paths with a sigkey.
+
+        :param sigkey: Sigkey ID (hash)
+        :type  sigkey: str
+        :param paths: Paths to RPMs to be signed
+        :type  paths: str
+        """
+        RPMSignClient(self.socket_path).sign_paths(sigkey, paths)
+
+
+def get_parser():
+    """
+    Construct argument parser.
+
+    :returns: ArgumentParser object with arguments set up.
+    :rtype:   argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description="Run a daemon that signs RPMs on requests sent to a Unix socket.")
+    parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET_PATH,
+        help="Path to the Unix socket to listen on.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of signing worker processes.",
+    )
+    parser.add_argument(
+        "--sigkey",
+        dest="sigkeys",
+        action="append",
+        help="Resolve a sigkey at startup to fail early if it's not available.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Maximal number of RPMs signed with one call of the signing class, e.g. one 'rpm --resign' process.",
+    )
+    parser.add_argument(
+        "--gnupghome",
+        help="Path to GNUPG home directory with signing keys, used for key lookups and by the signing class.",
+    )
+    parser.add_argument(
+        "--env",
+        default="default",
+        help="Select environment which determines the signing class ('rpmsign_class').",
+    )
+    parser.add_argument(
+        "-d", "--debug",
+        action="store_true",
+        help="Print traceback for exceptions. By default only exception messages are displayed.",
+    )
+    return parser
+
+
+def main():
+    """
+    Main function.
+    """
+    try:
+        parser = get_parser()
+        args = parser.parse_args()
+        env = Environment(args.env)
+        rpmsign_class = get_rpmsign_class(env)
+        if issubclass(rpmsign_class, DaemonRPMSign):
+            raise ConfigError("The daemon can't use '%s' for signing, pick a local signing class" % env["rpmsign_class"])
+
+        server = RPMSignServer(args.socket, rpmsign_class, workers=args.workers, gnupghome=args.gnupghome,
+                               sigkeys=args.sigkeys, batch_size=args.batch_size)
+        server.logger.info("Listening on %s" % args.socket)
+
+        def _terminate(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, _terminate)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    except Error:
+        if not args.debug:
+            sys.tracebacklimit = 0
+        raise
+
+
+if __name__ == "__main__":
+    main()
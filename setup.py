@@ -24,9 +24,12 @@ setup(
         "bin/koji-block-package-in-release",
         "bin/koji-create-package-in-release",
         "bin/koji-clone-tag-for-release-milestone",
+        "bin/koji-sign-audit",
         "bin/koji-sign-rpms-in-release",
+        "bin/koji-sign-worker",
         "bin/pulp-clear-repos",
         "bin/pulp-clone-repos",
+        "bin/rpmsign-daemon",
     ],
     test_suite="tests",
     tests_require=["mock", "six", "pdc-client"]
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Synthetic RPM corpus for tests and benchmarks of signing workflows.
+
+RPMCorpus writes fake RPMs that koji and KojiSignRPMs can read without changes:
+
+* lead with package name and type
+* signature header with size, MD5 and SHA1 digests
+  and optionally an OpenPGP signature with a chosen key ID (see fake_koji_hub.make_sighdr)
+* main header with NEVRA tags
+* payload of a size drawn from a distribution, filled with pseudo-random data or sparse
+
+RPMs are registered in a FakeKojiHub (started or not)
+and laid out in the koji volume the same way koji does (see fake_koji_hub.PathInfo):
+
+* main copies, optionally signed already
+* signed copies in ``data/signed/<sigkey>/`` with signature headers in ``data/sigcache/<sigkey>/``,
+  the hub knows these signatures
+
+Usage::
+
+    corpus = RPMCorpus(topdir, seed=0)
+    rpm_info_list = corpus.generate(1000, sizes="lognormal", size=100 * 1024,
+                                    main_sigkeys={"cafebabe": 0.1}, signed_copies={"deadbeef": 0.5})
+    with corpus.hub:
+        ...
+"""
+
+
+from __future__ import print_function
+
+import hashlib
+import math
+import os
+import random
+import struct
+
+from tests.fake_koji_hub import (
+    FakeKojiHub, LEAD_SIZE, RPM_INT32_TYPE, RPM_STRING_TYPE, RPM_BIN_TYPE, make_header, make_sighdr,
+)
+
+
+__all__ = (
+    "RPMCorpus",
+    "SIZE_DISTRIBUTIONS",
+    "get_size_distribution",
+    "make_lead",
+    "make_main_header",
+)
+
+
+SIZE_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+# signature header tags
+SIGTAG_MD5 = 1004
+SIGTAG_SHA1 = 269
+
+# main header tags
+RPMTAG_NAME = 1000
+RPMTAG_VERSION = 1001
+RPMTAG_RELEASE = 1002
+RPMTAG_EPOCH = 1003
+RPMTAG_SIZE = 1009
+RPMTAG_OS = 1021
+RPMTAG_ARCH = 1022
+RPMTAG_SOURCERPM = 1044
+RPMTAG_PAYLOADFORMAT = 1124
+
+ARCHES = ["x86_64", "noarch", "i686", "ppc64le", "s390x", "aarch64"]
+
+# payload is filled with this block rotated per RPM, random data doesn't compress or deduplicate
+PAYLOAD_BLOCK_SIZE = 1024 ** 2
+
+
+def get_size_distribution(name="lognormal", size=100 * 1024, max_size=1024 ** 3):
+    """
+    Return a function drawing payload sizes from a distribution.
+
+    * fixed - always size
+    * uniform - uniform between 0 and 2 * size
+    * lognormal - median size with a long tail, close to sizes of RPMs in a distribution
+
+    :param name: Distribution name, one of SIZE_DISTRIBUTIONS
+    :type  name: str="lognormal"
+    :param size: Mean (median for lognormal) payload size in bytes
+    :type  size: int
+    :param max_size: Maximum payload size in bytes
+    :type  max_size: int
+    :return: Function taking random.Random and returning a size in bytes
+    :rtype:  function
+    """
+    if name == "fixed":
+        return lambda rnd: size
+    if name == "uniform":
+        return lambda rnd: rnd.randint(0, 2 * size)
+    if name == "lognormal":
+        mu = math.log(max(size, 1))
+        return lambda rnd: min(int(rnd.lognormvariate(mu, 1.5)), max_size)
+    raise ValueError("Unknown size distribution: %s" % name)
+
+
+def make_lead(rpm_info):
+    """
+    Return a RPM lead of a RPM.
+
+    :param rpm_info: Koji rpm_info dictionary
+    :type  rpm_info: dict
+    :rtype: bytes
+    """
+    name = ("%(name)s-%(version)s-%(release)s" % rpm_info).encode("utf-8")[:65]
+    rpm_type = 1 if rpm_info["arch"] == "src" else 0
+    # magic, version 3.0, type, archnum, name, osnum, signature type (header style)
+    return b"\xed\xab\xee\xdb" + struct.pack(">BBHH66sHH16x", 3, 0, rpm_type, 1, name, 1, 5)
+
+
+def _string_entry(tag, value):
+    return (tag, RPM_STRING_TYPE, 1, value.encode("utf-8") + b"\0")
+
+
+def _int32_entry(tag, value):
+    return (tag, RPM_INT32_TYPE, 1, struct.pack(">I", min(value, 2 ** 32 - 1)))
+
+
+def make_main_header(rpm_info, payload_size=0):
+    """
+    Return a main header of a RPM with NEVRA tags.
+
+    :param rpm_info: Koji rpm_info dictionary
+    :type  rpm_info: dict
+    :param payload_size: Installed size
+    :type  payload_size: int=0
+    :rtype: bytes
+    """
+    entries = [
+        _string_entry(RPMTAG_NAME, rpm_info["name"]),
+        _string_entry(RPMTAG_VERSION, rpm_info["version"]),
+        _string_entry(RPMTAG_RELEASE, rpm_info["release"]),
+        _int32_entry(RPMTAG_SIZE, payload_size),
+        _string_entry(RPMTAG_OS, "linux"),
+        _string_entry(RPMTAG_ARCH, rpm_info["arch"]),
+        _string_entry(RPMTAG_PAYLOADFORMAT, "cpio"),
+    ]
+    if rpm_info.get("epoch") is not None:
+        entries.append(_int32_entry(RPMTAG_EPOCH, rpm_info["epoch"]))
+    if rpm_info["arch"] != "src":
+        entries.append(_string_entry(RPMTAG_SOURCERPM, "%(name)s-%(version)s-%(release)s.src.rpm" % rpm_info))
+    return make_header(entries)
+
+
+class RPMCorpus(object):
+    """
+    Generate fake RPMs in a koji volume.
+
+    :param topdir: Koji volume directory
+    :type  topdir: str
+    :param hub: Hub to register builds, RPMs and signatures in; a new hub (not started) by default
+    :type  hub: tests.fake_koji_hub.FakeKojiHub=None
+    :param seed: Seed of sizes, signatures and payloads
+    :type  seed: int=0
+    :param sparse: Leave payloads as holes: files take no space, MD5 digests are not stored
+    :type  sparse: bool=False
+    """
+
+    def __init__(self, topdir, hub=None, seed=0, sparse=False):  # noqa: D102
+        self.topdir = topdir
+        self.hub = hub or FakeKojiHub(topdir)
+        self.pathinfo = self.hub.pathinfo
+        self.sparse = sparse
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._block = None
+        self._build_num = 0
+
+    def _get_block(self):
+        if self._block is None:
+            digests = []
+            digest = str(self.seed).encode("ascii")
+            for i in range(PAYLOAD_BLOCK_SIZE // 64):
+                digest = hashlib.sha512(digest).digest()
+                digests.append(digest)
+            self._block = b"".join(digests)
+        return self._block
+
+    def _iter_payload(self, rpm_info, size):
+        """
+        Yield chunks of a payload, the same for the same RPM.
+        """
+        block = self._get_block()
+        offset = rpm_info["id"] * 4099 % len(block)
+        while size > 0:
+            chunk = block[offset:offset + size]
+            yield chunk
+            size -= len(chunk)
+            offset = 0
+
+    def _get_sig_entries(self, rpm_info, header, payload_size):
+        """
+        Return digest entries of a signature header.
+        """
+        entries = [_string_entry(SIGTAG_SHA1, hashlib.sha1(header).hexdigest())]
+        if not self.sparse:
+            md5 = hashlib.md5(header)
+            for chunk in self._iter_payload(rpm_info, payload_size):
+                md5.update(chunk)
+            entries.append((SIGTAG_MD5, RPM_BIN_TYPE, 16, md5.digest()))
+        return entries
+
+    def _write(self, path, rpm_info, sighdr, header, payload_size):
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(path, "wb") as f:
+            f.write(make_lead(rpm_info))
+            f.write(sighdr)
+            f.write(header)
+            if self.sparse:
+                f.truncate(LEAD_SIZE + len(sighdr) + len(header) + payload_size)
+            else:
+                for chunk in self._iter_payload(rpm_info, payload_size):
+                    f.write(chunk)
+
+    def write_rpm(self, rpm_info, payload_size, main_sigkey=None, signed_copies=()):
+        """
+        Write main copy of a RPM, its signed copies and cached signatures.
+
+        :param rpm_info: Koji rpm_info dictionary registered in the hub, 'size' is set to the file size
+        :type  rpm_info: dict
+        :param payload_size: Payload size in bytes
+        :type  payload_size: int
+        :param main_sigkey: Sigkey the main copy is signed with, unsigned if not set
+        :type  main_sigkey: str=None
+        :param signed_copies: Sigkeys of signed copies and cached signatures
+        :type  signed_copies: list=()
+        """
+        header = make_main_header(rpm_info, payload_size)
+        entries = self._get_sig_entries(rpm_info, header, payload_size)
+        sighdr = make_sighdr(main_sigkey, len(header) + payload_size, entries=entries)
+        self._write(self.hub.get_rpm_path(rpm_info), rpm_info, sighdr, header, payload_size)
+        rpm_info["size"] = LEAD_SIZE + len(sighdr) + len(header) + payload_size
+
+        for sigkey in signed_copies:
+            sigkey = sigkey.lower()
+            signed_sighdr = make_sighdr(sigkey, len(header) + payload_size, entries=entries)
+            self._write(self.hub.get_rpm_path(rpm_info, sigkey), rpm_info, signed_sighdr, header, payload_size)
+            sighdr_path = self.hub.get_sighdr_path(rpm_info, sigkey)
+            if not os.path.isdir(os.path.dirname(sighdr_path)):
+                os.makedirs(os.path.dirname(sighdr_path))
+            with open(sighdr_path, "wb") as f:
+                f.write(signed_sighdr)
+            with self.hub._lock:
+                self.hub.sigs.setdefault(rpm_info["id"], {})[sigkey] = signed_sighdr
+
+    def _choose_sigkey(self, fractions):
+        """
+        Return one of sigkeys with given probabilities or None.
+        """
+        value = self._random.random()
+        for sigkey, fraction in sorted(fractions.items()):
+            if value < fraction:
+                return sigkey
+            value -= fraction
+        return None
+
+    def generate(self, count, tag="corpus", rpms_per_build=3, sizes="lognormal", size=100 * 1024, max_size=1024 ** 3,
+                 main_sigkeys=None, signed_copies=None):
+        """
+        Generate RPMs in builds tagged into a tag.
+
+        :param count: Number of RPMs
+        :type  count: int
+        :param tag: Tag of the builds
+        :type  tag: str="corpus"
+        :param rpms_per_build: Number of RPMs per build, including SRPM
+        :type  rpms_per_build: int=3
+        :param sizes: Payload size distribution name (see get_size_distribution()), a function or a number
+        :type  sizes: str or function or int
+        :param size: Mean payload size in bytes, see get_size_distribution()
+        :type  size: int
+        :param max_size: Maximum payload size in bytes
+        :type  max_size: int
+        :param main_sigkeys: {sigkey: fraction of RPMs with main copies signed with the sigkey}, fractions add up to at most 1
+        :type  main_sigkeys: dict=None
+        :param signed_copies: {sigkey: fraction of RPMs with signed copies and cached signatures}
+        :type  signed_copies: dict=None
+        :return: Generated rpm_info dictionaries with 'build' set, the same as KojiSignRPMs.get_latest_tagged_rpms() returns
+        :rtype:  list
+        """
+        if isinstance(sizes, int):
+            sizes = get_size_distribution("fixed", sizes)
+        elif not callable(sizes):
+            sizes = get_size_distribution(sizes, size, max_size)
+        main_sigkeys = main_sigkeys or {}
+        signed_copies = signed_copies or {}
+
+        result = []
+        while len(result) < count:
+            build_size = min(rpms_per_build, count - len(result))
+            arches = [ARCHES[i % len(ARCHES)] if i < len(ARCHES) else "%s-%s" % (ARCHES[i % len(ARCHES)], i // len(ARCHES))
+                      for i in range(build_size - 1)]
+            # RPMs of the new build get the next IDs
+            first_id = len(self.hub.rpms) + 1
+            build_info = self.hub.add_build("corpus%06d" % self._build_num, tags=[tag], arches=arches, create_files=False)
+            self._build_num += 1
+            for rpm_id in range(first_id, first_id + build_size):
+                rpm_info = self.hub.rpms[rpm_id]
+                copies = [i for i, fraction in sorted(signed_copies.items()) if self._random.random() < fraction]
+                self.write_rpm(rpm_info, sizes(self._random), main_sigkey=self._choose_sigkey(main_sigkeys), signed_copies=copies)
+                result.append(dict(rpm_info, build=build_info))
+        return result
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for benchmarks/bench_koji_sign.py.
+"""
+
+
+import unittest
+
+import os
+import shutil
+import sys
+import tempfile
+from mock import Mock, patch
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+sys.path.insert(0, os.path.join(DIR, "..", "benchmarks"))
+
+from tests.common import mock_module  # noqa: E402
+mock_module("koji")
+
+from releng_sop import koji_sign  # noqa: E402
+from tests import fake_koji_hub  # noqa: E402
+import bench_koji_sign  # noqa: E402
+
+
+class TestSignBenchmark(unittest.TestCase):
+    """
+    Tests of running benchmarks and comparing them to a baseline.
+    """
+
+    def setUp(self):
+        """Use fake hub helpers instead of koji functions."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_bench_koji_sign_")
+        self.patchers = [
+            patch.object(koji_sign.koji, "get_profile_module", create=True),
+            patch.object(koji_sign.koji, "ClientSession", fake_koji_hub.get_client_session_class(), create=True),
+            patch.object(koji_sign.koji, "rip_rpm_sighdr", fake_koji_hub.rip_rpm_sighdr, create=True),
+            patch.object(koji_sign.koji, "find_rpm_sighdr", fake_koji_hub.find_rpm_sighdr, create=True),
+            patch.object(koji_sign, "_get_sighdr_sigkey", fake_koji_hub.get_sighdr_sigkey),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """Remove the koji volume."""
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def test_run(self):
+        """Test if all phases are timed and the sign phase signs the rest of RPMs."""
+        bench = bench_koji_sign.SignBenchmark(self.temp_dir, 30, repeat=1, logger=Mock())
+        result = bench.run()
+        self.assertEqual(list(result), bench_koji_sign.PHASES)
+        self.assertEqual(len([i for i in bench.hub.sigs.values() if bench_koji_sign.SIGKEY in i]), 30)
+        self.assertEqual(bench.stages["import"]["calls"] > 0, True)
+
+    def test_compare_results(self):
+        """Test if only slower phases above the minimal time are reported."""
+        baseline = {"results": {"1000": {"sign": 1.0, "find_cached": 0.001, "get_rpm_sig_dict": 0.5}}}
+        results = {"results": {
+            "1000": {"sign": 1.3, "find_cached": 0.01, "get_rpm_sig_dict": 0.55, "new": 5.0},
+            "10000": {"sign": 10.0},
+        }}
+        self.assertEqual(bench_koji_sign.compare_results(results, baseline), [(1000, "sign", 1.0, 1.3)])
+        self.assertEqual(bench_koji_sign.compare_results(results, baseline, threshold=0.5), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for cassette module.
+"""
+
+
+import unittest
+
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from mock import MagicMock, Mock, patch
+from six.moves import xmlrpc_client
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from tests.common import mock_module  # noqa: E402
+mock_module("koji")
+
+from releng_sop import koji_sign  # noqa: E402
+from releng_sop.cassette import Cassette, CassetteError, get_client, check_call  # noqa: E402
+from releng_sop.koji_sign import KojiSignRPMs  # noqa: E402
+from tests import fake_koji_hub  # noqa: E402
+
+
+class TestCassette(unittest.TestCase):
+    """
+    Tests of recording and replaying koji, PDC and command traffic.
+    """
+
+    def setUp(self):
+        """Start a fake hub with a tag."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_cassette_")
+        self.path = os.path.join(self.temp_dir, "cassette.json.gz")
+        self.hub = fake_koji_hub.FakeKojiHub(os.path.join(self.temp_dir, "koji"), latency={"listTaggedRPMS": 0.1})
+        self.hub.generate("test-tag", builds=3, rpms_per_build=2)
+        self.hub.start()
+
+    def tearDown(self):
+        """Stop the hub, remove the cassette."""
+        self.hub.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def _koji_calls(self, session):
+        result = [session.listTaggedRPMS("test-tag", latest=True)]
+        session.multicall = True
+        for rpm_id in (1, 2, 3):
+            session.queryRPMSigs(rpm_id)
+        result.append(session.multiCall(strict=True))
+        return result
+
+    def test_koji(self):
+        """Test if koji calls, multicalls and faults are replayed without the hub."""
+        with Cassette(self.path, mode="record") as cassette:
+            session = get_client(cassette, "koji", lambda: fake_koji_hub.ClientSession(self.hub.url))
+            recorded = self._koji_calls(session)
+            self.assertRaises(xmlrpc_client.Fault, session.getBuild, "no-such-build", strict=True)
+        self.hub.stop()
+        self.hub.start()
+        calls = dict(self.hub.calls)
+
+        cassette = Cassette(self.path, latency=0)
+        session = get_client(cassette, "koji", Mock(side_effect=AssertionError))
+        start = time.time()
+        self.assertEqual(self._koji_calls(session), recorded)
+        self.assertTrue(time.time() - start < 0.1)
+        self.assertRaises(xmlrpc_client.Fault, session.getBuild, "no-such-build", strict=True)
+        self.assertRaises(CassetteError, session.getBuild, "no-such-build", strict=True)
+        self.assertEqual(self.hub.calls, calls)
+
+    def test_latency(self):
+        """Test if recorded latencies are reproduced."""
+        with Cassette(self.path, mode="record") as cassette:
+            get_client(cassette, "koji", lambda: fake_koji_hub.ClientSession(self.hub.url)).listTaggedRPMS("test-tag")
+        session = get_client(Cassette(self.path, latency=1.0), "koji", None)
+        start = time.time()
+        session.listTaggedRPMS("test-tag")
+        self.assertTrue(time.time() - start >= 0.1)
+
+    def test_changed_arguments(self):
+        """Test if calls with different arguments get interactions of the same method in order."""
+        with Cassette(self.path, mode="record") as cassette:
+            session = get_client(cassette, "koji", lambda: fake_koji_hub.ClientSession(self.hub.url))
+            session.getBuild(1)
+            session.getBuild(2)
+        session = get_client(Cassette(self.path, latency=0), "koji", None)
+        self.assertEqual(session.getBuild(2)["id"], 2)
+        self.assertEqual(session.getBuild(3)["id"], 1)
+
+    def test_koji_sign(self):
+        """Test if KojiSignRPMs lists a tag from a cassette."""
+        koji_module = Mock()
+        koji_module.config.authtype = "kerberos"
+        koji_module.config.server = self.hub.url
+        koji_module.pathinfo = self.hub.pathinfo
+        with patch.object(koji_sign.koji, "get_profile_module", create=True, return_value=koji_module), \
+                patch.object(koji_sign.koji, "ClientSession", fake_koji_hub.ClientSession, create=True):
+            with Cassette(self.path, mode="record") as cassette:
+                recorded = KojiSignRPMs("test", None, logger=Mock(), cassette=cassette).get_latest_tagged_rpms("test-tag")
+            koji_module.config.server = "http://localhost:1/kojihub"
+            sign = KojiSignRPMs("test", None, logger=Mock(), cassette=Cassette(self.path, latency=0))
+            self.assertEqual(sign.get_latest_tagged_rpms("test-tag"), recorded)
+        self.assertEqual(len(recorded), 6)
+
+    def test_pdc(self):
+        """Test if PDC resources are replayed."""
+        client = MagicMock()
+        client["content-delivery-repos"]._.return_value = [{"name": "repo"}]
+        with Cassette(self.path, mode="record") as cassette:
+            result = get_client(cassette, "pdc", lambda: client)["content-delivery-repos"]._(page_size=0, release_id="f24")
+        self.assertEqual(result, [{"name": "repo"}])
+
+        client = get_client(Cassette(self.path, latency=0), "pdc", None)
+        self.assertEqual(client["content-delivery-repos"]._(page_size=0, release_id="f24"), [{"name": "repo"}])
+
+    def test_command(self):
+        """Test if commands are replayed by their printable form, failures included."""
+        with Cassette(self.path, mode="record") as cassette:
+            check_call(cassette, ["true", "--password=secret"], ["true"])
+            self.assertRaises(subprocess.CalledProcessError, check_call, cassette, ["false"])
+        with gzip.open(self.path, "rb") as f:
+            self.assertNotIn(b"secret", f.read())
+
+        cassette = Cassette(self.path, latency=0)
+        with patch("subprocess.check_call") as check_call_mock:
+            self.assertEqual(check_call(cassette, ["true", "--password=other"], ["true"]), 0)
+            self.assertRaises(subprocess.CalledProcessError, check_call, cassette, ["false"])
+        self.assertFalse(check_call_mock.called)
+
+    def test_command_failure_password(self):
+        """Test if a failed command is recorded and raised without its password."""
+        with Cassette(self.path, mode="record") as cassette:
+            try:
+                check_call(cassette, ["false", "--password", "SECRET"], ["false", "--password", "********"])
+            except subprocess.CalledProcessError as ex:
+                self.assertEqual((ex.returncode, ex.cmd), (1, ["false", "--password", "********"]))
+            else:
+                self.fail("CalledProcessError not raised")
+        with gzip.open(self.path, "rb") as f:
+            data = f.read()
+        self.assertNotIn(b"SECRET", data)
+        self.assertIn(b"********", data)
+
+        cassette = Cassette(self.path, latency=0)
+        self.assertRaises(subprocess.CalledProcessError, check_call, cassette, ["false", "--password", "OTHER"],
+                          ["false", "--password", "********"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,214 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests of tracing in common module.
+"""
+
+
+import unittest
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from mock import Mock, patch
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from tests.common import mock_module  # noqa: E402
+mock_module("koji")
+
+from releng_sop import common  # noqa: E402
+from releng_sop import koji_sign  # noqa: E402
+from releng_sop.cassette import check_call  # noqa: E402
+from releng_sop.common import Environment, Release, Tracer, get_tracer, span, trace  # noqa: E402
+from releng_sop.koji_block_package_in_release import KojiBlockPackageInRelease  # noqa: E402
+from releng_sop.koji_sign import KojiSignRPMs  # noqa: E402
+from tests import fake_koji_hub  # noqa: E402
+from tests.rpm_corpus import RPMCorpus  # noqa: E402
+
+
+def _get_spans(path):
+    """
+    Read a trace file, return complete events.
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+    return [i for i in data["traceEvents"] if i["ph"] == "X"]
+
+
+def _is_nested(inner, outer):
+    """
+    Determine if a span runs within another span in the same thread.
+    """
+    if inner["tid"] != outer["tid"]:
+        return False
+    return outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+
+class TestTracer(unittest.TestCase):
+    """
+    Tests of recording spans and writing Chrome traces.
+    """
+
+    def setUp(self):
+        """Create a directory for traces."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_common_")
+        self.path = os.path.join(self.temp_dir, "trace.json")
+
+    def tearDown(self):
+        """Remove traces."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_span(self):
+        """Test if spans nest by time, keep args and record errors, threads are named."""
+        tracer = Tracer("test")
+        with tracer.span("outer", "command", commit=False) as span_args:
+            with tracer.span("inner"):
+                pass
+            span_args["results"] = 2
+        try:
+            with tracer.span("failed"):
+                raise ValueError("broken")
+        except ValueError:
+            pass
+
+        def _work():
+            with tracer.span("worker"):
+                pass
+
+        thread = threading.Thread(target=_work, name="Worker")
+        thread.start()
+        thread.join()
+
+        data = tracer.to_dict()
+        meta = [i for i in data["traceEvents"] if i["ph"] == "M"]
+        self.assertEqual([i["args"]["name"] for i in meta], ["test", threading.current_thread().name, "Worker"])
+        events = dict([(i["name"], i) for i in data["traceEvents"] if i["ph"] == "X"])
+        self.assertNotEqual(events["worker"]["tid"], events["outer"]["tid"])
+        self.assertEqual(events["outer"]["cat"], "command")
+        self.assertEqual(events["outer"]["args"], {"commit": False, "results": 2})
+        self.assertTrue(_is_nested(events["inner"], events["outer"]))
+        self.assertEqual(events["failed"]["args"], {"error": "ValueError: broken"})
+        # events are sorted by start
+        starts = [i["ts"] for i in data["traceEvents"] if i["ph"] == "X"]
+        self.assertEqual(starts, sorted(starts))
+
+    def test_trace(self):
+        """Test if a root span is recorded and the trace is written even if the command fails."""
+        with span("untraced") as span_args:
+            self.assertEqual(span_args, {})
+        self.assertEqual(get_tracer(), None)
+        try:
+            with trace(self.path, "test-command") as tracer:
+                self.assertEqual(get_tracer(), tracer)
+                with span("step", cmd=["koji", "hello"]):
+                    raise RuntimeError("failed")
+        except RuntimeError:
+            pass
+        self.assertEqual(get_tracer(), None)
+
+        spans = _get_spans(self.path)
+        self.assertEqual([i["name"] for i in spans], ["test-command", "step"])
+        self.assertEqual(spans[1]["args"], {"cmd": ["koji", "hello"], "error": "RuntimeError: failed"})
+        self.assertTrue("error" in spans[0]["args"])
+
+        with trace(None) as tracer:
+            self.assertEqual(tracer, None)
+
+    def test_failed_subprocess(self):
+        """Test if a failed subprocess span records the error without the password of the command."""
+        with self.assertRaises(subprocess.CalledProcessError):
+            with trace(self.path, "pulp-clone-repos"):
+                check_call(None, ["false", "--password", "SECRET"], ["false", "--password", "********"])
+        with open(self.path, "r") as f:
+            self.assertNotIn("SECRET", f.read())
+        spans = dict([(i["name"], i) for i in _get_spans(self.path)])
+        self.assertEqual(spans["false"]["cat"], "subprocess")
+        self.assertTrue(spans["false"]["args"]["error"].startswith("CalledProcessError: "), spans["false"])
+        self.assertIn("********", spans["false"]["args"]["error"])
+
+    def test_command(self):
+        """Test if config loading, command run and its subprocess are traced."""
+        with trace(self.path, "koji-block-package-in-release"):
+            env = Environment("test-env", config_dirs=[os.path.join(DIR, "environments")])
+            release = Release("test-release", config_dirs=[os.path.join(DIR, "releases")])
+            with patch.object(common.subprocess, "check_output") as check_output:
+                KojiBlockPackageInRelease(env, release, ["bash"]).run()
+        self.assertEqual(check_output.call_count, 1)
+
+        spans = dict([(i["name"], i) for i in _get_spans(self.path)])
+        self.assertEqual(spans["environments/test-env"]["cat"], "config")
+        self.assertEqual(spans["environments/test-env"]["args"]["path"], env.config_path)
+        self.assertEqual(spans["releases/test-release"]["cat"], "config")
+        run = spans["KojiBlockPackageInRelease.run"]
+        self.assertEqual(spans["echo"]["args"]["cmd"], ["echo", "koji", "--profile=test", "block-pkg", "test", "bash"])
+        self.assertTrue(_is_nested(spans["echo"], run))
+        self.assertTrue(_is_nested(run, spans["koji-block-package-in-release"]))
+
+
+class TestTraceSign(unittest.TestCase):
+    """
+    Tests of tracing signing RPMs from a fake hub.
+    """
+
+    def setUp(self):
+        """Generate a corpus and use fake hub helpers instead of koji functions."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_common_")
+        self.path = os.path.join(self.temp_dir, "trace.json")
+        self.hub = fake_koji_hub.FakeKojiHub(self.temp_dir)
+        RPMCorpus(self.temp_dir, hub=self.hub).generate(20, tag="test-tag", sizes="fixed", size=1024)
+        self.hub.start()
+        koji_module = Mock(config=Mock(server=self.hub.url, authtype=None), pathinfo=self.hub.pathinfo)
+        self.patchers = [
+            patch.object(koji_sign.koji, "get_profile_module", create=True, return_value=koji_module),
+            patch.object(koji_sign.koji, "ClientSession", fake_koji_hub.get_client_session_class(), create=True),
+            patch.object(koji_sign.koji, "rip_rpm_sighdr", fake_koji_hub.rip_rpm_sighdr, create=True),
+            patch.object(koji_sign.koji, "find_rpm_sighdr", fake_koji_hub.find_rpm_sighdr, create=True),
+            patch.object(koji_sign, "_get_sighdr_sigkey", fake_koji_hub.get_sighdr_sigkey),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """Stop the hub, remove the koji volume."""
+        for patcher in self.patchers:
+            patcher.stop()
+        self.hub.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def test_sign(self):
+        """Test if sign(), its stages and koji RPCs are spans of one timeline."""
+        with trace(self.path, "koji-sign-rpms-in-release"):
+            sign = KojiSignRPMs("test", fake_koji_hub.FakeRPMSign, logger=Mock())
+            sign.sign(sign.get_latest_tagged_rpms("test-tag"), ["deadbeef"], commit=True)
+
+        spans = _get_spans(self.path)
+        by_cat = {}
+        for i in spans:
+            by_cat.setdefault(i["cat"], set()).add(i["name"])
+        self.assertTrue(set(["listing", "copy", "sign", "import", "write"]) <= by_cat["stage"], by_cat)
+        self.assertTrue("listTaggedRPMS" in by_cat["koji"], by_cat)
+        self.assertTrue([i for i in by_cat["koji"] if i.startswith("multiCall:")], by_cat)
+
+        sign_span = [i for i in spans if i["name"] == "KojiSignRPMs.sign"][0]
+        self.assertEqual(sign_span["args"]["rpms"], 20)
+        listing = [i for i in spans if i["name"] == "listing"][0]
+        list_rpc = [i for i in spans if i["name"] == "listTaggedRPMS"][0]
+        self.assertTrue(_is_nested(list_rpc, listing))
+        # RPCs of stages in the signing thread nest in sign()
+        main_rpcs = [i for i in spans if i["cat"] == "koji" and i["tid"] == sign_span["tid"] and i["ts"] > sign_span["ts"]]
+        self.assertTrue(main_rpcs)
+        for i in main_rpcs:
+            self.assertTrue(_is_nested(i, sign_span), i)
+
+
+if __name__ == "__main__":
+    unittest.main()
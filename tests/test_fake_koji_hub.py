@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for fake_koji_hub module.
+"""
+
+
+import unittest
+
+import base64
+import os
+import shutil
+import sys
+import tempfile
+import time
+from six.moves import xmlrpc_client
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from tests.fake_koji_hub import FakeKojiHub, ClientSession, make_sighdr, get_sighdr_sigkey, rip_rpm_sighdr, sign_rpm  # noqa: E402
+
+
+class TestFakeKojiHub(unittest.TestCase):
+    """
+    Tests of the fake hub over XML-RPC.
+    """
+
+    def setUp(self):
+        """Start a hub with a synthetic tag."""
+        self.topdir = tempfile.mkdtemp(prefix="test_fake_koji_hub_")
+        self.hub = FakeKojiHub(self.topdir)
+        self.hub.generate("test-tag", builds=3, rpms_per_build=2)
+        self.hub.add_build("package00000", version="2.0", tags=["test-tag"])
+        self.hub.start()
+        self.session = ClientSession(self.hub.url)
+
+    def tearDown(self):
+        """Stop the hub, remove the koji volume."""
+        self.hub.stop()
+        shutil.rmtree(self.topdir)
+
+    def test_list_tagged_rpms(self):
+        """Test if only RPMs of latest builds are listed and main copies exist."""
+        rpm_info_list, build_info_list = self.session.listTaggedRPMS("test-tag", latest=True, rpmsigs=False)
+        self.assertEqual([i["nvr"] for i in build_info_list], ["package00001-1.0-1", "package00002-1.0-1", "package00000-2.0-1"])
+        self.assertEqual(len(rpm_info_list), 7)
+        for rpm_info in rpm_info_list:
+            self.assertTrue(os.path.isfile(self.hub.get_rpm_path(rpm_info)))
+        self.assertRaises(xmlrpc_client.Fault, self.session.listTaggedRPMS, "no-such-tag")
+
+    def test_sign_and_write(self):
+        """Test if imported signatures are queried and written to signed copies."""
+        rpm_info = self.session.listRPMs(buildID=1)[0]
+        sighdr = make_sighdr("DEADBEEF")
+        self.session.addRPMSig(rpm_info["id"], base64.b64encode(sighdr).decode("ascii"))
+        self.session.writeSignedRPM(rpm_info, "deadbeef")
+
+        sigs = self.session.queryRPMSigs(rpm_id=rpm_info["id"])
+        self.assertEqual([i["sigkey"] for i in sigs], ["deadbeef"])
+        path = self.hub.get_rpm_path(rpm_info, "deadbeef")
+        self.assertEqual(rip_rpm_sighdr(path), sighdr)
+        self.assertTrue(os.path.isfile(self.hub.get_sighdr_path(rpm_info, "deadbeef")))
+        self.assertRaises(xmlrpc_client.Fault, self.session.addRPMSig, rpm_info["id"], base64.b64encode(sighdr).decode("ascii"))
+
+    def test_multicall(self):
+        """Test if faults of sub-calls are returned and raised in strict mode."""
+        self.hub.fail("queryRPMSigs")
+        self.session.multicall = True
+        for rpm_id in (1, 2):
+            self.session.queryRPMSigs(rpm_id)
+        result = self.session.multiCall()
+        self.assertEqual(result[0]["faultString"], "Injected failure: queryRPMSigs")
+        self.assertEqual(result[1], [[]])
+
+        self.hub.fail("queryRPMSigs")
+        self.session.multicall = True
+        self.session.queryRPMSigs(1)
+        self.assertRaises(xmlrpc_client.Fault, self.session.multiCall, strict=True)
+        self.assertEqual(self.hub.calls, {"multiCall": 2, "queryRPMSigs": 3})
+
+    def test_failure_rate(self):
+        """Test if a part of calls fails."""
+        self.hub.fail("getBuild", rate=0.5)
+        failures = 0
+        for i in range(20):
+            try:
+                self.session.getBuild(1)
+            except xmlrpc_client.Fault:
+                failures += 1
+        self.assertTrue(0 < failures < 20)
+
+    def test_latency(self):
+        """Test if calls are delayed."""
+        self.hub.latency = {"getBuild": 0.05}
+        start = time.time()
+        self.assertEqual(self.session.getBuild("package00001-1.0-1", strict=True)["id"], 2)
+        self.assertTrue(time.time() - start >= 0.05)
+
+    def test_sigkey(self):
+        """Test if sigkeys are read from signed RPMs."""
+        rpm_info = self.session.listRPMs(buildID=1)[0]
+        path = self.hub.get_rpm_path(rpm_info)
+        self.assertEqual(get_sighdr_sigkey(rip_rpm_sighdr(path)), "")
+        sign_rpm(path, "CAFEBABE")
+        self.assertEqual(get_sighdr_sigkey(rip_rpm_sighdr(path)), "cafebabe")
+        self.assertEqual(os.path.getsize(path), 96 + len(make_sighdr("cafebabe")) + rpm_info["size"])
+
+
+if __name__ == "__main__":
+    unittest.main()
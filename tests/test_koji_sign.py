@@ -10,7 +10,16 @@ Tests for koji_sign module.
 import unittest
 
 import os
+import hashlib
+import shutil
+import struct
 import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from mock import Mock, patch
+from six.moves import xmlrpc_client
 
 
 # HACK: inject empty koji module to silence failing tests.
@@ -23,8 +32,12 @@ sys.modules["koji"] = imp.new_module("koji")
 DIR = os.path.dirname(__file__)
 sys.path.insert(0, os.path.join(DIR, ".."))
 
-from releng_sop.common import Environment  # noqa: E402
-from releng_sop.koji_sign import get_rpmsign_class, LocalRPMSign  # noqa: E402
+from releng_sop.common import Environment, Error  # noqa: E402
+from releng_sop import koji_sign  # noqa: E402
+from releng_sop.koji_sign import KojiSignRPMs, AdaptiveChunker, RPMPrefetcher, RPM_INFO_KEYS, get_rpmsign_class, get_gpg_name, LocalRPMSign, LibRPMSign  # noqa: E402
+from releng_sop.koji_sign_lease import SignLeases  # noqa: E402
+from releng_sop.koji_sign_queue import SignQueue  # noqa: E402
+from tests import fake_koji_hub  # noqa: E402
 
 
 RELEASES_DIR = os.path.join(DIR, "releases")
@@ -44,6 +57,876 @@ class TestRPMSignClass(unittest.TestCase):
         cls = get_rpmsign_class(env)
         self.assertEqual(cls, LocalRPMSign)
 
+    def test_get_rpmsign_class_librpm(self):
+        """Test if LibRPMSign can be selected with rpmsign_class."""
+        env = {"rpmsign_class": "releng_sop.koji_sign.LibRPMSign"}
+        cls = get_rpmsign_class(env)
+        self.assertEqual(cls, LibRPMSign)
+
+    def test_librpm_sign(self):
+        """Test if LibRPMSign signs all paths in-process."""
+        add_sign = Mock(return_value=True)
+        with patch.object(LibRPMSign, "_get_add_sign", return_value=add_sign):
+            with patch.object(LibRPMSign, "_sigkey_to_gpg_name", return_value="Test Key"):
+                LibRPMSign().sign("deadbeef", ["/tmp/a.rpm", "/tmp/b.rpm"])
+        self.assertEqual(add_sign.call_count, 2)
+        add_sign.assert_any_call("/tmp/a.rpm", "Test Key")
+        add_sign.assert_any_call("/tmp/b.rpm", "Test Key")
+
+    def test_librpm_sign_failure(self):
+        """Test if LibRPMSign raises an error when signing fails."""
+        add_sign = Mock(return_value=False)
+        with patch.object(LibRPMSign, "_get_add_sign", return_value=add_sign):
+            with patch.object(LibRPMSign, "_sigkey_to_gpg_name", return_value="Test Key"):
+                self.assertRaises(Error, LibRPMSign().sign, "deadbeef", ["/tmp/a.rpm"])
+
+    def test_local_rpmsign_gnupghome(self):
+        """Test if LocalRPMSign resolves keys in and signs with its gnupghome."""
+        signer = LocalRPMSign(gnupghome="/srv/gnupg")
+        with patch("releng_sop.koji_sign.get_gpg_name", return_value="Test Key") as get_gpg_name_mock:
+            cmd = signer._get_cmd("deadbeef", ["/tmp/a.rpm"])
+        get_gpg_name_mock.assert_called_once_with("deadbeef", gnupghome="/srv/gnupg")
+        self.assertEqual(cmd, ["rpm", "--define", "_gpg_name Test Key", "--define", "_gpg_path /srv/gnupg", "--resign", "/tmp/a.rpm"])
+
+    def test_librpm_not_available(self):
+        """Test if LibRPMSign fails with a clear error without librpmsign bindings."""
+        with patch.dict(sys.modules, {"rpm": None, "rpm._rpms": None}):
+            with self.assertRaises(Error) as ctx:
+                LibRPMSign().sign("deadbeef", ["/tmp/a.rpm"])
+        self.assertTrue("librpmsign not available" in str(ctx.exception))
+
+
+class TestGetGPGName(unittest.TestCase):
+    """
+    Tests of sigkey to GPG name resolution.
+    """
+
+    public_keys = [
+        {"keyid": "0123456789ABCDEF", "uids": ["Test Key <test@example.com>"]},
+        {"keyid": "FEDCBA9876543210", "uids": ["Other Key <other@example.com>"]},
+    ]
+
+    def setUp(self):
+        """Create a fake GNUPG home and mock gnupg module."""
+        self.gnupghome = tempfile.mkdtemp(prefix="test_gnupghome_")
+        self.keyring = os.path.join(self.gnupghome, "pubring.kbx")
+        open(self.keyring, "w").close()
+        os.utime(self.keyring, (1000, 1000))
+
+        self.gnupg = Mock()
+        self.gnupg.GPG.return_value.list_keys.return_value = self.public_keys
+        self.patcher = patch.dict(sys.modules, {"gnupg": self.gnupg})
+        self.patcher.start()
+        koji_sign._GPG_NAME_CACHE.clear()
+
+    def tearDown(self):
+        """Remove the fake GNUPG home."""
+        self.patcher.stop()
+        koji_sign._GPG_NAME_CACHE.clear()
+        shutil.rmtree(self.gnupghome)
+
+    def test_get_gpg_name(self):
+        """Test if short key IDs are resolved to uids."""
+        self.assertEqual(get_gpg_name("89ABCDEF", gnupghome=self.gnupghome), "Test Key <test@example.com>")
+        self.assertEqual(get_gpg_name("76543210", gnupghome=self.gnupghome), "Other Key <other@example.com>")
+        self.assertEqual(get_gpg_name("00000000", gnupghome=self.gnupghome), None)
+
+    def test_get_gpg_name_cached(self):
+        """Test if keys are listed only once for an unchanged keyring."""
+        for i in range(10):
+            get_gpg_name("89abcdef", gnupghome=self.gnupghome)
+        self.assertEqual(self.gnupg.GPG.return_value.list_keys.call_count, 1)
+
+    def test_get_gpg_name_keyring_changed(self):
+        """Test if the cache is invalidated when the keyring changes."""
+        get_gpg_name("89abcdef", gnupghome=self.gnupghome)
+        self.gnupg.GPG.return_value.list_keys.return_value = [{"keyid": "0123456789ABCDEF", "uids": ["New Key"]}]
+        os.utime(self.keyring, (2000, 2000))
+        self.assertEqual(get_gpg_name("89abcdef", gnupghome=self.gnupghome), "New Key")
+        self.assertEqual(self.gnupg.GPG.return_value.list_keys.call_count, 2)
+
+
+class PathInfo(object):
+    """Koji PathInfo with the same layout as koji.PathInfo."""
+
+    def __init__(self, topdir):  # noqa: D102
+        self.topdir = topdir
+
+    def build(self, build):  # noqa: D102
+        return self.topdir + ("/packages/%(name)s/%(version)s/%(release)s" % build)
+
+    def rpm(self, rpminfo):  # noqa: D102
+        return "%(arch)s/%(name)s-%(version)s-%(release)s.%(arch)s.rpm" % rpminfo
+
+    def signed(self, rpminfo, sigkey):  # noqa: D102
+        return "data/signed/%s/" % sigkey + self.rpm(rpminfo)
+
+    def sighdr(self, rpminfo, sigkey):  # noqa: D102
+        return "data/sigcache/%s/" % sigkey + self.rpm(rpminfo) + ".sig"
+
+
+def make_sighdr(data):
+    """Return a signature header with given store padded to 8 bytes."""
+    data += b"\0" * ((8 - len(data) % 8) % 8)
+    return b"\x8e\xad\xe8\x01\0\0\0\0" + struct.pack(">II", 0, len(data)) + data
+
+
+def find_rpm_sighdr(path):
+    """Return (offset, size) of signature header, the same as koji.find_rpm_sighdr."""
+    with open(path, "rb") as f:
+        f.seek(96)
+        il, dl = struct.unpack(">II", f.read(16)[8:])
+    size = 16 + 16 * il + dl
+    return 96, size + (8 - size % 8) % 8
+
+
+def rip_rpm_sighdr(path):
+    """Return signature header of a RPM, the same as koji.rip_rpm_sighdr."""
+    start, size = find_rpm_sighdr(path)
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(size)
+
+
+class KojiSignRPMsTestCase(unittest.TestCase):
+    """
+    Base class for tests that need KojiSignRPMs with koji volume in a temp directory.
+    """
+
+    def setUp(self):
+        """Create koji volume in a temp directory, mock koji profile and session."""
+        self.topdir = tempfile.mkdtemp(prefix="test_koji_sign_")
+        koji_module = Mock()
+        koji_module.config.authtype = None
+        koji_module.pathinfo = PathInfo(self.topdir)
+        self.patchers = [
+            patch.object(koji_sign.koji, "get_profile_module", create=True, return_value=koji_module),
+            patch.object(koji_sign.koji, "ClientSession", create=True),
+            patch.object(koji_sign.koji, "find_rpm_sighdr", create=True, side_effect=find_rpm_sighdr),
+            patch.object(koji_sign.koji, "rip_rpm_sighdr", create=True, side_effect=rip_rpm_sighdr),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """Remove the temp directory."""
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.topdir)
+
+    def get_koji_sign(self, **kwargs):
+        """Return KojiSignRPMs instance."""
+        return KojiSignRPMs("test", LocalRPMSign, **kwargs)
+
+    def create_rpm(self, sign, name, payload, sigkey=None, sighdr=None):
+        """Create a RPM in koji volume, return its rpm_info."""
+        build = {"id": 1, "name": name, "version": "1.0", "release": "1"}
+        rpm_info = {"id": len(os.listdir(self.topdir)) + 1, "name": name, "version": "1.0", "release": "1",
+                    "arch": "noarch", "build": build, "build_id": 1, "size": len(payload)}
+        path = sign._get_rpm_path(rpm_info, sigkey)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(b"L" * 96 + (sighdr or make_sighdr(b"unsigned")) + payload)
+        return rpm_info
+
+
+class TestLocalWrite(KojiSignRPMsTestCase):
+    """
+    Tests of writing signed RPMs directly to koji volume.
+    """
+
+    def _create_sighdr(self, sign, rpm_info, sigkey):
+        sighdr = make_sighdr(b"signed with " + sigkey.encode("ascii"))
+        path = sign._get_sighdr_path(rpm_info, sigkey)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(sighdr)
+        return sighdr
+
+    def test_write_signed_rpm_locally(self):
+        """Test if sighdr from sigcache is spliced onto the unsigned RPM."""
+        sign = self.get_koji_sign(local_write=True)
+        payload = b"header and payload" * 100000
+        rpm_info = self.create_rpm(sign, "foo", payload)
+        sighdr = self._create_sighdr(sign, rpm_info, "deadbeef")
+        rpm_sig_dict = {rpm_info["id"]: {"deadbeef": hashlib.md5(sighdr).hexdigest()}}
+
+        sign.write_signed_rpms_from_sigcache([rpm_info], "deadbeef", rpm_sig_dict=rpm_sig_dict, commit=True)
+
+        path = sign._get_rpm_path(rpm_info, "deadbeef")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"L" * 96 + sighdr + payload)
+        self.assertEqual(os.listdir(os.path.dirname(path)), [os.path.basename(path)])
+        self.assertFalse(sign.koji_session.writeSignedRPM.called)
+
+    def test_write_signed_rpm_locally_sighash_mismatch(self):
+        """Test if a sighdr that doesn't match the sighash is not written."""
+        sign = self.get_koji_sign(local_write=True)
+        rpm_info = self.create_rpm(sign, "foo", b"payload")
+        self._create_sighdr(sign, rpm_info, "deadbeef")
+        rpm_sig_dict = {rpm_info["id"]: {"deadbeef": "0" * 32}}
+
+        self.assertRaises(ValueError, sign.write_signed_rpms_from_sigcache, [rpm_info], "deadbeef", rpm_sig_dict=rpm_sig_dict, commit=True)
+        self.assertFalse(os.path.exists(sign._get_rpm_path(rpm_info, "deadbeef")))
+
+    def test_write_signed_rpm_locally_dry_run(self):
+        """Test if nothing is written in dry-run mode."""
+        sign = self.get_koji_sign(local_write=True)
+        rpm_info = self.create_rpm(sign, "foo", b"payload")
+        self._create_sighdr(sign, rpm_info, "deadbeef")
+
+        sign.write_signed_rpms_from_sigcache([rpm_info], "deadbeef", commit=False)
+        self.assertFalse(os.path.exists(sign._get_rpm_path(rpm_info, "deadbeef")))
+
+
+def get_sighdr_sigkey(sighdr):
+    """Return sigkey of a sighdr created by make_sighdr()."""
+    data = sighdr[16:].rstrip(b"\0").decode("ascii")
+    if data.startswith("signed with "):
+        return data[len("signed with "):]
+    return ""
+
+
+class TestVerifySignedRPMs(KojiSignRPMsTestCase):
+    """
+    Tests of verification of signed copies.
+    """
+
+    def setUp(self):
+        """Mock reading sigkeys from sighdrs."""
+        super(TestVerifySignedRPMs, self).setUp()
+        self.patchers.append(patch.object(koji_sign, "_get_sighdr_sigkey", side_effect=get_sighdr_sigkey))
+        self.patchers[-1].start()
+
+    def test_verify_signed_rpms(self):
+        """Test if missing and wrongly signed copies are reported."""
+        sign = self.get_koji_sign()
+        good = self.create_rpm(sign, "good", b"payload")
+        self.create_rpm(sign, "good", b"payload", sigkey="deadbeef", sighdr=make_sighdr(b"signed with deadbeef"))
+        second = self.create_rpm(sign, "second", b"payload")
+        self.create_rpm(sign, "second", b"payload", sigkey="cafebabe", sighdr=make_sighdr(b"signed with cafebabe"))
+        wrong = self.create_rpm(sign, "wrong", b"payload")
+        self.create_rpm(sign, "wrong", b"payload", sigkey="deadbeef", sighdr=make_sighdr(b"signed with 01234567"))
+        missing = self.create_rpm(sign, "missing", b"payload")
+
+        verified, failures = sign.verify_signed_rpms([good, second, wrong, missing], ["DEADBEEF", "cafebabe"])
+        self.assertEqual(verified, [good, second])
+        self.assertEqual([(i[0], i[1]) for i in failures], [
+            (wrong, sign._get_rpm_path(wrong, "deadbeef")),
+            (missing, sign._get_rpm_path(missing, "deadbeef")),
+        ])
+
+
+class TestFindSignedRPMsInMainCopies(KojiSignRPMsTestCase):
+    """
+    Tests of scanning main copies in threads and processes.
+    """
+
+    def setUp(self):
+        """Mock reading sigkeys from sighdrs, create signed and unsigned main copies."""
+        super(TestFindSignedRPMsInMainCopies, self).setUp()
+        self.patchers.append(patch.object(koji_sign, "_get_sighdr_sigkey", side_effect=get_sighdr_sigkey))
+        self.patchers[-1].start()
+        self.sign = self.get_koji_sign(logger=Mock())
+        self.signed = self.create_rpm(self.sign, "signed", b"payload", sighdr=make_sighdr(b"signed with deadbeef"))
+        self.unsigned = self.create_rpm(self.sign, "unsigned", b"payload")
+        self.other = self.create_rpm(self.sign, "other", b"payload", sighdr=make_sighdr(b"signed with 01234567"))
+        self.rpm_info_list = [self.signed, self.unsigned, self.other]
+
+    def test_backends(self):
+        """Test if both backends find the same RPMs and processes return only needed headers."""
+        for backend in ("threads", "processes"):
+            self.sign._get_rpm_sighdr_sigkey_cache.clear()
+            self.sign.scan_backend = backend
+            signed, unsigned = self.sign.find_signed_rpms_in_main_copies(self.rpm_info_list, ["DEADBEEF"])
+            self.assertEqual((signed, unsigned), ([self.signed], [self.unsigned, self.other]), backend)
+
+        path = self.sign._get_rpm_path(self.signed, None)
+        self.assertEqual(list(self.sign._get_rpm_sighdr_sigkey_cache), [path])
+        self.assertEqual(self.sign._get_rpm_sighdr_sigkey_cache[path], (make_sighdr(b"signed with deadbeef"), "deadbeef"))
+
+    def test_progress(self):
+        """Test if each RPM is reported to progress as soon as it's checked."""
+        sign = self.get_koji_sign(logger=Mock(), progress="log")
+        sign.progress.update = Mock()
+        sign.find_signed_rpms(self.rpm_info_list, ["deadbeef"])
+        for backend in ("threads", "processes"):
+            sign.scan_backend = backend
+            sign.find_signed_rpms_in_main_copies(self.rpm_info_list, ["deadbeef"])
+        calls = sorted([i[0] for i in sign.progress.update.call_args_list])
+        sizes = sorted([i["size"] for i in self.rpm_info_list])
+        self.assertEqual(calls, sorted([("main_scan", 1, i) for i in sizes * 2] + [("signed_check", 1, i) for i in sizes]))
+
+    def test_auto_select(self):
+        """Test if processes are used for big scans on fast storage."""
+        self.assertEqual(self.sign._get_scan_backend(self.rpm_info_list), "threads")
+        with patch.object(koji_sign, "SCAN_PROCESSES_MIN_RPMS", 1), patch.object(koji_sign.multiprocessing, "cpu_count", return_value=4):
+            self.sign.scan_latency = 10
+            self.assertEqual(self.sign._get_scan_backend(self.rpm_info_list), "processes")
+            self.sign.scan_latency = 0
+            self.assertEqual(self.sign._get_scan_backend(self.rpm_info_list), "threads")
+            self.assertTrue("median of 3 reads" in self.sign.logger.info.call_args[0][0], self.sign.logger.info.call_args)
+            self.sign.scan_samples = 0
+            self.assertEqual(self.sign._get_scan_backend(self.rpm_info_list), "threads")
+
+    def test_unknown_backend(self):
+        """Test if an unknown backend is rejected."""
+        self.assertRaises(ValueError, self.get_koji_sign, scan_backend="gpu")
+
+
+class TestEstimate(KojiSignRPMsTestCase):
+    """
+    Tests of estimating signing from a sample of RPMs.
+    """
+
+    def setUp(self):
+        """Mock reading sigkeys, create cached RPMs with and without signed copies and uncached RPMs."""
+        super(TestEstimate, self).setUp()
+        self.patchers.append(patch.object(koji_sign, "_get_sighdr_sigkey", side_effect=get_sighdr_sigkey))
+        self.patchers[-1].start()
+        self.sign = self.get_koji_sign(logger=Mock(), scan_backend="threads")
+        self.rpm_info_list = []
+        self.rpm_sig_dict = {}
+        for num in range(40):
+            sighdr = make_sighdr(b"signed with deadbeef") if num % 20 == 3 else None
+            rpm_info = self.create_rpm(self.sign, "rpm%s" % num, b"x" * (num + 1), sighdr=sighdr)
+            rpm_info["id"] = num
+            if num < 30:
+                self.rpm_sig_dict[num] = {"deadbeef": "sighash"}
+            if num < 10:
+                self.create_rpm(self.sign, "rpm%s" % num, b"x" * (num + 1), sigkey="deadbeef")
+            self.rpm_info_list.append(rpm_info)
+
+    def test_whole_sample(self):
+        """Test if the estimate is exact when all RPMs are sampled."""
+        result = self.sign.estimate(self.rpm_info_list, ["deadbeef"], rpm_sig_dict=self.rpm_sig_dict)
+        categories = result["categories"]
+        self.assertEqual(result["sample_size"], 30)
+        self.assertEqual(categories["cached"]["count"], (30, 30, 30))
+        self.assertEqual(categories["uncached"]["count"], (10, 10, 10))
+        self.assertEqual(categories["uncached"]["bytes"], (355, 355, 355))
+        self.assertEqual(categories["signed"]["count"], (10, 10, 10))
+        self.assertEqual(categories["write"]["count"], (20, 20, 20))
+        self.assertEqual(categories["write"]["bytes"], (410, 410, 410))
+        self.assertEqual(categories["signed_main"]["count"], (1, 1, 1))
+        self.assertEqual([round(i) for i in categories["signed_main"]["bytes"]], [24, 24, 24])
+        self.assertTrue(result["time"][0] > 0)
+
+    def test_sample(self):
+        """Test if estimates from a sample are within their bounds."""
+        with patch.object(koji_sign.random, "sample", side_effect=lambda population, k: population[::3][:k]):
+            result = self.sign.estimate(self.rpm_info_list, ["deadbeef"], rpm_sig_dict=self.rpm_sig_dict, sample_size=10)
+        self.assertEqual(result["sample_size"], 10)
+        for category, data in result["categories"].items():
+            for key in ("count", "bytes"):
+                estimate, low, high = data[key]
+                self.assertTrue(low <= estimate <= high, (category, key, data[key]))
+        signed, write = result["categories"]["signed"]["count"], result["categories"]["write"]["count"]
+        self.assertAlmostEqual(signed[0] + write[0], 30)
+        self.assertEqual(signed[0], 12)
+        self.assertTrue(signed[1] < 10 < signed[2])
+        self.assertTrue(result["time"][1] <= result["time"][0] <= result["time"][2])
+
+    def test_wilson_interval(self):
+        """Test Wilson score interval against known values."""
+        low, high = koji_sign._wilson_interval(0, 10)
+        self.assertEqual(low, 0)
+        self.assertAlmostEqual(high, 0.2775, places=4)
+        low, high = koji_sign._wilson_interval(5, 10)
+        self.assertAlmostEqual(low, 0.2366, places=4)
+        self.assertAlmostEqual(high, 0.7634, places=4)
+        self.assertAlmostEqual(koji_sign._get_z_score(0.95), 1.96, places=2)
+
+
+class TestLeaseRPMs(KojiSignRPMsTestCase):
+    """
+    Tests of skipping RPMs leased by other signing jobs.
+    """
+
+    def setUp(self):
+        """Create RPMs and a lease held by another job."""
+        super(TestLeaseRPMs, self).setUp()
+        self.lease_dir = tempfile.mkdtemp(prefix="test_koji_sign_leases_")
+        self.sign = self.get_koji_sign(lease_dir=self.lease_dir)
+        self.rpms = [self.create_rpm(self.sign, name, b"payload") for name in ("a", "b", "c")]
+        for rpm_id, rpm_info in enumerate(self.rpms):
+            rpm_info["id"] = rpm_id
+
+        self.other = SignLeases(self.lease_dir)
+        self.other.hostname = "other-host"
+        self.other.holder = "other-host:1"
+        self.other.acquire("%s.deadbeef" % self.rpms[1]["id"])
+
+    def tearDown(self):
+        """Remove the lease directory."""
+        super(TestLeaseRPMs, self).tearDown()
+        shutil.rmtree(self.lease_dir)
+
+    def test_lease_rpms(self):
+        """Test if RPMs signed right before leasing are reported as done."""
+        a, b, c = self.rpms
+        self.sign.get_rpm_sig_dict = Mock(return_value={c["id"]: {"deadbeef": "sighash"}})
+        rpm_sig_dict = {}
+        self.assertEqual(self.sign.lease_rpms(self.rpms, "DEADBEEF", rpm_sig_dict, commit=True), ([a], [b], [c]))
+        self.assertEqual(rpm_sig_dict, {c["id"]: {"deadbeef": "sighash"}})
+        self.assertTrue(self.sign.leases.is_held("%s.deadbeef" % a["id"]))
+        self.assertFalse(self.sign.leases.is_held("%s.deadbeef" % c["id"]))
+
+    def test_lease_rpms_dry_run(self):
+        """Test if nothing is leased in dry-run."""
+        self.assertEqual(self.sign.lease_rpms(self.rpms, "deadbeef", {}, commit=False), (self.rpms, [], []))
+
+    def test_sign_waits_for_leased_rpms(self):
+        """Test if leased RPMs are skipped and written once the other job signs them."""
+        a, b, c = self.rpms
+        self.sign.get_rpm_sig_dict = Mock(side_effect=[{}, {b["id"]: {"deadbeef": "sighash"}}])
+        self.sign.sign_chunk = Mock(return_value={"copy": 1, "sign": 1, "import": 1, "write": 1})
+        self.sign.write_signed_rpms_from_sigcache = Mock()
+        self.sign.leases.wait = Mock(return_value=[])
+        self.sign.leases.renewing = Mock(wraps=self.sign.leases.renewing)
+
+        self.sign.sign(self.rpms, ["deadbeef"], rpm_sig_dict={}, commit=True)
+        self.assertEqual([i[0][0] for i in self.sign.sign_chunk.call_args_list], [[a, c]])
+        self.sign.leases.renewing.assert_called_once_with(["%s.deadbeef" % a["id"], "%s.deadbeef" % c["id"]])
+        self.assertEqual([i[0][0] for i in self.sign.write_signed_rpms_from_sigcache.call_args_list], [[b]])
+        self.assertEqual(os.listdir(self.lease_dir), ["%s.deadbeef.lease" % b["id"]])
+
+    def test_sign_lease_lost(self):
+        """Test if signing of a chunk stops when its leases are lost and the chunk is waited on."""
+        a, b, c = self.rpms
+        self.other.release("%s.deadbeef" % b["id"])
+        self.sign.get_rpm_sig_dict = Mock(side_effect=[{}, {a["id"]: {"deadbeef": "sighash"},
+                                                            b["id"]: {"deadbeef": "sighash"},
+                                                            c["id"]: {"deadbeef": "sighash"}}])
+
+        def _lose_lease(*args, **kwargs):
+            # another job breaks the lease of b and acquires it while the chunk is signed
+            os.remove(os.path.join(self.lease_dir, "%s.deadbeef.lease" % b["id"]))
+            self.assertTrue(self.other.acquire("%s.deadbeef" % b["id"]))
+
+        self.sign.copy_rpms_to_temp = Mock(return_value=("temp", []))
+        self.sign.sign_rpms_in_temp = Mock(side_effect=_lose_lease)
+        self.sign.import_signed_rpms = Mock()
+        self.sign.clean_temp = Mock()
+        self.sign.write_signed_rpms_from_sigcache = Mock()
+        self.sign.leases.wait = Mock(return_value=[])
+
+        self.sign.sign(self.rpms, ["deadbeef"], rpm_sig_dict={}, commit=True)
+        self.assertEqual(self.sign.sign_rpms_in_temp.call_count, 1)
+        self.sign.import_signed_rpms.assert_not_called()
+        self.sign.clean_temp.assert_called_once_with("temp", [], commit=True)
+        self.sign.leases.wait.assert_called_once_with(["%s.deadbeef" % i["id"] for i in self.rpms])
+        self.assertEqual([i[0][0] for i in self.sign.write_signed_rpms_from_sigcache.call_args_list], [self.rpms])
+        self.assertEqual(os.listdir(self.lease_dir), ["%s.deadbeef.lease" % b["id"]])
+
+
+class TestSignInQueue(KojiSignRPMsTestCase):
+    """
+    Tests of publishing RPMs to koji-sign-worker processes.
+    """
+
+    def setUp(self):
+        """Create RPMs and a spool directory."""
+        super(TestSignInQueue, self).setUp()
+        self.queue_dir = tempfile.mkdtemp(prefix="test_koji_sign_queue_")
+        self.sign = self.get_koji_sign(queue_dir=self.queue_dir)
+        self.sign.queue.wait = partial(SignQueue.wait, self.sign.queue, interval=0.01)
+        self.rpms = [self.create_rpm(self.sign, name, b"payload") for name in ("a", "b", "c")]
+        for rpm_id, rpm_info in enumerate(self.rpms):
+            rpm_info["id"] = rpm_id
+
+    def tearDown(self):
+        """Remove the spool directory."""
+        super(TestSignInQueue, self).tearDown()
+        shutil.rmtree(self.queue_dir)
+
+    def _run_worker(self, error=None):
+        queue = SignQueue(self.queue_dir)
+        while True:
+            chunk = queue.claim()
+            if chunk is None:
+                time.sleep(0.01)
+                continue
+            if error:
+                queue.fail(chunk, error)
+            else:
+                queue.complete(chunk, {"sigs": dict([(i["id"], {chunk["sigkey"]: "sighash"}) for i in chunk["rpm_info_list"]])})
+            if chunk["rpm_info_list"][-1]["id"] == self.rpms[-1]["id"]:
+                break
+
+    def _start_worker(self, error=None):
+        thread = threading.Thread(target=self._run_worker, args=(error, ))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_sign_in_queue(self):
+        """Test if sigs imported by workers are collected."""
+        thread = self._start_worker()
+        rpm_sig_dict = {}
+        self.sign.sign_in_queue(self.rpms, "deadbeef", rpm_sig_dict, commit=True)
+        thread.join()
+        self.assertEqual(rpm_sig_dict, dict([(i["id"], {"deadbeef": "sighash"}) for i in self.rpms]))
+
+    def test_sign_in_queue_failed(self):
+        """Test if failed chunks are reported."""
+        thread = self._start_worker(error="gpg failed")
+        self.assertRaises(Error, self.sign.sign_in_queue, self.rpms, "deadbeef", {}, commit=True)
+        thread.join()
+
+    def test_sign_in_queue_dry_run(self):
+        """Test if nothing is published in dry-run."""
+        self.sign.sign_in_queue(self.rpms, "deadbeef", {}, commit=False)
+        self.assertEqual(os.listdir(os.path.join(self.queue_dir, "pending")), [])
+
+
+class TestAdaptiveChunker(unittest.TestCase):
+    """
+    Tests of adapting chunk sizes to signing speed.
+    """
+
+    def setUp(self):
+        """Create a chunker with plenty of temp space."""
+        self.chunker = AdaptiveChunker(target_time=60, size=10, files=20, max_files=50, logger=Mock())
+        self.chunker._get_free_space = Mock(return_value=100000.0)
+
+    def _chunk(self, files, size):
+        return [{"size": size * 1024 ** 2 // files}] * files
+
+    def test_grow(self):
+        """Test if chunks grow at most twice when signing is fast."""
+        self.chunker.record(self._chunk(20, 10), {"copy": 1, "sign": 2, "import": 1, "write": 1})
+        self.assertEqual(self.chunker.get_limits(), (20, 40))
+        self.chunker.record(self._chunk(40, 20), {"copy": 1, "sign": 2, "import": 1, "write": 1})
+        self.assertEqual(self.chunker.get_limits(), (40, 50))
+
+    def test_shrink(self):
+        """Test if chunks shrink to reach target time."""
+        self.chunker.record(self._chunk(20, 10), {"copy": 10, "sign": 60, "import": 5, "write": 5})
+        self.assertEqual(self.chunker.get_limits(), (7.5, 15))
+
+    def test_free_space(self):
+        """Test if chunks don't exceed a half of free temp space."""
+        self.chunker._get_free_space.return_value = 8.0
+        self.assertEqual(self.chunker.get_limits(), (4, 20))
+
+    def test_split(self):
+        """Test if limits are read before each chunk."""
+        sign = Mock()
+        rpm_info_list = self._chunk(10, 10)
+        self.chunker.files = 4
+        chunks = KojiSignRPMs.split_rpm_info_list_by_size_and_files(sign, rpm_info_list, chunker=self.chunker)
+        first = next(chunks)
+        self.chunker.files = 2
+        self.assertEqual([len(first)] + [len(i) for i in chunks], [4, 2, 2, 2])
+
+    def test_split_size_limit(self):
+        """Test if chunks don't exceed the size limit, only a single RPM bigger than the limit does."""
+        sign = Mock()
+        self.chunker._get_free_space.return_value = 8.0
+        rpm_info_list = [{"size": i * 1024 ** 2} for i in (3, 3, 1, 5, 2)]
+        chunks = list(KojiSignRPMs.split_rpm_info_list_by_size_and_files(sign, rpm_info_list, chunker=self.chunker))
+        self.assertEqual([[i["size"] // 1024 ** 2 for i in chunk] for chunk in chunks], [[3], [3, 1], [5], [2]])
+
+
+class TestRPMPrefetcher(unittest.TestCase):
+    """
+    Tests of reading ahead RPMs within a budget.
+    """
+
+    def setUp(self):
+        """Create files of 1 MiB each."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_koji_sign_prefetch_")
+        self.items = []
+        for i in range(6):
+            path = os.path.join(self.temp_dir, "%s.rpm" % i)
+            with open(path, "wb") as f:
+                f.write(b"\0" * 1024 ** 2)
+            self.items.append((path, 1024 ** 2))
+
+        self.fetched = []
+        self.fetched_event = threading.Event()
+
+    def tearDown(self):
+        """Remove the temp directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def _fetch(self, prefetcher, path):
+        self.fetched.append(os.path.basename(path))
+        self.fetched_event.set()
+
+    def _get_prefetcher(self, items, budget):
+        """Return a prefetcher that records fetched files instead of reading them."""
+        patcher = patch.object(RPMPrefetcher, "_fetch", autospec=True, side_effect=self._fetch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return RPMPrefetcher(items, budget=budget, logger=Mock())
+
+    def _wait_for(self, count):
+        for i in range(100):
+            if len(self.fetched) >= count:
+                break
+            self.fetched_event.wait(0.01)
+            self.fetched_event.clear()
+        time.sleep(0.01)
+
+    def test_budget(self):
+        """Test if prefetching stops at the budget and continues when files are consumed."""
+        prefetcher = self._get_prefetcher(self.items, 2)
+        self._wait_for(2)
+        self.assertEqual(self.fetched, ["0.rpm", "1.rpm"])
+
+        # consuming a file consumes also files before it
+        prefetcher.consumed(self.items[1][0])
+        self._wait_for(4)
+        self.assertEqual(self.fetched, ["0.rpm", "1.rpm", "2.rpm", "3.rpm"])
+
+        # files consumed before being prefetched are skipped
+        prefetcher.consumed(self.items[4][0])
+        self._wait_for(5)
+        prefetcher.close()
+        self.assertEqual(self.fetched, ["0.rpm", "1.rpm", "2.rpm", "3.rpm", "5.rpm"])
+
+    def test_file_over_budget(self):
+        """Test if a file bigger than budget is prefetched when it's next."""
+        items = [(path, 10 * size) for path, size in self.items[:2]]
+        prefetcher = self._get_prefetcher(items, 2)
+        self._wait_for(1)
+        self.assertEqual(self.fetched, ["0.rpm"])
+        prefetcher.consumed(items[0][0])
+        self._wait_for(2)
+        prefetcher.close()
+        self.assertEqual(self.fetched, ["0.rpm", "1.rpm"])
+
+    def test_fetch(self):
+        """Test if prefetching a missing file doesn't fail."""
+        prefetcher = RPMPrefetcher([], logger=Mock())
+        prefetcher.close()
+        prefetcher._fetch(self.items[0][0])
+        prefetcher._fetch(os.path.join(self.temp_dir, "missing.rpm"))
+        self.assertEqual(prefetcher.prefetched, 1)
+
+
+class StreamingKojiSession(object):
+    """
+    Fake koji session that passes XML-RPC responses to _read_xmlrpc_response() in small chunks.
+    """
+
+    def __init__(self, result):
+        self.result = result
+
+    def _read_xmlrpc_response(self, response):
+        raise NotImplementedError
+
+    def listTaggedRPMS(self, tag_name, **kwargs):
+        """Return the result or raise the fault, the response is read by _read_xmlrpc_response()."""
+        if isinstance(self.result, xmlrpc_client.Fault):
+            body = xmlrpc_client.dumps(self.result, methodresponse=True)
+        else:
+            body = xmlrpc_client.dumps((self.result, ), methodresponse=True, allow_none=True)
+        body = body.encode("utf-8")
+        response = Mock()
+        response.iter_content.side_effect = lambda size: iter([body[i:i + 100] for i in range(0, len(body), 100)])
+        return self._read_xmlrpc_response(response)
+
+
+class TestStreamedTagListing(KojiSignRPMsTestCase):
+    """
+    Tests of reading tag listings as they are received.
+    """
+
+    def setUp(self):
+        """Create a tag listing with RPMs of two builds."""
+        super(TestStreamedTagListing, self).setUp()
+        builds = [
+            {"id": 10, "package_name": "bash", "version": "4.4", "release": "1", "owner_name": "dmach", "extra": None},
+            {"id": 20, "package_name": "kernel", "version": "4.18", "release": "1", "owner_name": "dmach", "extra": {"source": {}}},
+        ]
+        rpms = []
+        for num in range(5):
+            build = builds[num % 2]
+            rpms.append({"id": num + 1, "name": "%s-%s" % (build["package_name"], num), "version": build["version"],
+                         "release": build["release"], "arch": "x86_64", "epoch": None, "size": 1000 * num,
+                         "build_id": build["id"], "buildtime": 1500000000, "extra": {"typeinfo": [1, 2]}})
+        self.listing = [rpms, builds]
+
+    def _get_koji_sign(self, result):
+        sign = self.get_koji_sign(logger=Mock())
+        sign.koji_session = StreamingKojiSession(result)
+        return sign
+
+    def test_compact_records(self):
+        """Test if only needed fields are kept and builds are attached."""
+        sign = self._get_koji_sign(self.listing)
+        rpm_info_list = sign.get_latest_tagged_rpms("test-tag")
+        self.assertEqual([i["id"] for i in rpm_info_list], [1, 2, 3, 4, 5])
+        self.assertEqual(set(rpm_info_list[0]) - set(RPM_INFO_KEYS), set(["build"]))
+        self.assertEqual(rpm_info_list[1]["epoch"], None)
+        self.assertEqual(rpm_info_list[1]["build"], {"id": 20, "package_name": "kernel", "name": "kernel",
+                                                     "version": "4.18", "release": "1"})
+        self.assertIs(rpm_info_list[0]["build"], rpm_info_list[2]["build"])
+        self.assertIs(rpm_info_list[0]["arch"], rpm_info_list[1]["arch"])
+
+    def test_prefetch_sigs(self):
+        """Test if signatures are queried in batches on a separate session."""
+        sign = self._get_koji_sign(self.listing)
+        sig_session = Mock()
+        sig_session.multiCall.side_effect = [
+            [[[{"rpm_id": 1, "sigkey": "DEADBEEF", "sighash": "hash1"}]], [[]]],
+            [[[]], [[{"rpm_id": 4, "sigkey": "deadbeef", "sighash": "hash4"}]]],
+            [[[]]],
+        ]
+        sign._get_koji_session = Mock(return_value=sig_session)
+
+        rpm_info_list = sign.get_latest_tagged_rpms("test-tag", prefetch_sigs=True, batch_size=2)
+        # RPMs that weren't prefetched are queried on the main session
+        sign.koji_session.queryRPMSigs = Mock()
+        sign.koji_session.multiCall = Mock(return_value=[[[]]])
+        rpm_sig_dict = sign.get_rpm_sig_dict(rpm_info_list + [{"id": 6}])
+        self.assertEqual(sig_session.multiCall.call_count, 3)
+        self.assertEqual(sig_session.queryRPMSigs.call_count, 5)
+        sign.koji_session.queryRPMSigs.assert_called_once_with(6)
+        self.assertEqual(rpm_sig_dict, {1: {"deadbeef": "hash1"}, 4: {"deadbeef": "hash4"}})
+        self.assertIsNone(sign.sig_prefetcher)
+
+    def test_fault(self):
+        """Test if a fault response is raised."""
+        sign = self._get_koji_sign(xmlrpc_client.Fault(1000, "No such entry in table tag: test-tag"))
+        sign._get_koji_session = Mock()
+        self.assertRaises(xmlrpc_client.Fault, sign.get_latest_tagged_rpms, "test-tag", prefetch_sigs=True)
+        # the prefetcher is stopped and other calls are read by koji again
+        self.assertIsNone(sign.sig_prefetcher)
+        self.assertEqual([i.name for i in threading.enumerate() if i.name.startswith("RPMSig")], [])
+        self.assertRaises(NotImplementedError, sign.koji_session._read_xmlrpc_response, Mock())
+
+    def test_threads(self):
+        """Test if a streamed call in one thread doesn't change how other threads read responses."""
+        sign = self._get_koji_sign(self.listing)
+        readers = koji_sign._stream_koji_session(sign.koji_session)
+        self.assertIs(koji_sign._stream_koji_session(sign.koji_session), readers)
+        readers.reader = Mock()
+        thread = threading.Thread(target=lambda: self.assertRaises(NotImplementedError, sign.koji_session._read_xmlrpc_response, Mock()))
+        thread.start()
+        thread.join()
+        sign.koji_session._read_xmlrpc_response("response")
+        readers.reader.assert_called_once_with("response")
+
+
+class TestSignWithFakeHub(unittest.TestCase):
+    """
+    Tests of the whole signing workflow against a fake koji hub.
+    """
+
+    def setUp(self):
+        """Start a fake hub with a tag, point koji profile to it."""
+        self.topdir = tempfile.mkdtemp(prefix="test_koji_sign_hub_")
+        self.hub = fake_koji_hub.FakeKojiHub(self.topdir)
+        self.hub.generate("test-tag", builds=5, rpms_per_build=3)
+        self.hub.start()
+
+        koji_module = Mock()
+        koji_module.config.authtype = None
+        koji_module.config.server = self.hub.url
+        koji_module.pathinfo = self.hub.pathinfo
+        self.patchers = [
+            patch.object(koji_sign.koji, "get_profile_module", create=True, return_value=koji_module),
+            patch.object(koji_sign.koji, "ClientSession", fake_koji_hub.get_client_session_class(), create=True),
+            patch.object(koji_sign.koji, "rip_rpm_sighdr", fake_koji_hub.rip_rpm_sighdr, create=True),
+            patch.object(koji_sign.koji, "find_rpm_sighdr", fake_koji_hub.find_rpm_sighdr, create=True),
+            patch.object(koji_sign, "_get_sighdr_sigkey", fake_koji_hub.get_sighdr_sigkey),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """Stop the hub, remove the koji volume."""
+        for patcher in self.patchers:
+            patcher.stop()
+        self.hub.stop()
+        shutil.rmtree(self.topdir)
+
+    def test_sign(self):
+        """Test if all RPMs are signed, imported and written, and nothing is left on the second run."""
+        # one RPM is signed already, its signed copy is missing
+        self.hub.sigs[1] = {"deadbeef": fake_koji_hub.make_sighdr("deadbeef")}
+        sign = KojiSignRPMs("test", fake_koji_hub.FakeRPMSign, logger=Mock())
+        rpm_info_list = sign.get_latest_tagged_rpms("test-tag")
+        self.assertEqual(len(rpm_info_list), 15)
+
+        failures = sign.sign(rpm_info_list, ["DEADBEEF"], verify=True, commit=True)
+        self.assertEqual(failures, [])
+        self.assertEqual(sorted(self.hub.sigs), list(range(1, 16)))
+        self.assertEqual(self.hub.calls["addRPMSig"], 14)
+        for rpm_info in rpm_info_list:
+            path = self.hub.get_rpm_path(rpm_info, "deadbeef")
+            self.assertEqual(fake_koji_hub.get_sighdr_sigkey(fake_koji_hub.rip_rpm_sighdr(path)), "deadbeef")
+
+        calls = dict(self.hub.calls)
+        sign.sign(rpm_info_list, ["DEADBEEF"], commit=True)
+        self.assertEqual(self.hub.calls["addRPMSig"], calls["addRPMSig"])
+        self.assertEqual(self.hub.calls["writeSignedRPM"], calls["writeSignedRPM"])
+
+    def test_sign_local_write(self):
+        """Test if signed copies are written locally from sigcache written by the hub."""
+        sign = KojiSignRPMs("test", fake_koji_hub.FakeRPMSign, logger=Mock(), local_write=True)
+        rpm_info_list = sign.get_latest_tagged_rpms("test-tag")
+        with patch.object(sign, "_write_signed_rpm_locally", wraps=sign._write_signed_rpm_locally) as write_mock:
+            self.assertEqual(sign.sign(rpm_info_list, ["deadbeef"], verify=True, commit=True), [])
+        self.assertNotIn("writeSignedRPM", self.hub.calls)
+        # sighdrs imported by the chunk are verified against their sighashes
+        self.assertEqual(write_mock.call_count, len(rpm_info_list))
+        for i in write_mock.call_args_list:
+            self.assertTrue(i[1]["sighash"], i)
+
+
+class TestSortByPriority(KojiSignRPMsTestCase):
+    """
+    Tests of ordering RPMs by signing priority.
+    """
+
+    def _rpm_info(self, name, arch, size, package=None):
+        return {"id": name, "name": name, "arch": arch, "size": size, "build": {"name": package or name}}
+
+    def setUp(self):
+        """Create a list of RPMs."""
+        super(TestSortByPriority, self).setUp()
+        self.rpm_info_list = [
+            self._rpm_info("bash-debuginfo", "x86_64", 10, "bash"),
+            self._rpm_info("bash", "x86_64", 30),
+            self._rpm_info("bash", "src", 20),
+            self._rpm_info("python-docs", "noarch", 40, "python"),
+            self._rpm_info("kernel", "x86_64", 5),
+        ]
+
+    def _sort(self, *args, **kwargs):
+        sign = self.get_koji_sign()
+        result = sign.sort_rpm_info_list_by_priority(self.rpm_info_list, *args, **kwargs)
+        return [(i["name"], i["arch"]) for i in result]
+
+    def test_no_priority(self):
+        """Test if order is kept without priorities."""
+        self.assertEqual(self._sort(), [(i["name"], i["arch"]) for i in self.rpm_info_list])
+
+    def test_packages_first(self):
+        """Test if RPMs of priority packages go first."""
+        self.assertEqual(self._sort(packages=["kernel", "python"]), [
+            ("python-docs", "noarch"), ("kernel", "x86_64"),
+            ("bash-debuginfo", "x86_64"), ("bash", "x86_64"), ("bash", "src"),
+        ])
+
+    def test_priorities(self):
+        """Test if priorities are applied in given order."""
+        self.assertEqual(self._sort(["srpm-first", "smallest"]), [
+            ("bash", "src"), ("kernel", "x86_64"), ("bash", "x86_64"), ("python-docs", "noarch"), ("bash-debuginfo", "x86_64"),
+        ])
+        self.assertEqual(self._sort(["noarch", "smallest"]), [
+            ("python-docs", "noarch"), ("kernel", "x86_64"), ("bash-debuginfo", "x86_64"), ("bash", "src"), ("bash", "x86_64"),
+        ])
+
+    def test_unknown_priority(self):
+        """Test if unknown priorities are rejected."""
+        self.assertRaises(ValueError, self._sort, ["largest"])
+
 
 if __name__ == "__main__":
     unittest.main()
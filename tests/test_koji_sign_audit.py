@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for koji_sign_audit module.
+"""
+
+
+import unittest
+
+import csv
+import json
+import os
+import sys
+from mock import Mock
+from six import StringIO
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from tests.common import mock_module  # noqa: E402
+mock_module("koji")
+
+from releng_sop.common import Environment, Release  # noqa: E402
+from releng_sop.koji_sign_audit import KojiSignAudit, write_report  # noqa: E402
+
+
+RELEASES_DIR = os.path.join(DIR, "releases")
+ENVIRONMENTS_DIR = os.path.join(DIR, "environments")
+
+
+def _rpm_info(rpm_id, package, arch):
+    return {"id": rpm_id, "arch": arch, "build": {"name": package}}
+
+
+class TestKojiSignAudit(unittest.TestCase):
+    """
+    Tests of counting RPMs in signing categories.
+    """
+
+    def setUp(self):
+        """Create audit object and RPMs in all categories."""
+        env = Environment("test-env", config_dirs=[ENVIRONMENTS_DIR])
+        release = Release("test-release", config_dirs=[RELEASES_DIR])
+        # the audit doesn't sign, it must work without a signing class
+        del env.config_data["rpmsign_class"]
+        self.audit = KojiSignAudit(env, release, "gold")
+
+        self.rpm_info_list = [
+            _rpm_info(1, "bash", "x86_64"),
+            _rpm_info(2, "bash", "x86_64"),
+            _rpm_info(3, "bash", "src"),
+            _rpm_info(4, "zsh", "x86_64"),
+        ]
+        self.sign = Mock()
+        # 1: cached + signed copy, 2: cached only, 3: cached + signed main copy, 4: nothing
+        self.sign.find_cached.return_value = (self.rpm_info_list[0:3], self.rpm_info_list[3:])
+        self.sign.find_signed_rpms.return_value = (self.rpm_info_list[0:1], self.rpm_info_list[1:3])
+        self.sign.find_signed_rpms_in_main_copies.return_value = (self.rpm_info_list[2:3], self.rpm_info_list[1:2])
+
+    def test_sigkeys(self):
+        """Test if sigkeys match the level."""
+        self.assertEqual(self.audit.sigkeys, ["gold-key"])
+
+    def test_no_rpmsign_class(self):
+        """Test if the audit doesn't need a signing class."""
+        self.assertTrue(" * level:                   gold" in self.audit.details())
+        self.assertRaises(KeyError, getattr, self.audit, "rpmsign_class")
+
+    def test_audit(self):
+        """Test if RPMs are counted per package and arch, each in one category."""
+        rows = self.audit.audit(self.sign, self.rpm_info_list)
+        self.assertEqual(rows, [
+            {"package": "bash", "arch": "src", "total": 1, "cached": 0, "signed": 0, "signed_main": 1, "unsigned": 0},
+            {"package": "bash", "arch": "x86_64", "total": 2, "cached": 1, "signed": 1, "signed_main": 0, "unsigned": 0},
+            {"package": "zsh", "arch": "x86_64", "total": 1, "cached": 0, "signed": 0, "signed_main": 0, "unsigned": 1},
+        ])
+        for row in rows:
+            self.assertEqual(row["total"], row["signed"] + row["cached"] + row["signed_main"] + row["unsigned"])
+        # uncached RPMs can't have signed copies or main copies
+        self.sign.find_signed_rpms.assert_called_once_with(self.rpm_info_list[0:3], ["gold-key"])
+        self.sign.find_signed_rpms_in_main_copies.assert_called_once_with(self.rpm_info_list[1:3], ["gold-key"])
+
+    def test_write_report_json(self):
+        """Test if JSON report contains a summary row."""
+        output = StringIO()
+        write_report(self.audit.audit(self.sign, self.rpm_info_list), output, "json")
+        rows = json.loads(output.getvalue())
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[-1], {"package": "*", "arch": "*", "total": 4, "cached": 1, "signed": 1, "signed_main": 1, "unsigned": 1})
+
+    def test_write_report_csv(self):
+        """Test if CSV report has a header and a row for each package and arch."""
+        output = StringIO()
+        write_report(self.audit.audit(self.sign, self.rpm_info_list), output, "csv")
+        rows = list(csv.DictReader(StringIO(output.getvalue())))
+        self.assertEqual([(i["package"], i["arch"], i["total"]) for i in rows], [
+            ("bash", "src", "1"),
+            ("bash", "x86_64", "2"),
+            ("zsh", "x86_64", "1"),
+            ("*", "*", "4"),
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
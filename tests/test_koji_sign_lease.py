@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for koji_sign_lease module.
+"""
+
+
+import unittest
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from mock import patch
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from releng_sop.koji_sign_lease import LeaseLostError, SignLeases  # noqa: E402
+
+
+class TestSignLeases(unittest.TestCase):
+    """
+    Tests of leasing RPMs to signing jobs.
+    """
+
+    def setUp(self):
+        """Create a lease directory and leases of two jobs on different hosts."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_koji_sign_lease_")
+        self.leases = SignLeases(self.temp_dir, ttl=60)
+        self.other = SignLeases(self.temp_dir, ttl=60)
+        self.other.hostname = "other-host"
+        self.other.holder = "other-host:1"
+
+    def tearDown(self):
+        """Remove the lease directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def _write_lease(self, key, holder, expires):
+        with open(os.path.join(self.temp_dir, "%s.lease" % key), "w") as f:
+            json.dump({"holder": holder, "expires": expires}, f)
+
+    def test_acquire_release(self):
+        """Test if a lease is exclusive until it's released."""
+        self.assertTrue(self.leases.acquire("1.deadbeef"))
+        self.assertFalse(self.other.acquire("1.deadbeef"))
+        self.assertTrue(self.other.is_held("1.deadbeef"))
+        self.leases.release("1.deadbeef")
+        self.assertFalse(self.leases.is_held("1.deadbeef"))
+        self.assertTrue(self.other.acquire("1.deadbeef"))
+
+    def test_release_not_held(self):
+        """Test if a job can't release a lease of another job."""
+        self.assertTrue(self.other.acquire("1.deadbeef"))
+        self.leases.release("1.deadbeef")
+        self.assertTrue(self.leases.is_held("1.deadbeef"))
+
+    def test_acquire_many(self):
+        """Test if busy leases are reported."""
+        self.other.acquire("2.deadbeef")
+        self.assertEqual(self.leases.acquire_many(["1.deadbeef", "2.deadbeef", "3.deadbeef"]),
+                         (["1.deadbeef", "3.deadbeef"], ["2.deadbeef"]))
+
+    def test_expired(self):
+        """Test if an expired lease of a crashed job is broken."""
+        self._write_lease("1.deadbeef", "other-host:1", time.time() - 1)
+        self.assertTrue(self.leases.acquire("1.deadbeef"))
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ["1.deadbeef.lease"])
+
+    def test_dead_holder(self):
+        """Test if a lease of a dead process on the same host is broken."""
+        pid = os.fork()
+        if not pid:
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self._write_lease("1.deadbeef", "%s:%s" % (self.leases.hostname, pid), time.time() + 60)
+        self.assertTrue(self.leases.acquire("1.deadbeef"))
+
+    def test_empty_lease(self):
+        """Test if an empty lease expires according to its mtime."""
+        path = os.path.join(self.temp_dir, "1.deadbeef.lease")
+        open(path, "w").close()
+        self.assertFalse(self.leases.acquire("1.deadbeef"))
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        self.assertTrue(self.leases.acquire("1.deadbeef"))
+
+    def test_break_renewed(self):
+        """Test if a lease renewed after it was found stale is kept."""
+        self.assertTrue(self.other.acquire("1.deadbeef"))
+        path = os.path.join(self.temp_dir, "1.deadbeef.lease")
+        self.leases._break(path, {"holder": "other-host:1", "expires": time.time() - 1})
+        self.assertEqual(os.listdir(self.temp_dir), ["1.deadbeef.lease"])
+        self.assertFalse(self.leases.acquire("1.deadbeef"))
+
+    def test_break_renewed_acquired(self):
+        """Test if a renewed lease is lost when another job acquires it before it's put back."""
+        self.assertTrue(self.other.acquire("1.deadbeef"))
+        path = os.path.join(self.temp_dir, "1.deadbeef.lease")
+        third = SignLeases(self.temp_dir, ttl=60)
+        third.holder = "third-host:1"
+        link = os.link
+
+        def _link(src, dst):
+            # the third job acquires the lease between rename and link
+            self.assertTrue(third.acquire("1.deadbeef"))
+            link(src, dst)
+
+        with patch("os.link", side_effect=_link):
+            self.leases._break(path, {"holder": "other-host:1", "expires": time.time() - 1})
+
+        self.assertEqual(os.listdir(self.temp_dir), ["1.deadbeef.lease"])
+        self.assertEqual(third._read(path)["holder"], "third-host:1")
+        self.assertFalse(self.other.renew("1.deadbeef"))
+        self.assertRaises(LeaseLostError, self.other.check, ["1.deadbeef"])
+        third.check(["1.deadbeef"])
+
+        with self.assertRaises(LeaseLostError):
+            with self.other.renewing(["1.deadbeef"], interval=0.01) as check_leases:
+                time.sleep(0.1)
+                self.assertRaises(LeaseLostError, check_leases)
+        self.assertEqual(third._read(path)["holder"], "third-host:1")
+
+    def test_renew(self):
+        """Test if leases are renewed while they're held and not when they're lost."""
+        leases = SignLeases(self.temp_dir, ttl=0.3)
+        self.assertTrue(leases.acquire("1.deadbeef"))
+        self.assertTrue(leases.acquire("2.deadbeef"))
+        with leases.renewing(["1.deadbeef"], interval=0.05):
+            time.sleep(0.6)
+            self.assertTrue(self.other.is_held("1.deadbeef"))
+            self.assertFalse(self.other.is_held("2.deadbeef"))
+        self.assertTrue(self.other.acquire("2.deadbeef"))
+        self.assertFalse(leases.renew("2.deadbeef"))
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ["1.deadbeef.lease", "2.deadbeef.lease"])
+
+    def test_wait(self):
+        """Test if waiting returns leases that are still held after timeout."""
+        self.other.acquire("1.deadbeef")
+        self.other.acquire("2.deadbeef")
+        self.other.release("2.deadbeef")
+        self.assertEqual(self.leases.wait(["1.deadbeef", "2.deadbeef"], interval=0, timeout=0), ["1.deadbeef"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for koji_sign_metrics module.
+"""
+
+
+import unittest
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from releng_sop.koji_sign_metrics import SignMetrics, STAGES  # noqa: E402
+
+
+class TestSignMetrics(unittest.TestCase):
+    """
+    Tests of recording and writing metrics of signing stages.
+    """
+
+    def setUp(self):
+        """Create metrics and a temp directory."""
+        self.metrics = SignMetrics()
+        self.temp_dir = tempfile.mkdtemp(prefix="test_koji_sign_metrics_")
+
+    def tearDown(self):
+        """Remove the temp directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_stage(self):
+        """Test if RPMs, bytes and RPCs are recorded in the current stage."""
+        with self.metrics.stage("import", [{"size": 100}, {"size": 200}]) as timer:
+            self.metrics.rpc()
+            self.metrics.rpc()
+        self.metrics.rpc()
+
+        stages = self.metrics.to_dict()["stages"]
+        self.assertEqual(list(stages)[:len(STAGES)], STAGES)
+        self.assertEqual(stages["import"]["calls"], 1)
+        self.assertEqual(stages["import"]["items"], 2)
+        self.assertEqual(stages["import"]["bytes"], 300)
+        self.assertEqual(stages["import"]["rpcs"], 2)
+        self.assertEqual(stages["import"]["time"], timer.duration)
+        self.assertEqual(stages["other"]["rpcs"], 1)
+
+    def test_nested_stage(self):
+        """Test if a nested stage is accounted to the outer one."""
+        with self.metrics.stage("refresh", [{"size": 1}]):
+            with self.metrics.stage("sig_query", [{"size": 1}]) as timer:
+                self.metrics.rpc()
+        self.assertTrue(timer.duration >= 0)
+
+        stages = self.metrics.to_dict()["stages"]
+        self.assertEqual((stages["refresh"]["calls"], stages["refresh"]["rpcs"]), (1, 1))
+        self.assertEqual((stages["sig_query"]["calls"], stages["sig_query"]["rpcs"]), (0, 0))
+
+    def test_threads(self):
+        """Test if stages in threads are recorded separately and add up."""
+        def _run():
+            with self.metrics.stage("copy", [{"size": 10}]):
+                self.metrics.rpc()
+
+        with self.metrics.stage("sigcache_write"):
+            threads = [threading.Thread(target=_run) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        stages = self.metrics.to_dict()["stages"]
+        self.assertEqual((stages["copy"]["calls"], stages["copy"]["bytes"], stages["copy"]["rpcs"]), (4, 40, 4))
+        self.assertEqual(stages["sigcache_write"]["rpcs"], 0)
+
+    def test_write(self):
+        """Test if metrics are written as JSON and Prometheus text format."""
+        self.metrics.add("copy", 2.0, items=2, size=4 * 1024 ** 2)
+        json_path = os.path.join(self.temp_dir, "metrics.json")
+        prom_path = os.path.join(self.temp_dir, "metrics.prom")
+        self.metrics.write_json(json_path)
+        self.metrics.write_prometheus(prom_path, labels={"release": 'f"24'})
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ["metrics.json", "metrics.prom"])
+
+        with open(json_path) as f:
+            data = json.load(f)
+        self.assertEqual(data["stages"]["copy"]["throughput"], 2 * 1024 ** 2)
+
+        with open(prom_path) as f:
+            lines = f.read().splitlines()
+        self.assertIn("# TYPE releng_sop_sign_stage_bytes gauge", lines)
+        self.assertIn('releng_sop_sign_stage_bytes{release="f\\"24",stage="copy"} 4194304', lines)
+        self.assertIn('releng_sop_sign_stage_rpms{release="f\\"24",stage="copy"} 2', lines)
+        # per-run values are gauges, a _total suffix is reserved for counters
+        self.assertEqual([i for i in lines if "_total" in i], [])
+
+    def test_format(self):
+        """Test if only stages that ran are listed."""
+        self.metrics.add("sign", 1.5, items=3, size=1024 ** 2)
+        lines = self.metrics.format()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1].split(), ["sign", "1.5", "1", "3", "1.0", "0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for koji_sign_progress module.
+"""
+
+
+import unittest
+
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from mock import Mock, patch
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from tests.common import mock_module  # noqa: E402
+mock_module("koji")
+
+from releng_sop import koji_sign  # noqa: E402
+from releng_sop.koji_sign import KojiSignRPMs  # noqa: E402
+from releng_sop.koji_sign_metrics import SignMetrics  # noqa: E402
+from releng_sop.koji_sign_progress import SignProgress  # noqa: E402
+from tests import fake_koji_hub  # noqa: E402
+from tests.rpm_corpus import RPMCorpus  # noqa: E402
+
+
+MIB = 1024 ** 2
+
+
+class _TTY(io.StringIO):
+
+    def isatty(self):
+        return True
+
+
+class TestSignProgress(unittest.TestCase):
+    """
+    Tests of computing and rendering progress.
+    """
+
+    def test_status(self):
+        """Test if throughput is computed over the rolling window and ETA from remaining bytes."""
+        progress = SignProgress("log", logger=Mock(), window=100)
+        progress.add_total("sign", [{"size": 10 * MIB}] * 100)
+        with patch("releng_sop.koji_sign_progress.time.time", return_value=1000.0):
+            progress.update("sign", items=10, size=100 * MIB)
+        # slower in the window after a sample
+        progress._sample(1010.0)
+        with patch("releng_sop.koji_sign_progress.time.time", return_value=1050.0):
+            progress.update("sign", items=10, size=50 * MIB)
+
+        status = progress.get_status("sign", now=1060.0)
+        self.assertEqual((status["items"], status["total_items"]), (20, 100))
+        self.assertEqual(status["bytes_per_s"], MIB)
+        self.assertEqual(status["eta"], 850)
+
+        # the first sample left the window
+        progress._sample(1100.0)
+        status = progress.get_status("sign", now=1210.0)
+        self.assertEqual(status["items_per_s"], 0.0)
+        self.assertEqual(status["eta"], None)
+        self.assertEqual(status["idle"], 160)
+        progress.close()
+
+    def test_log(self):
+        """Test if stages are logged until they are complete and the values are attached to records."""
+        logger = Mock()
+        progress = SignProgress("auto", logger=logger, stream=io.StringIO(), interval=3600)
+        self.assertEqual(progress.mode, "log")
+        progress.add_total("write", [{"size": 1}, {"size": 1}])
+        progress.update("write", size=1)
+        progress.update("listing")
+        progress.report()
+        self.assertEqual(logger.info.call_count, 2)
+        msg = logger.info.call_args_list[0][0][0]
+        self.assertTrue(msg.startswith("Progress: stage=write rpms=1/2 mib=0.0/0.0 "), msg)
+        self.assertEqual(logger.info.call_args_list[0][1]["extra"]["progress"]["items"], 1)
+
+        # stalled write is reported again, finished listing isn't
+        logger.reset_mock()
+        progress.report()
+        self.assertEqual(logger.info.call_count, 1)
+        progress.update("write", size=1)
+        progress.close()
+        self.assertEqual(logger.info.call_count, 2)
+        progress.report()
+        self.assertEqual(logger.info.call_count, 2)
+
+    def test_tty(self):
+        """Test if a status line is drawn and log records on the terminal clear it."""
+        stream = _TTY()
+        logger = logging.Logger("test")
+        handler = logging.StreamHandler(stream)
+        logger.addHandler(handler)
+        progress = SignProgress("auto", logger=logger, stream=stream, interval=3600)
+        self.assertEqual(progress.mode, "tty")
+        progress.add_total("copy", [{"size": MIB}] * 4)
+        progress.update("copy", items=2, size=2 * MIB)
+        progress.report()
+        logger.warning("message")
+        progress.close()
+        self.assertEqual(handler.filters, [])
+        lines = stream.getvalue().split("\r\x1b[K")
+        self.assertTrue(" copy: 2/4 RPMs, 2.0/4.0 MiB, " in lines[1], lines)
+        self.assertEqual(lines[2], "message\n")
+        self.assertTrue(lines[-1].endswith("\n"))
+
+    def test_none(self):
+        """Test if nothing is tracked in 'none' mode."""
+        progress = SignProgress("none")
+        progress.add_total("sign", [{"size": 1}])
+        progress.update("sign")
+        self.assertEqual(progress.stages, {})
+        self.assertEqual(progress._thread, None)
+        progress.close()
+        self.assertRaises(ValueError, SignProgress, "fancy")
+
+    def test_metrics(self):
+        """Test if finished stage runs are reported, nested ones to the outer stage."""
+        progress = SignProgress("log", logger=Mock(), interval=3600)
+        metrics = SignMetrics(progress=progress)
+        with metrics.stage("refresh", [{"size": 1}, {"size": 2}]):
+            with metrics.stage("sig_query", [{"size": 1}]):
+                pass
+        progress.close()
+        self.assertEqual(list(progress.stages), ["refresh"])
+        self.assertEqual((progress.stages["refresh"]["items"], progress.stages["refresh"]["bytes"]), (2, 3))
+
+
+class TestSignWithProgress(unittest.TestCase):
+    """
+    Tests of progress of signing RPMs from a fake hub.
+    """
+
+    def setUp(self):
+        """Generate a corpus and use fake hub helpers instead of koji functions."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_koji_sign_progress_")
+        self.hub = fake_koji_hub.FakeKojiHub(self.temp_dir)
+        self.rpm_info_list = RPMCorpus(self.temp_dir, hub=self.hub).generate(
+            30, tag="test-tag", sizes="fixed", size=1024, signed_copies={"deadbeef": 0.5})
+        self.hub.start()
+        koji_module = Mock(config=Mock(server=self.hub.url, authtype=None), pathinfo=self.hub.pathinfo)
+        self.patchers = [
+            patch.object(koji_sign.koji, "get_profile_module", create=True, return_value=koji_module),
+            patch.object(koji_sign.koji, "ClientSession", fake_koji_hub.get_client_session_class(), create=True),
+            patch.object(koji_sign.koji, "rip_rpm_sighdr", fake_koji_hub.rip_rpm_sighdr, create=True),
+            patch.object(koji_sign.koji, "find_rpm_sighdr", fake_koji_hub.find_rpm_sighdr, create=True),
+            patch.object(koji_sign, "_get_sighdr_sigkey", fake_koji_hub.get_sighdr_sigkey),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """Stop the hub, remove the koji volume."""
+        for patcher in self.patchers:
+            patcher.stop()
+        self.hub.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def test_sign(self):
+        """Test if every stage with a total completes it."""
+        cached = len(self.hub.sigs)
+        uncached = len(self.rpm_info_list) - cached
+        sign = KojiSignRPMs("test", fake_koji_hub.FakeRPMSign, logger=Mock(), progress="log")
+        sign.chunker.max_files = 5
+        sign.sign(sign.get_latest_tagged_rpms("test-tag"), ["deadbeef"], commit=True)
+        sign.progress.close()
+        self.assertTrue(0 < uncached < len(self.rpm_info_list))
+        for stage in ["copy", "sign", "import", "write"]:
+            status = sign.progress.get_status(stage)
+            self.assertEqual((status["items"], status["total_items"]), (uncached, uncached))
+            self.assertEqual(status["bytes"], status["total_bytes"])
+        status = sign.progress.get_status("signed_check")
+        self.assertEqual(status["items"], cached)
+
+
+if __name__ == "__main__":
+    unittest.main()
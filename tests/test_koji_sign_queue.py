@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for koji_sign_queue module.
+"""
+
+
+import unittest
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from releng_sop.common import Error  # noqa: E402
+from releng_sop.koji_sign_queue import SignQueue  # noqa: E402
+
+
+def _run_worker(queue_dir):
+    """Claim and complete chunks until the queue is empty."""
+    queue = SignQueue(queue_dir)
+    while True:
+        chunk = queue.claim()
+        if chunk is None:
+            break
+        time.sleep(0.001)
+        queue.complete(chunk, {"sigs": {str(i): {"deadbeef": "sighash"} for i in chunk["rpm_ids"]}})
+
+
+class TestSignQueue(unittest.TestCase):
+    """
+    Tests of publishing, claiming and finishing chunks.
+    """
+
+    def setUp(self):
+        """Create a spool directory."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_koji_sign_queue_")
+        self.queue = SignQueue(self.temp_dir, ttl=60)
+
+    def tearDown(self):
+        """Remove the spool directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_claim_in_order(self):
+        """Test if chunks are claimed in the order they were published."""
+        chunk_ids = self.queue.publish([{"num": i} for i in range(12)])
+        self.assertEqual([self.queue.claim()["num"] for i in range(12)], list(range(12)))
+        self.assertEqual(self.queue.claim(), None)
+        self.assertEqual(self.queue._list("claimed"), chunk_ids)
+
+    def test_complete_and_fail(self):
+        """Test if results of finished chunks are collected."""
+        self.queue.publish([{"num": 0}, {"num": 1}])
+        self.queue.complete(self.queue.claim(), {"sigs": {}})
+        self.queue.fail(self.queue.claim(), "gpg failed")
+        chunk_ids = self.queue._list("done") + self.queue._list("failed")
+
+        done, failed = self.queue.wait(chunk_ids, interval=0)
+        self.assertEqual([(i["num"], i["sigs"]) for i in done], [(0, {})])
+        self.assertEqual([(i["num"], i["error"]) for i in failed], [(1, "gpg failed")])
+        self.assertEqual(self.queue._list("claimed") + self.queue._list("done"), [])
+        self.assertEqual(len(self.queue._list("failed")), 1)
+
+    def test_requeue_stale(self):
+        """Test if chunks of crashed workers are returned to the queue."""
+        chunk_id = self.queue.publish([{"num": 0}])[0]
+        self.queue.claim()
+        self.assertEqual(self.queue.requeue_stale(), [])
+        path = self.queue._get_path("claimed", chunk_id)
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        self.assertEqual(self.queue.requeue_stale(), [chunk_id])
+        self.assertEqual(self.queue.claim()["id"], chunk_id)
+
+    def test_wait_timeout(self):
+        """Test if waiting fails when no worker processes chunks and pending chunks are withdrawn."""
+        chunk_ids = self.queue.publish([{"num": 0}, {"num": 1}, {"num": 2}])
+        self.queue.claim()
+        self.queue.complete(self.queue.claim())
+        self.assertRaises(Error, self.queue.wait, chunk_ids, interval=0.01, timeout=0.1)
+        self.assertEqual(self.queue._list("pending"), [])
+        self.assertEqual(self.queue._list("claimed"), chunk_ids[:1])
+
+    def test_wait_touched(self):
+        """Test if a chunk touched by a worker keeps the coordinator waiting longer than timeout."""
+        chunk_ids = self.queue.publish([{"num": 0}])
+        chunk = self.queue.claim()
+
+        def _work():
+            for _ in range(30):
+                time.sleep(0.01)
+                self.queue.touch(chunk["id"])
+            self.queue.complete(chunk)
+
+        worker = threading.Thread(target=_work)
+        worker.start()
+        done, failed = self.queue.wait(chunk_ids, interval=0.01, timeout=0.1)
+        worker.join()
+        self.assertEqual([i["id"] for i in done], chunk_ids)
+
+    def test_multiple_workers(self):
+        """Test if each chunk is processed exactly once by worker processes."""
+        chunk_ids = self.queue.publish([{"rpm_ids": [i * 10 + j for j in range(10)]} for i in range(50)])
+        workers = [multiprocessing.Process(target=_run_worker, args=(self.temp_dir, )) for i in range(4)]
+        for worker in workers:
+            worker.start()
+        done, failed = self.queue.wait(chunk_ids, interval=0.01)
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(failed, [])
+        self.assertEqual(sorted([i["id"] for i in done]), chunk_ids)
+        rpm_ids = sorted([int(j) for i in done for j in i["sigs"]])
+        self.assertEqual(rpm_ids, list(range(500)))
+        for state in SignQueue.STATES:
+            self.assertEqual(self.queue._list(state), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for koji_sign_rpc_trace module.
+"""
+
+
+import unittest
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+from mock import Mock, patch
+
+from six.moves import xmlrpc_client
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from tests.common import mock_module  # noqa: E402
+mock_module("koji")
+
+from releng_sop import koji_sign  # noqa: E402
+from releng_sop.koji_sign import KojiSignRPMs  # noqa: E402
+from releng_sop.koji_sign_rpc_trace import RPCTracer, HISTOGRAM_BUCKETS  # noqa: E402
+from tests import fake_koji_hub  # noqa: E402
+from tests.rpm_corpus import RPMCorpus  # noqa: E402
+
+
+class TestRPCTracer(unittest.TestCase):
+    """
+    Tests of recording RPCs and their summaries.
+    """
+
+    def setUp(self):
+        """Create a directory for trace files."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_koji_sign_rpc_trace_")
+        self.path = os.path.join(self.temp_dir, "trace.jsonl")
+
+    def tearDown(self):
+        """Remove trace files."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_summary(self):
+        """Test if percentiles, histograms and item counts are computed by method."""
+        tracer = RPCTracer(threshold=10)
+        for i in range(100):
+            tracer.record("getBuild", (i, ), None, 0, (i + 1) / 100.0, result={"id": i})
+        tracer.record("listTaggedRPMS", ("tag", ), {"latest": True}, 0, 20, result=[[{}, {}, {}], [{}]])
+        tracer.record("addRPMSig", (1, "sighdr"), None, 0, 0.001, error=xmlrpc_client.Fault(1000, "exists"))
+
+        data = tracer.to_dict()
+        self.assertEqual(list(data), ["getBuild", "listTaggedRPMS", "addRPMSig"])
+        build = data["getBuild"]
+        self.assertEqual((build["calls"], build["errors"], build["items"]), (100, 0, 0))
+        self.assertEqual((build["p50"], build["p90"], build["p99"], build["max"]), (0.5, 0.9, 0.99, 1.0))
+        self.assertEqual(len(build["histogram"]), len(HISTOGRAM_BUCKETS) + 1)
+        # 0.01 .. 1.0: <0.01s none, <0.05s 4, ..., 1.0 is in <2.5s
+        self.assertEqual(build["histogram"], [0, 4, 5, 15, 25, 50, 1, 0, 0, 0])
+        # requests are measured only for slow calls
+        self.assertEqual(build["request_bytes"], 0)
+
+        self.assertEqual(data["listTaggedRPMS"]["items"], 4)
+        self.assertTrue(data["listTaggedRPMS"]["request_bytes"] > 0)
+        self.assertEqual(data["listTaggedRPMS"]["histogram"][-1], 1)
+        self.assertEqual(data["addRPMSig"]["errors"], 1)
+        self.assertEqual(tracer.slow_calls, 1)
+
+        lines = tracer.format()
+        self.assertTrue(lines[0].split()[:3] == ["method", "calls", "errors"], lines)
+        self.assertTrue(lines[1].startswith("getBuild "), lines)
+        self.assertEqual(lines[-1], "Calls slower than 10s: 1")
+
+    def test_trace_file(self):
+        """Test if slow calls are written with summarized arguments."""
+        tracer = RPCTracer(self.path, threshold=1)
+        tracer.record("getBuild", (1, ), None, 100.0, 0.5, result={"id": 1})
+        calls = [{"methodName": "writeSignedRPM", "params": [{"id": i}, "deadbeef"]} for i in range(5)]
+        tracer.record("multiCall", (calls, ), {}, 200.0, 3.0, result=[[None]] * 5)
+        tracer.record("addRPMSig", (1, "x" * 1000), None, 300.0, 2.0, error=xmlrpc_client.Fault(1000, "exists"))
+        tracer.close()
+        tracer.close()
+
+        with open(self.path, "r") as f:
+            lines = [json.loads(i) for i in f]
+        self.assertEqual([i["method"] for i in lines], ["multiCall:writeSignedRPM", "addRPMSig"])
+        self.assertEqual((lines[0]["time"], lines[0]["duration"], lines[0]["items"]), (200.0, 3.0, 5))
+        self.assertTrue(lines[0]["args"].startswith("5 calls: writeSignedRPM({'id': 0}, 'deadbeef'), "), lines[0])
+        self.assertTrue(lines[0]["args"].endswith(", ..."), lines[0])
+        self.assertTrue("...(1002 chars)" in lines[1]["args"], lines[1])
+        self.assertTrue("exists" in lines[1]["error"], lines[1])
+        self.assertTrue(lines[1]["request_bytes"] > 1000)
+        self.assertEqual(tracer.format()[-1], "Calls slower than 1s: 2 (see %s)" % self.path)
+
+    def test_redact_login(self):
+        """Test if arguments of slow login calls are not written."""
+        tracer = RPCTracer(self.path, threshold=1)
+        tracer.record("login", ("user", "SECRET"), None, 100.0, 2.0, result=True)
+        tracer.record("sslLogin", (), {"proxyuser": "SECRET"}, 100.0, 2.0, result=True)
+        tracer.close()
+        with open(self.path, "r") as f:
+            data = f.read()
+        self.assertNotIn("SECRET", data)
+        self.assertEqual([json.loads(i)["args"] for i in data.splitlines()], ["login(<redacted>)", "sslLogin(<redacted>)"])
+
+
+class TestTraceKojiSession(unittest.TestCase):
+    """
+    Tests of tracing RPCs of a koji session talking to a fake hub.
+    """
+
+    def setUp(self):
+        """Generate a corpus on a slow hub and use fake hub helpers instead of koji functions."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_koji_sign_rpc_trace_")
+        self.path = os.path.join(self.temp_dir, "trace.jsonl")
+        self.hub = fake_koji_hub.FakeKojiHub(self.temp_dir, latency={"listTaggedRPMS": 0.2})
+        self.rpm_info_list = RPMCorpus(self.temp_dir, hub=self.hub).generate(12, tag="test-tag", sizes="fixed", size=1024)
+        self.hub.start()
+        koji_module = Mock(config=Mock(server=self.hub.url, authtype=None), pathinfo=self.hub.pathinfo)
+        self.patchers = [
+            patch.object(koji_sign.koji, "get_profile_module", create=True, return_value=koji_module),
+            patch.object(koji_sign.koji, "ClientSession", fake_koji_hub.get_client_session_class(), create=True),
+            patch.object(koji_sign.koji, "rip_rpm_sighdr", fake_koji_hub.rip_rpm_sighdr, create=True),
+            patch.object(koji_sign.koji, "find_rpm_sighdr", fake_koji_hub.find_rpm_sighdr, create=True),
+            patch.object(koji_sign, "_get_sighdr_sigkey", fake_koji_hub.get_sighdr_sigkey),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """Stop the hub, remove the koji volume."""
+        for patcher in self.patchers:
+            patcher.stop()
+        self.hub.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def test_session(self):
+        """Test if calls and multicalls are timed, queued calls are not and faults are counted."""
+        tracer = RPCTracer(self.path, threshold=0.1)
+        session = tracer.instrument(fake_koji_hub.get_client_session_class()(self.hub.url))
+        rpms, builds = session.listTaggedRPMS("test-tag", latest=True)
+        session.multicall = True
+        for rpm_info in rpms[:3]:
+            session.queryRPMSigs(rpm_id=rpm_info["id"])
+        session.multiCall()
+        self.hub.fail("getBuild")
+        self.assertRaises(xmlrpc_client.Fault, session.getBuild, builds[0]["id"])
+        tracer.close()
+
+        data = tracer.to_dict()
+        self.assertEqual(list(data), ["listTaggedRPMS", "multiCall:queryRPMSigs", "getBuild"])
+        self.assertEqual(data["listTaggedRPMS"]["items"], len(self.rpm_info_list) + len(builds))
+        self.assertTrue(data["listTaggedRPMS"]["p50"] >= 0.2)
+        self.assertEqual((data["multiCall:queryRPMSigs"]["calls"], data["multiCall:queryRPMSigs"]["items"]), (1, 3))
+        self.assertEqual((data["getBuild"]["calls"], data["getBuild"]["errors"]), (1, 1))
+
+        with open(self.path, "r") as f:
+            lines = [json.loads(i) for i in f]
+        self.assertEqual([i["method"] for i in lines], ["listTaggedRPMS"])
+        self.assertTrue("'latest': True" in lines[0]["args"], lines[0])
+
+    def test_sign(self):
+        """Test if RPCs of KojiSignRPMs sessions are traced."""
+        tracer = RPCTracer(threshold=0.1)
+        sign = KojiSignRPMs("test", fake_koji_hub.FakeRPMSign, logger=Mock(), rpc_tracer=tracer)
+        sign.sign(sign.get_latest_tagged_rpms("test-tag"), ["deadbeef"], commit=True)
+        tracer.close()
+        data = tracer.to_dict()
+        self.assertEqual(data["listTaggedRPMS"]["calls"], 1)
+        self.assertTrue([i for i in data if i.startswith("multiCall:") and "writeSignedRPM" in i], list(data))
+        self.assertEqual(tracer.slow_calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for koji_sign_rpms_in_release module.
+"""
+
+
+import unittest
+
+import os
+import shutil
+import sys
+import tempfile
+from mock import Mock, patch
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from tests.common import mock_module, ParserTestBase  # noqa: E402
+mock_module("koji")
+
+from releng_sop.common import Environment, Release, UsageError  # noqa: E402
+from releng_sop.koji_sign import KojiSignRPMs  # noqa: E402
+from releng_sop.koji_sign_metrics import SignMetrics  # noqa: E402
+from releng_sop.koji_sign_rpms_in_release import KojiSignRPMsInRelease, get_parser, parse_release_ids, read_package_list  # noqa: E402
+
+
+RELEASES_DIR = os.path.join(DIR, "releases")
+ENVIRONMENTS_DIR = os.path.join(DIR, "environments")
+
+
+class TestKojiSignRPMsInRelease(unittest.TestCase):
+    """
+    Tests of KojiSignRPMsInRelease class.
+    """
+
+    def setUp(self):
+        """Load test environment and release."""
+        self.env = Environment("test-env", config_dirs=[ENVIRONMENTS_DIR])
+        self.release = Release("test-release", config_dirs=[RELEASES_DIR])
+
+        self.rpm_info_list = [
+            {"id": 1, "name": "bash", "arch": "x86_64", "size": 3, "build": {"name": "bash"}},
+            {"id": 2, "name": "kernel", "arch": "x86_64", "size": 1, "build": {"name": "kernel"}},
+            {"id": 3, "name": "glibc", "arch": "x86_64", "size": 2, "build": {"name": "glibc"}},
+        ]
+        # use real sorting and filtering methods without a koji session
+        self.sign = Mock()
+        self.sign.sort_rpm_info_list_by_priority.side_effect = lambda *args, **kwargs: KojiSignRPMs.sort_rpm_info_list_by_priority(self.sign, *args, **kwargs)
+        self.sign.filter_rpm_info_list_by_packages.side_effect = lambda *args: KojiSignRPMs.filter_rpm_info_list_by_packages(self.sign, *args)
+
+    def _get_batches(self, **kwargs):
+        sign_release = KojiSignRPMsInRelease(self.env, self.release, "beta", **kwargs)
+        batches = sign_release._get_priority_batches(self.sign, self.rpm_info_list)
+        return [(title, [i["id"] for i in rpm_info_list]) for title, rpm_info_list in batches]
+
+    def test_sigkeys(self):
+        """Test if beta level signs with beta key and accepts gold key."""
+        sign_release = KojiSignRPMsInRelease(self.env, self.release, "beta")
+        self.assertEqual(sign_release.koji_tag, "test-compose")
+        self.assertEqual(sign_release.sigkeys, ["beta-key", "gold-key"])
+
+    def test_priority_batches_default(self):
+        """Test if all RPMs are signed at once without priority packages."""
+        self.assertEqual(self._get_batches(), [(None, [1, 2, 3])])
+        self.assertEqual(self._get_batches(priorities=["smallest"]), [(None, [2, 3, 1])])
+
+    def test_priority_batches(self):
+        """Test if priority packages are signed first."""
+        self.assertEqual(self._get_batches(priority_packages=["glibc", "kernel"], priorities=["smallest"]), [
+            ("priority packages", [2, 3]),
+            ("remaining packages", [1]),
+        ])
+
+    def test_priority_batches_pause(self):
+        """Test if only priority packages are signed when pausing after them."""
+        self.assertEqual(self._get_batches(priority_packages=["glibc"], pause_after_priority=True), [
+            ("priority packages", [3]),
+        ])
+
+    def test_pause_without_priority_packages(self):
+        """Test if pausing requires priority packages."""
+        self.assertRaises(UsageError, KojiSignRPMsInRelease, self.env, self.release, "beta", pause_after_priority=True)
+
+
+class TestKojiSignMultipleReleases(unittest.TestCase):
+    """
+    Tests of signing several releases at once.
+    """
+
+    def setUp(self):
+        """Load test environment and releases, mock tag listings."""
+        self.env = Environment("test-env", config_dirs=[ENVIRONMENTS_DIR])
+        self.release = Release("test-release", config_dirs=[RELEASES_DIR])
+        self.scl = Release("test-scl", config_dirs=[RELEASES_DIR])
+
+        bash = {"id": 1, "name": "bash", "arch": "x86_64", "build": {"name": "bash"}}
+        kernel = {"id": 2, "name": "kernel", "arch": "x86_64", "build": {"name": "kernel"}}
+        python = {"id": 3, "name": "python27", "arch": "x86_64", "build": {"name": "python27"}}
+        self.tagged_rpms = {
+            "test-compose": [bash, kernel],
+            "test-scl-compose": [bash, python],
+        }
+
+        self.sign = Mock()
+        self.sign.get_latest_tagged_rpms.side_effect = lambda tag, **kwargs: self.tagged_rpms[tag]
+        self.sign.get_rpm_sig_dict.return_value = {}
+        self.sign.sign.return_value = []
+        self.sign.sort_rpm_info_list_by_priority.side_effect = lambda rpm_info_list, *args, **kwargs: rpm_info_list
+        self.sign.metrics = SignMetrics()
+
+    def _run(self, sign_release):
+        with patch("releng_sop.koji_sign_rpms_in_release.KojiSignRPMs", return_value=self.sign):
+            sign_release.run(commit=True)
+
+    def test_targets(self):
+        """Test if each release gets a tag and sigkeys of its level."""
+        sign_release = KojiSignRPMsInRelease(self.env, [self.release, self.scl], ["beta", "gold"])
+        self.assertEqual([(i.name, j, k, l) for i, j, k, l in sign_release.targets], [
+            ("test-release", "beta", "test-compose", ["beta-key", "gold-key"]),
+            ("test-scl", "gold", "test-scl-compose", ["gold-key"]),
+        ])
+        self.assertEqual(sign_release.release_id, "test-release")
+        self.assertEqual(sign_release.sigkeys, ["beta-key", "gold-key"])
+
+    def test_levels_mismatch(self):
+        """Test if each release needs a level."""
+        self.assertRaises(UsageError, KojiSignRPMsInRelease, self.env, [self.release, self.scl], ["beta"])
+
+    def test_shared_rpms_signed_once(self):
+        """Test if RPMs shared by releases with the same sigkeys are queried and signed once."""
+        self._run(KojiSignRPMsInRelease(self.env, [self.release, self.scl], "gold"))
+        self.sign.get_rpm_sig_dict.assert_called_once_with([self.tagged_rpms["test-compose"][0], self.tagged_rpms["test-compose"][1],
+                                                            self.tagged_rpms["test-scl-compose"][1]])
+        self.assertEqual(self.sign.sign.call_count, 1)
+        args, kwargs = self.sign.sign.call_args
+        self.assertEqual([i["id"] for i in args[0]], [1, 2, 3])
+        self.assertEqual(args[1], ["gold-key"])
+        self.assertIs(kwargs["rpm_sig_dict"], self.sign.get_rpm_sig_dict.return_value)
+
+    def test_fan_out_per_sigkeys(self):
+        """Test if RPMs are signed once for each set of sigkeys."""
+        self._run(KojiSignRPMsInRelease(self.env, [self.release, self.scl, self.release], ["beta", "gold", "beta"]))
+        self.assertEqual(self.sign.get_latest_tagged_rpms.call_count, 2)
+        self.assertEqual(self.sign.get_rpm_sig_dict.call_count, 1)
+        calls = [([i["id"] for i in args[0]], args[1]) for args, kwargs in self.sign.sign.call_args_list]
+        self.assertEqual(calls, [
+            ([1, 2], ["beta-key", "gold-key"]),
+            ([1, 3], ["gold-key"]),
+        ])
+
+    def test_estimate(self):
+        """Test if signing is only estimated for each set of sigkeys."""
+        self._run(KojiSignRPMsInRelease(self.env, [self.release, self.scl], ["beta", "gold"], estimate=True))
+        self.assertEqual(self.sign.sign.call_count, 0)
+        calls = [([i["id"] for i in args[0]], args[1]) for args, kwargs in self.sign.estimate.call_args_list]
+        self.assertEqual(calls, [
+            ([1, 2], ["beta-key", "gold-key"]),
+            ([1, 3], ["gold-key"]),
+        ])
+
+    def test_metrics_written_on_failure(self):
+        """Test if metrics files are written even if signing fails."""
+        temp_dir = tempfile.mkdtemp(prefix="test_koji_sign_rpms_in_release_")
+        self.addCleanup(shutil.rmtree, temp_dir)
+        metrics_json = os.path.join(temp_dir, "metrics.json")
+        metrics_prom = os.path.join(temp_dir, "metrics.prom")
+        self.sign.sign.side_effect = Exception("gpg failed")
+        sign_release = KojiSignRPMsInRelease(self.env, [self.release, self.scl], "gold",
+                                             metrics_json=metrics_json, metrics_prom=metrics_prom)
+        self.assertRaises(Exception, self._run, sign_release)
+        self.assertTrue(os.path.isfile(metrics_json))
+        with open(metrics_prom) as f:
+            self.assertIn('releng_sop_sign_stage_duration_seconds{level="gold,gold",release="test-release,test-scl",stage="copy"} 0.0',
+                          f.read())
+
+    def test_parse_release_ids(self):
+        """Test if level can be overridden for each release."""
+        self.assertEqual(parse_release_ids(["fedora-24", "fedora-24-updates:beta"], "gold"),
+                         (["fedora-24", "fedora-24-updates"], ["gold", "beta"]))
+        self.assertRaises(UsageError, parse_release_ids, ["fedora-24:silver"], "gold")
+
+
+class TestReadPackageList(unittest.TestCase):
+    """
+    Tests of reading package lists.
+    """
+
+    def setUp(self):
+        """Create a temp directory."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_koji_sign_rpms_in_release_")
+
+    def tearDown(self):
+        """Remove the temp directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_read_package_list(self):
+        """Test if comments and empty lines are skipped."""
+        path = os.path.join(self.temp_dir, "critical-path.txt")
+        with open(path, "w") as f:
+            f.write("# critical path\nbash\n\n  kernel  # boot\nglibc\n")
+        self.assertEqual(read_package_list(path), ["bash", "kernel", "glibc"])
+
+
+class TestKojiSignRPMsInReleaseParser(ParserTestBase, unittest.TestCase):
+    """Set Arguments and Parser for Test generator."""
+
+    ARGUMENTS = {
+        'envHelp': {
+            'arg': '--env ENV',
+            'env_default': ['fedora-24', 'gold'],
+            'env_set': ['fedora-24', 'gold', "--env", "some_env"],
+        },
+        'commitHelp': {
+            'arg': '--commit',
+            'commit_default': ['fedora-24', 'gold'],
+            'commit_set': ['fedora-24', 'gold', '--commit'],
+        },
+        'helpReleaseId': {
+            'arg': 'RELEASE_ID',
+        },
+        'helpJustVerify': {
+            'arg': '--just-verify',
+        },
+        'helpVerify': {
+            'arg': '--verify',
+        },
+    }
+
+    PARSER = get_parser()
+
+    def test_progress_default(self):
+        """Test if progress is off by default, like in KojiSignRPMsInRelease and KojiSignRPMs."""
+        self.assertEqual(self.PARSER.parse_args(["fedora-24", "gold"]).progress, "none")
+
+
+if __name__ == "__main__":
+    unittest.main()
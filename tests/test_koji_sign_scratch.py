@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for koji_sign_scratch module.
+"""
+
+
+import unittest
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from mock import Mock
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from releng_sop.common import ConfigError, Error  # noqa: E402
+from releng_sop.koji_sign_scratch import ScratchDirs  # noqa: E402
+
+
+MiB = 1024 ** 2
+
+
+class TestScratchDirs(unittest.TestCase):
+    """
+    Tests of placing chunks on scratch directories.
+    """
+
+    def setUp(self):
+        """Create scratch directories: small tmpfs-like and big disk-like."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_koji_sign_scratch_")
+        self.tmpfs = os.path.join(self.temp_dir, "tmpfs")
+        self.disk = os.path.join(self.temp_dir, "disk")
+        self.fs_free = {self.tmpfs: 1000 * MiB, self.disk: 500 * MiB}
+        self.scratch = ScratchDirs([{"path": self.tmpfs, "max_size": 100}, self.disk], interval=0.01, logger=Mock())
+        self.scratch._get_fs_free = lambda path: self.fs_free[path]
+        self.scratch._get_fs_size = lambda path: 2000 * MiB
+
+    def tearDown(self):
+        """Remove scratch directories."""
+        shutil.rmtree(self.temp_dir)
+
+    def _mkdtemp(self, size):
+        temp_dir = self.scratch.mkdtemp(size * MiB)
+        return os.path.dirname(temp_dir), temp_dir
+
+    def test_most_free_space(self):
+        """Test if chunks go to a directory with most free space within its limit."""
+        self.assertEqual(self._mkdtemp(60)[0], self.disk)
+        self.fs_free[self.disk] = 50 * MiB
+        self.assertEqual(self._mkdtemp(60)[0], self.tmpfs)
+        self.assertEqual(self.scratch.get_free_space(), 50)
+
+    def test_throughput(self):
+        """Test if unmeasured directories are tried first and then the fastest one is preferred."""
+        scratch_dir, temp_dir = self._mkdtemp(10)
+        self.assertEqual(scratch_dir, self.disk)
+        self.scratch.record(temp_dir, 1)
+        self.assertEqual(self._mkdtemp(10)[0], self.tmpfs)
+        self.scratch.record(os.path.join(self.tmpfs, os.listdir(self.tmpfs)[0]), 0.1)
+        self.assertEqual(self._mkdtemp(10)[0], self.tmpfs)
+
+    def test_wait_for_space(self):
+        """Test if a chunk waits until space is released."""
+        self.fs_free[self.disk] = 0
+        temp_dir = self._mkdtemp(80)[1]
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self._mkdtemp(80)[0]))
+        thread.start()
+        thread.join(0.1)
+        self.assertEqual(result, [])
+
+        self.scratch.release(temp_dir)
+        thread.join()
+        self.assertEqual(result, [self.tmpfs])
+
+    def test_wait_for_other_processes(self):
+        """Test if a chunk waits for space freed by other processes when the directories are full."""
+        self.fs_free[self.tmpfs] = 0
+        self.fs_free[self.disk] = 0
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self._mkdtemp(80)[0]))
+        thread.start()
+        thread.join(0.1)
+        self.assertEqual(result, [])
+
+        self.fs_free[self.disk] = 100 * MiB
+        thread.join()
+        self.assertEqual(result, [self.disk])
+
+    def test_chunk_too_big(self):
+        """Test if a chunk that doesn't fit anywhere yet fails after timeout."""
+        self.scratch.timeout = 0.05
+        self.assertRaises(Error, self._mkdtemp, 800)
+        self.assertEqual(os.listdir(self.disk), [])
+
+    def test_chunk_bigger_than_dirs(self):
+        """Test if a chunk that can never fit fails without waiting."""
+        self.scratch.timeout = 3600
+        self.assertRaises(Error, self._mkdtemp, 2001)
+        self.assertEqual(os.listdir(self.disk), [])
+
+    def test_config_error(self):
+        """Test if scratch directories must be set."""
+        self.assertRaises(ConfigError, ScratchDirs, [])
+        self.assertRaises(ConfigError, ScratchDirs, [{"max_size": 100}])
+
+
+if __name__ == "__main__":
+    unittest.main()
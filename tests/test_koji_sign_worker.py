@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for koji_sign_worker module.
+"""
+
+
+import unittest
+
+import os
+import shutil
+import sys
+import tempfile
+from mock import Mock, patch
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from tests.common import mock_module  # noqa: E402
+mock_module("koji")
+
+from releng_sop.common import Environment  # noqa: E402
+from releng_sop.koji_sign import KojiSignRPMs  # noqa: E402
+from releng_sop.koji_sign_worker import KojiSignWorker  # noqa: E402
+
+
+ENVIRONMENTS_DIR = os.path.join(DIR, "environments")
+
+
+class TestKojiSignWorker(unittest.TestCase):
+    """
+    Tests of signing chunks claimed from a queue.
+    """
+
+    def setUp(self):
+        """Create a spool directory and a worker with mocked KojiSignRPMs."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_koji_sign_worker_")
+        env = Environment("test-env", config_dirs=[ENVIRONMENTS_DIR])
+        self.worker = KojiSignWorker(env, self.temp_dir, idle_timeout=0, interval=0)
+
+        self.sign = Mock()
+        self.sign.find_cached.side_effect = lambda *args: KojiSignRPMs.find_cached(self.sign, *args)
+        patcher = patch("releng_sop.koji_sign_worker.KojiSignRPMs", return_value=self.sign)
+        self.koji_sign_class = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Remove the spool directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def _chunk(self, rpm_ids, just_sign=False):
+        return {
+            "koji_profile": "test",
+            "local_write": False,
+            "sigkey": "deadbeef",
+            "just_sign": just_sign,
+            "rpm_info_list": [{"id": i} for i in rpm_ids],
+        }
+
+    def test_process(self):
+        """Test if RPMs signed meanwhile are only written."""
+        self.sign.get_rpm_sig_dict.return_value = {1: {"deadbeef": "sighash"}, 2: {"cafebabe": "sighash"}}
+        sigs = self.worker.process(self._chunk([1, 2]))
+        self.sign.write_signed_rpms_from_sigcache.assert_called_once_with([{"id": 1}], "deadbeef", rpm_sig_dict=sigs, commit=True)
+        self.sign.sign_chunk.assert_called_once_with([{"id": 2}], "deadbeef", sigs, just_sign=False, commit=True)
+
+    def test_run(self):
+        """Test if all chunks are processed and results reported, koji sessions are reused."""
+        self.sign.get_rpm_sig_dict.return_value = {}
+        self.sign.sign_chunk.side_effect = [None, Exception("gpg failed"), None]
+        chunk_ids = self.worker.queue.publish([self._chunk([1]), self._chunk([2]), self._chunk([3])])
+
+        self.assertEqual(self.worker.run(), 3)
+        done, failed = self.worker.queue.wait(chunk_ids, interval=0)
+        self.assertEqual([i["rpm_info_list"] for i in done], [[{"id": 1}], [{"id": 3}]])
+        self.assertEqual([i["error"] for i in failed], ["gpg failed"])
+        self.assertEqual(self.koji_sign_class.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
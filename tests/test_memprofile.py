@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for memprofile module.
+"""
+
+
+import unittest
+
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from mock import Mock, patch
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from tests.common import mock_module  # noqa: E402
+mock_module("koji")
+
+from releng_sop import koji_sign  # noqa: E402
+from releng_sop.koji_sign import KojiSignRPMs  # noqa: E402
+from releng_sop.memprofile import MemoryProfiler, phase, profile_memory  # noqa: E402
+from tests import fake_koji_hub  # noqa: E402
+from tests.rpm_corpus import RPMCorpus  # noqa: E402
+
+
+# stages working on chunks of RPMs
+CHUNK_STAGES = ["copy", "sign", "import", "write"]
+
+
+class TestMemoryProfiler(unittest.TestCase):
+    """
+    Tests of measuring phases and writing reports.
+    """
+
+    def setUp(self):
+        """Create a directory for reports."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_memprofile_")
+
+    def tearDown(self):
+        """Remove reports."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_phase(self):
+        """Test if growth, retained memory and allocation sites of a phase are measured."""
+        with MemoryProfiler(top=3) as memprofiler:
+            with memprofiler.phase("alloc"):
+                temp = [bytearray(1024) for i in range(1024)]
+                kept = [bytearray(1024) for i in range(512)]
+                del temp
+            with phase(memprofiler, "alloc"):
+                pass
+        data = memprofiler.to_dict()["phases"]["alloc"]
+        self.assertEqual(data["calls"], 2)
+        self.assertTrue(data["growth"] >= 1536 * 1024)
+        self.assertTrue(512 * 1024 <= data["retained"] < 1024 * 1024)
+        self.assertTrue(data["top"][0]["site"].startswith("tests/test_memprofile.py:"))
+        self.assertTrue(memprofiler.get_peak() >= data["peak"])
+        self.assertEqual(len(kept), 512)
+
+        with phase(None, "alloc"):
+            pass
+
+    def test_profile_memory(self):
+        """Test if reports are written even if the block fails."""
+        path = os.path.join(self.temp_dir, "report.json")
+        try:
+            with profile_memory(path) as memprofiler:
+                with memprofiler.phase("listing"):
+                    raise RuntimeError
+        except RuntimeError:
+            pass
+        with open(path, "r") as f:
+            data = json.load(f)
+        self.assertEqual(list(data["phases"]), ["listing"])
+        self.assertTrue(data["max_rss"] > 0)
+
+        path = os.path.join(self.temp_dir, "report.txt")
+        with profile_memory(path):
+            pass
+        with open(path, "r") as f:
+            self.assertTrue(f.read().startswith("Traced peak:"))
+
+        with profile_memory(None) as memprofiler:
+            self.assertEqual(memprofiler, None)
+
+
+class TestSignMemory(unittest.TestCase):
+    """
+    Tests of memory used by signing RPMs from a fake hub.
+    """
+
+    def setUp(self):
+        """Use fake hub helpers instead of koji functions."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_memprofile_")
+        self.patchers = [
+            patch.object(koji_sign.koji, "get_profile_module", create=True),
+            patch.object(koji_sign.koji, "ClientSession", fake_koji_hub.get_client_session_class(), create=True),
+            patch.object(koji_sign.koji, "rip_rpm_sighdr", fake_koji_hub.rip_rpm_sighdr, create=True),
+            patch.object(koji_sign.koji, "find_rpm_sighdr", fake_koji_hub.find_rpm_sighdr, create=True),
+            patch.object(koji_sign, "_get_sighdr_sigkey", fake_koji_hub.get_sighdr_sigkey),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        """Remove koji volumes."""
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def _sign(self, rpms):
+        """
+        Sign a tag with a number of RPMs, return measured phases.
+        """
+        topdir = os.path.join(self.temp_dir, str(rpms))
+        hub = fake_koji_hub.FakeKojiHub(topdir)
+        RPMCorpus(topdir, hub=hub).generate(rpms, tag="test-tag", sizes="fixed", size=1024)
+        with hub:
+            koji_sign.koji.get_profile_module.return_value = Mock(config=Mock(server=hub.url, authtype=None), pathinfo=hub.pathinfo)
+            with MemoryProfiler() as memprofiler:
+                sign = KojiSignRPMs("test", fake_koji_hub.FakeRPMSign, log_level=logging.WARNING, memprofiler=memprofiler)
+                sign.chunker.max_files = 10
+                sign.sign(sign.get_latest_tagged_rpms("test-tag"), ["deadbeef"], commit=True)
+        self.assertEqual(len([i for i in hub.sigs.values() if "deadbeef" in i]), rpms)
+        return memprofiler.to_dict()["phases"]
+
+    def test_chunk_stages_sublinear(self):
+        """Test if memory of stages working on chunks doesn't grow with the number of RPMs, unlike listing."""
+        small = self._sign(40)
+        large = self._sign(160)
+        for stage in CHUNK_STAGES:
+            self.assertTrue(large[stage]["growth"] < 2 * small[stage]["growth"] + 64 * 1024,
+                            "%s: %s -> %s" % (stage, small[stage]["growth"], large[stage]["growth"]))
+        self.assertTrue(large["listing"]["growth"] > small["listing"]["growth"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for rpm_corpus module.
+"""
+
+
+import unittest
+
+import hashlib
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+from mock import Mock, patch
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from tests.common import mock_module  # noqa: E402
+mock_module("koji")
+
+from releng_sop import koji_sign  # noqa: E402
+from releng_sop.koji_sign import KojiSignRPMs  # noqa: E402
+from tests import fake_koji_hub  # noqa: E402
+from tests.rpm_corpus import RPMCorpus, get_size_distribution, SIGTAG_MD5, RPMTAG_NAME, RPMTAG_ARCH  # noqa: E402
+
+
+class TestRPMCorpus(unittest.TestCase):
+    """
+    Tests of generated RPMs and their layout.
+    """
+
+    def setUp(self):
+        """Generate a small corpus."""
+        self.topdir = tempfile.mkdtemp(prefix="test_rpm_corpus_")
+        self.corpus = RPMCorpus(self.topdir, seed=1)
+        self.rpm_info_list = self.corpus.generate(20, sizes="uniform", size=4096,
+                                                  main_sigkeys={"cafebabe": 0.3}, signed_copies={"deadbeef": 0.5})
+
+    def tearDown(self):
+        """Remove the koji volume."""
+        shutil.rmtree(self.topdir)
+
+    def _read(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        start, size = fake_koji_hub.find_rpm_sighdr(path)
+        sighdr = data[start:start + size]
+        header = data[start + size:]
+        il, dl = struct.unpack(">II", header[8:16])
+        return data[:start], sighdr, header[:16 + 16 * il + dl], header[16 + 16 * il + dl:]
+
+    def test_rpm_structure(self):
+        """Test if lead, headers and payload are consistent with rpm_info."""
+        for rpm_info in self.rpm_info_list:
+            path = self.corpus.hub.get_rpm_path(rpm_info)
+            self.assertEqual(os.path.getsize(path), rpm_info["size"])
+            lead, sighdr, header, payload = self._read(path)
+            self.assertEqual(lead[:4], b"\xed\xab\xee\xdb")
+            self.assertEqual(struct.unpack(">H", lead[6:8])[0], 1 if rpm_info["arch"] == "src" else 0)
+
+            entries = dict([(i[0], i[3]) for i in fake_koji_hub._get_header_entries(header)])
+            self.assertEqual(entries[RPMTAG_NAME], rpm_info["name"].encode("ascii") + b"\0")
+            self.assertEqual(entries[RPMTAG_ARCH], rpm_info["arch"].encode("ascii") + b"\0")
+            sig_entries = dict([(i[0], i[3]) for i in fake_koji_hub._get_header_entries(sighdr)])
+            self.assertEqual(sig_entries[SIGTAG_MD5], hashlib.md5(header + payload).digest())
+            self.assertEqual(self.corpus.hub.rpms[rpm_info["id"]]["size"], rpm_info["size"])
+
+    def test_signatures(self):
+        """Test if main copies are signed, signed copies differ only in sighdr and the hub knows their signatures."""
+        main_sigkeys = set()
+        for rpm_info in self.rpm_info_list:
+            main_path = self.corpus.hub.get_rpm_path(rpm_info)
+            main_sigkeys.add(fake_koji_hub.get_sighdr_sigkey(fake_koji_hub.rip_rpm_sighdr(main_path)))
+            signed_path = self.corpus.hub.get_rpm_path(rpm_info, "deadbeef")
+            if rpm_info["id"] not in self.corpus.hub.sigs:
+                self.assertFalse(os.path.exists(signed_path))
+                continue
+            sighdr = fake_koji_hub.rip_rpm_sighdr(signed_path)
+            self.assertEqual(fake_koji_hub.get_sighdr_sigkey(sighdr), "deadbeef")
+            self.assertEqual(self.corpus.hub.sigs[rpm_info["id"]], {"deadbeef": sighdr})
+            with open(self.corpus.hub.get_sighdr_path(rpm_info, "deadbeef"), "rb") as f:
+                self.assertEqual(f.read(), sighdr)
+            self.assertEqual(self._read(signed_path)[2:], self._read(main_path)[2:])
+        self.assertEqual(main_sigkeys, set(["", "cafebabe"]))
+        self.assertTrue(0 < len(self.corpus.hub.sigs) < len(self.rpm_info_list))
+
+    def test_sign_keeps_digests(self):
+        """Test if fake signing replaces only the signature."""
+        rpm_info = self.rpm_info_list[0]
+        path = self.corpus.hub.get_rpm_path(rpm_info)
+        before = dict([(i[0], i[3]) for i in fake_koji_hub._get_header_entries(fake_koji_hub.rip_rpm_sighdr(path))])
+        fake_koji_hub.sign_rpm(path, "01234567")
+        after = dict([(i[0], i[3]) for i in fake_koji_hub._get_header_entries(fake_koji_hub.rip_rpm_sighdr(path))])
+        self.assertEqual(fake_koji_hub.get_sighdr_sigkey(fake_koji_hub.rip_rpm_sighdr(path)), "01234567")
+        self.assertEqual(after[SIGTAG_MD5], before[SIGTAG_MD5])
+
+    def test_sparse(self):
+        """Test if sparse RPMs have the right size."""
+        corpus = RPMCorpus(self.topdir, seed=2, sparse=True)
+        rpm_info = corpus.generate(1, sizes=10 ** 6)[0]
+        self.assertEqual(rpm_info["arch"], "src")
+        self.assertEqual(os.path.getsize(corpus.hub.get_rpm_path(rpm_info)), rpm_info["size"])
+        self.assertTrue(rpm_info["size"] > 10 ** 6)
+
+    def test_size_distributions(self):
+        """Test if sizes are drawn from the distributions."""
+        rnd = random.Random(0)
+        self.assertEqual(get_size_distribution("fixed", 100)(rnd), 100)
+        sizes = [get_size_distribution("lognormal", 1000, max_size=10 ** 4)(rnd) for i in range(1000)]
+        self.assertTrue(500 < sorted(sizes)[500] < 2000)
+        self.assertEqual(max(sizes), 10 ** 4)
+        self.assertRaises(ValueError, get_size_distribution, "zipf")
+
+    def test_koji_sign(self):
+        """Test if KojiSignRPMs finds signed copies and signed main copies in the corpus."""
+        koji_module = Mock()
+        koji_module.config.authtype = None
+        koji_module.pathinfo = self.corpus.pathinfo
+        with patch.object(koji_sign.koji, "get_profile_module", create=True, return_value=koji_module), \
+                patch.object(koji_sign.koji, "ClientSession", create=True), \
+                patch.object(koji_sign.koji, "rip_rpm_sighdr", fake_koji_hub.rip_rpm_sighdr, create=True), \
+                patch.object(koji_sign, "_get_sighdr_sigkey", fake_koji_hub.get_sighdr_sigkey):
+            sign = KojiSignRPMs("test", fake_koji_hub.FakeRPMSign, logger=Mock(), scan_backend="threads")
+            signed, unsigned = sign.find_signed_rpms(self.rpm_info_list, ["DEADBEEF"])
+            self.assertEqual(set([i["id"] for i in signed]), set(self.corpus.hub.sigs))
+            signed, unsigned = sign.find_signed_rpms_in_main_copies(self.rpm_info_list, ["cafebabe"])
+            self.assertTrue(0 < len(signed) < len(self.rpm_info_list))
+
+
+if __name__ == "__main__":
+    unittest.main()
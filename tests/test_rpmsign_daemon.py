@@ -0,0 +1,236 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+"""
+Tests for rpmsign_daemon module.
+"""
+
+
+import unittest
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from mock import Mock, patch
+
+try:
+    import gnupg
+except ImportError:
+    gnupg = None
+
+
+DIR = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(DIR, ".."))
+
+from tests.common import mock_module  # noqa: E402
+mock_module("koji")
+
+from releng_sop.common import ConfigError, Error  # noqa: E402
+from releng_sop.rpmsign_daemon import RPMSignServer, RPMSignClient, DaemonRPMSign, _sign_batch  # noqa: E402
+
+
+class FakeRPMSign(object):
+    """Signing class that appends a marker to the files instead of signing them."""
+
+    def sign(self, sigkey, paths):
+        """Mark files as signed."""
+        for path in paths:
+            if not os.path.isfile(path):
+                raise IOError("No such file: %s" % path)
+            with open(path, "a") as f:
+                f.write("signed:%s" % sigkey)
+
+
+class BatchRPMSign(FakeRPMSign):
+    """Signing class that logs each call to calls.log next to the first file."""
+
+    def __init__(self, gnupghome=None):  # noqa: D102
+        self.gnupghome = gnupghome
+
+    def sign(self, sigkey, paths):
+        """Mark files as signed, log the number of files and gnupghome."""
+        FakeRPMSign.sign(self, sigkey, paths)
+        with open(os.path.join(os.path.dirname(paths[0]), "calls.log"), "a") as f:
+            f.write("%s %s\n" % (len(paths), self.gnupghome))
+
+
+class TestRPMSignDaemon(unittest.TestCase):
+    """
+    Tests of the signing daemon and its client.
+    """
+
+    def setUp(self):
+        """Start a daemon on a temporary socket."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_rpmsign_daemon_")
+        self.socket_path = os.path.join(self.temp_dir, "rpmsign.sock")
+        self.server = RPMSignServer(self.socket_path, FakeRPMSign, workers=2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        """Stop the daemon and remove temp files."""
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.temp_dir)
+
+    def _create_rpms(self, count):
+        paths = []
+        for i in range(count):
+            path = os.path.join(self.temp_dir, "foo-%s.rpm" % i)
+            with open(path, "w") as f:
+                f.write("rpm:")
+            paths.append(path)
+        return paths
+
+    def test_sign_paths(self):
+        """Test if all RPMs in a batch get signed."""
+        paths = self._create_rpms(20)
+        RPMSignClient(self.socket_path).sign_paths("DEADBEEF", paths)
+        for path in paths:
+            self.assertEqual(open(path).read(), "rpm:signed:deadbeef")
+
+    def test_sign_paths_error(self):
+        """Test if failures of individual RPMs are reported."""
+        paths = self._create_rpms(2) + [os.path.join(self.temp_dir, "missing.rpm")]
+        client = RPMSignClient(self.socket_path)
+        self.assertRaises(Error, client.sign_paths, "deadbeef", paths)
+
+    def test_responses_match_requests(self):
+        """Test if responses are returned in the order of requests."""
+        paths = self._create_rpms(5)
+        requests = [{"sigkey": "deadbeef", "path": path} for path in paths]
+        requests.insert(2, {"sigkey": "deadbeef"})
+        responses = RPMSignClient(self.socket_path).call(requests)
+        self.assertEqual([i["id"] for i in responses], list(range(6)))
+        self.assertEqual([i["status"] for i in responses], ["ok", "ok", "error", "ok", "ok", "ok"])
+
+    def test_batches(self):
+        """Test if RPMs of a connection are signed in batches split among workers."""
+        self.server.batch_size = 6
+        paths = self._create_rpms(10)
+        requests = [{"sigkey": "deadbeef", "path": path} for path in paths]
+        requests += [{"sigkey": "cafebabe", "path": path} for path in paths[:2]]
+        with patch.object(self.server, "pool") as pool:
+            pool.apply_async.side_effect = lambda func, args, callback: Mock(wait=lambda: callback(func(*args)))
+            with patch.dict("releng_sop.rpmsign_daemon._WORKER", {"signer": FakeRPMSign()}):
+                responses = RPMSignClient(self.socket_path).call(requests)
+        self.assertEqual([i["status"] for i in responses], ["ok"] * 12)
+        batches = [(i[0][1][0], len(i[0][1][1])) for i in pool.apply_async.call_args_list]
+        # a full batch first, the rest split for 2 workers at the end
+        self.assertEqual(batches, [("deadbeef", 6), ("cafebabe", 1), ("cafebabe", 1), ("deadbeef", 2), ("deadbeef", 2)])
+
+    def test_batch_failure(self):
+        """Test if a failed batch is signed again one by one to report failed RPMs."""
+        paths = self._create_rpms(3)
+        paths.insert(1, os.path.join(self.temp_dir, "missing.rpm"))
+        with patch.dict("releng_sop.rpmsign_daemon._WORKER", {"signer": FakeRPMSign()}):
+            responses = _sign_batch("deadbeef", [{"id": num, "path": path} for num, path in enumerate(paths)])
+        self.assertEqual([i["status"] for i in responses], ["ok", "error", "ok", "ok"])
+        self.assertTrue("missing.rpm" in responses[1]["error"])
+
+    def test_daemon_rpmsign_class(self):
+        """Test if DaemonRPMSign can be used as a rpmsign_class."""
+        paths = self._create_rpms(3)
+
+        class TestDaemonRPMSign(DaemonRPMSign):
+            socket_path = self.socket_path
+
+        TestDaemonRPMSign().sign("deadbeef", paths)
+        for path in paths:
+            self.assertEqual(open(path).read(), "rpm:signed:deadbeef")
+
+
+class TestRPMSignDaemonWorkers(unittest.TestCase):
+    """
+    Tests of signing classes in worker processes.
+    """
+
+    def setUp(self):
+        """Create a temp dir."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_rpmsign_daemon_")
+        self.socket_path = os.path.join(self.temp_dir, "rpmsign.sock")
+        self.server = None
+
+    def tearDown(self):
+        """Stop the daemon and remove temp files."""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+        shutil.rmtree(self.temp_dir)
+
+    def _start(self, **kwargs):
+        self.server = RPMSignServer(self.socket_path, BatchRPMSign, **kwargs)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def test_one_call_per_worker(self):
+        """Test if each worker signs its share of a chunk with one call and gets gnupghome."""
+        self._start(workers=2, gnupghome="/tmp/gnupg")
+        paths = []
+        for i in range(20):
+            paths.append(os.path.join(self.temp_dir, "foo-%s.rpm" % i))
+            with open(paths[-1], "w") as f:
+                f.write("rpm:")
+        RPMSignClient(self.socket_path).sign_paths("deadbeef", paths)
+        with open(os.path.join(self.temp_dir, "calls.log")) as f:
+            self.assertEqual(sorted(f.read().splitlines()), ["10 /tmp/gnupg", "10 /tmp/gnupg"])
+
+    def test_broken_signer(self):
+        """Test if a signing class failing to initialize fails the daemon at startup."""
+        broken = Mock(side_effect=ConfigError("librpmsign not available"))
+        self.assertRaises(ConfigError, RPMSignServer, self.socket_path, broken, workers=2)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+@unittest.skipUnless(gnupg, "python-gnupg is not installed")
+class TestRPMSignDaemonGPG(unittest.TestCase):
+    """
+    Tests of key resolution with a throwaway GPG key.
+    """
+
+    def setUp(self):
+        """Generate a GPG key and start a daemon on a temporary socket."""
+        self.temp_dir = tempfile.mkdtemp(prefix="test_rpmsign_daemon_")
+        self.gnupghome = os.path.join(self.temp_dir, "gnupg")
+        os.mkdir(self.gnupghome, 0o700)
+        self.gpg = gnupg.GPG(gnupghome=self.gnupghome)
+        key_input = self.gpg.gen_key_input(key_type="RSA", key_length=2048, name_real="Test Key", name_email="test@example.com", no_protection=True)
+        self.sigkey = self.gpg.gen_key(key_input).fingerprint[-8:].lower()
+
+        self.socket_path = os.path.join(self.temp_dir, "rpmsign.sock")
+        self.server = RPMSignServer(self.socket_path, BatchRPMSign, workers=2, gnupghome=self.gnupghome, sigkeys=[self.sigkey])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        """Stop the daemon and remove temp files."""
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_sign_paths(self):
+        """Test if workers sign with a resolved key and the daemon's gnupghome."""
+        path = os.path.join(self.temp_dir, "foo.rpm")
+        with open(path, "w") as f:
+            f.write("rpm:")
+        RPMSignClient(self.socket_path).sign_paths(self.sigkey, [path])
+        with open(os.path.join(self.temp_dir, "calls.log")) as f:
+            self.assertEqual(f.read(), "1 %s\n" % self.gnupghome)
+
+    def test_unknown_sigkey(self):
+        """Test if unknown sigkeys fail at startup."""
+        socket_path = os.path.join(self.temp_dir, "other.sock")
+        self.assertRaises(ConfigError, RPMSignServer, socket_path, BatchRPMSign, gnupghome=self.gnupghome, sigkeys=["0badc0de"])
+
+
+if __name__ == "__main__":
+    unittest.main()